@@ -13,6 +13,15 @@ class AcoAgent(Agent):
         
         self.node_visited = set()
         
+    @classmethod
+    def bare(cls, env_instance, uid, index):
+        agent = super().bare(env_instance, uid, index)
+        agent.path = None
+        agent.path_length = 0.0
+        agent.start_node_id = None
+        agent.node_visited = set()
+        return agent
+        
     def node_reached(self):
         self.path.pop(0)
         if len(self.path) == 0:
@@ -1,72 +1,260 @@
 from aco_algorithm.acoAgent import AcoAgent
-from environments.utils import path_intersection_in_time
+from environments.utils import path_intersection_in_time, vector_norms
+from environments.spatial import VerletList
+from environments.stepping import AdaptiveStepper
+from environments.checkpoint import environment_state, restore_environment
 import numpy as np
 from parser.config import Config
 
 class CrowdSimulator():
     def __init__(self, environment_input, config:Config):
+        self.setup(environment_input, config)
+        
+        profiler = self.env.profiler
+        with profiler.phase("graph_build"):
+            self.aco_env = self.graph_class()(self.env, self.config)
+        self.initialize_aco_parameters()
+        with profiler.phase("run_aco"):
+            self.aco_env.run_aco()
+        
+        self.set_agents_first_target()
+        
+    def setup(self, environment_input, config):
         self.config = config
         
         self.env = environment_input
         self.agents_escaped = []
         
+        self.neighbor_list = None
+        if getattr(config, "neighbor_search", "grid") == "verlet":
+            self.neighbor_list = VerletList(self.env.get_dimensions(), AcoAgent.interaction_range, getattr(config, "verlet_skin", 0.3))
+        
+        self.stepper = None
+        if getattr(config, "time_stepping", "fixed") == "adaptive":
+            self.stepper = AdaptiveStepper(config.dt, getattr(config, "max_time_step", 0.1), getattr(config, "cfl", 0.5))
+        
         self.aco_env = None
-        if config.graph_type == "grid":
+        
+    def graph_class(self):
+        if self.config.graph_type == "grid":
             from aco_algorithm.graphs.gridGraph import GridGraph
-            self.aco_env = GridGraph(self.env, self.config)
+            return GridGraph
             
-        elif config.graph_type == "PRM":
+        elif self.config.graph_type == "PRM":
             from aco_algorithm.graphs.PRMGraph import PRMGraph
-            self.aco_env = PRMGraph(self.env, self.config)
+            return PRMGraph
             
         else:
-            raise ValueError("Graph type " + str(config.graph_type) + " not recognized.")
+            raise ValueError("Graph type " + str(self.config.graph_type) + " not recognized.")
         
+    def initialize_aco_parameters(self):
         self.aco_env.initialize_aco_parameters(
             num_ants=self.config.num_ants,
             num_iterations=self.config.num_iterations,
             alpha=self.config.alpha,
             beta=self.config.beta,
-            evaporation_rate=self.config.evaporation_rate
+            evaporation_rate=self.config.evaporation_rate,
+            colonies=getattr(self.config, "colonies", 1),
+            migration_interval=getattr(self.config, "migration_interval", 10),
+            merge_policy=getattr(self.config, "merge_policy", "average")
         )
-        self.aco_env.run_aco()
+    
+    def save_checkpoint(self, path):
+        '''
+        Save the state of the simulation to `path` (compressed .npz): agents, simulation
+        time, random streams, graph with its pheromone and the nodes visited by the agents.
+        '''
+        agents = self.env.agents
+        visited = [sorted(agent.node_visited) for agent in agents]
+        np.savez_compressed(
+            path,
+            algorithm=np.array("aco"),
+            agents_escaped=np.array(self.agents_escaped, dtype=int),
+            node_visited_ptr=np.concatenate(([0], np.cumsum([len(v) for v in visited]))).astype(int),
+            node_visited_ids=np.array([node_id for v in visited for node_id in v], dtype=int),
+            target_id=np.array([-1 if getattr(agent, "target_id", None) is None else agent.target_id for agent in agents], dtype=int),
+            **environment_state(self.env),
+            **self.aco_env.get_state()
+        )
+    
+    @classmethod
+    def load_checkpoint(cls, path, environment_input, config:Config):
+        '''
+        Simulator restored from a checkpoint of save_checkpoint, in `environment_input`
+        (the same scenario, its agents are replaced): ACO is not run again.
+        '''
+        with np.load(path) as data:
+            state = dict(data)
+        if str(state["algorithm"]) != "aco":
+            raise ValueError("Checkpoint " + str(path) + " is not of an ACO simulation.")
         
-        self.set_agents_first_target()
+        sim = cls.__new__(cls)
+        sim.setup(environment_input, config)
+        sim.agents_escaped = state["agents_escaped"].tolist()
+        sim.aco_env = sim.graph_class().from_state(sim.env, state)
+        sim.initialize_aco_parameters()
+        
+        agents = restore_environment(sim.env, state, lambda uid, index: AcoAgent.bare(sim.env, uid, index))
+        ptr, ids = state["node_visited_ptr"], state["node_visited_ids"]
+        for i, agent in enumerate(agents):
+            agent.node_visited = set(ids[ptr[i]:ptr[i + 1]].tolist())
+            target_id = int(state["target_id"][i])
+            if target_id >= 0:
+                agent.target_id = target_id
+                agent.target = sim.aco_env.nodes[target_id].pos
+            else:
+                agent.target_id = None
+        return sim
     
     def update(self, dt):
   
         N = len(self.env.agents)
         
+        profiler = self.env.profiler
+        crowd = self.env.crowd
+        active = crowd.active_indices()
+        crowd.prev_pos[active] = crowd.pos[active]
+        
+        with profiler.phase("neighbor_search"):
+            if self.neighbor_list is not None:
+                pairs = self.neighbor_list.pairs(crowd.pos, active)
+            else:
+                self.env.update_spatial_hash()
+                pairs = self.env.agent_pairs_within(AcoAgent.interaction_range)
+        walls = self.env.get_wall_table()
+        with profiler.phase("agent_forces"):
+            AcoAgent.crowd_repulsive_forces(crowd, active, pairs, rng=self.env.random.noise)
+        with profiler.phase("wall_forces"):
+            AcoAgent.crowd_obstacle_forces(crowd, active, walls, rng=self.env.random.noise)
+        
         snapshot = list(self.env.agents)
-        for agent in self.env.agents:
-            
-            if agent.fail:
-                continue
+        moving = [agent for agent in snapshot if not agent.fail]
+        
+        contact = np.zeros(0, dtype=int)
+        if self.stepper is not None:
+            # dt is only the smallest step, used for the agents in contact
+            dt, contact, n_sub = self.stepper.plan(crowd, active, pairs, walls)
+        
+        in_contact = set(contact.tolist())
+        for agent in moving:
+            if agent.index not in in_contact:
+                agent.update(snapshot, self.env, dt, f_agents=agent.f_agents, f_walls=agent.f_walls)
+        
+        if len(in_contact) > 0:
+            contact_agents = [agent for agent in moving if agent.index in in_contact]
+            def move(sub_dt):
+                for agent in contact_agents:
+                    agent.update(snapshot, self.env, sub_dt, f_agents=agent.f_agents, f_walls=agent.f_walls)
+            with profiler.phase("contact_substeps"):
+                self.stepper.substep(AcoAgent, crowd, contact, pairs, walls, dt, n_sub, move, rng=self.env.random.noise)
+        
+        # Exit check for all the agents at once
+        idx = np.array([agent.index for agent in moving], dtype=int)
+        extra = 0.1 * crowd.vel[idx] / np.linalg.norm(crowd.vel[idx], axis=1, keepdims=True) # this extra is added because otherwise agents tend to stop on the exit due to the social-force model
+        with profiler.phase("exit_checks"):
+            exits_reached = self.env.check_many_reached(crowd.prev_pos[idx], crowd.pos[idx] + extra, "exit")
+        
+        for agent, exit_reached in zip(moving, exits_reached):
             
-            prev_pos = agent.pos.copy()
-            agent.update(snapshot, self.env, dt)
-                        
-            extra = 0.1 * agent.vel / np.linalg.norm(agent.vel) # this extra is added because otherwise agents tend to stop on the exit due to the social-force model
-            if self.env.check_something_reached(prev_pos, (agent.pos[0] + extra[0], agent.pos[1] + extra[1]), "exit") is not None:
+            if exit_reached >= 0:
                 self.agents_escaped.append(agent.id)
-                self.env.agents.remove(agent)
+                self.env.remove_agent(agent)
                 
             #if agent.target_id in self.aco_env.exit_nodes:
             elif agent.target_id in self.aco_env.exit_nodes:
                 continue
             
-            elif self.env.check_something_reached(agent.pos, agent.target, "wall") is not None:
-                self.change_target(agent)
+            else:
+                with profiler.phase("wall_checks"):
+                    blocked = self.env.check_something_reached(agent.pos, agent.target, "wall") is not None
+                
+                if blocked:
+                    with profiler.phase("aco_retargeting"):
+                        self.change_target(agent)
                     
-            # check if target place is reached
-            elif np.linalg.norm(agent.pos - agent.target) < 1.0:
-                agent.node_visited.add(agent.target_id)
-                self.compute_next_target(agent)
+                # check if target place is reached
+                elif np.linalg.norm(agent.pos - agent.target) < 1.0:
+                    agent.node_visited.add(agent.target_id)
+                    with profiler.phase("aco_retargeting"):
+                        self.compute_next_target(agent)
          
         self.env.simulation_time += dt
 
         return
 
+    @classmethod
+    def update_ensemble(cls, sims, ensemble, replicas, dt):
+        '''
+        One step of the simulators `sims` of the running `replicas` of an ensemble
+        (see environments.ensemble), equivalent to calling update(dt) on each of them:
+        the forces, the motion of the agents and the checks of exits and targets are
+        computed for all the replicas at once, and only the agents escaping or reaching
+        (or losing sight of) their target are handled one at a time.
+        '''
+        profiler = ensemble.profiler
+        crowd = ensemble.crowd.flat
+        env = ensemble.envs[0]  # the walls and exits are shared
+        
+        active, pairs, moving = [], [], []
+        with profiler.phase("neighbor_search"):
+            for sim in sims:
+                idx = sim.env.crowd.active_indices()
+                sim.env.crowd.prev_pos[idx] = sim.env.crowd.pos[idx]
+                if sim.neighbor_list is not None:
+                    pairs.append(sim.neighbor_list.pairs(sim.env.crowd.pos, idx))
+                else:
+                    sim.env.update_spatial_hash()
+                    pairs.append(sim.env.agent_pairs_within(AcoAgent.interaction_range))
+                active.append(idx)
+                moving.append([agent for agent in sim.env.agents if not agent.fail])
+        ensemble.social_forces(AcoAgent, replicas, active, pairs)
+        
+        agents = [agent for replica in moving for agent in replica]
+        idx = np.concatenate([ensemble.crowd.rows(k, [agent.index for agent in replica]) for k, replica in zip(replicas, moving)])
+        if len(agents) > 0:
+            with profiler.phase("driving_force"):
+                target = np.array([agent.target for agent in agents], dtype=float)
+                tau = np.array([agent.tau for agent in agents], dtype=float)
+                direction = target - crowd.pos[idx]
+                norm = vector_norms(direction)
+                far = norm >= 1e-8
+                direction[far] /= norm[far, None]
+                direction[~far] = 0.0
+                crowd.f_desired[idx] = (direction * crowd.max_speed[idx, None] - crowd.vel[idx]) / tau[:, None]
+            with profiler.phase("integration"):
+                crowd.integrate(idx, dt)
+        
+            extra = 0.1 * crowd.vel[idx] / np.linalg.norm(crowd.vel[idx], axis=1, keepdims=True)
+            with profiler.phase("exit_checks"):
+                exits_reached = env.check_many_reached(crowd.prev_pos[idx], crowd.pos[idx] + extra, "exit")
+            with profiler.phase("wall_checks"):
+                blocked = env.check_many_reached(crowd.pos[idx], target, "wall") >= 0
+            arrived = vector_norms(crowd.pos[idx] - target) < 1.0
+            events = np.flatnonzero((exits_reached >= 0) | blocked | arrived)
+        else:
+            events = []
+        
+        # the events of every replica in the order of its agents, as in update
+        ends = np.cumsum([len(replica) for replica in moving])
+        for e in events:
+            agent = agents[e]
+            sim = sims[int(np.searchsorted(ends, e, side="right"))]
+            if exits_reached[e] >= 0:
+                sim.agents_escaped.append(agent.id)
+                sim.env.remove_agent(agent)
+            elif agent.target_id in sim.aco_env.exit_nodes:
+                continue
+            elif blocked[e]:
+                with profiler.phase("aco_retargeting"):
+                    sim.change_target(agent)
+            else:
+                agent.node_visited.add(agent.target_id)
+                with profiler.phase("aco_retargeting"):
+                    sim.compute_next_target(agent)
+        
+        for sim in sims:
+            sim.env.simulation_time += dt
+
     def update_old(self, dt):
   
         N = len(self.env.agents)
@@ -92,7 +280,7 @@ class CrowdSimulator():
             agent.move(dt)
             if agent.safe:
                 self.agents_escaped.append(agent.id)
-                self.env.agents.remove(agent)
+                self.env.remove_agent(agent)
                 
         self.env.simulation_time += dt
 
@@ -127,9 +315,13 @@ class CrowdSimulator():
         max = -1
         idx = -1
         
-        for neighbor_id in self.aco_env.nodes[agent.target_id].edges.keys():
-            if neighbor_id not in agent.node_visited and self.aco_env.pheromone[(agent.target_id, neighbor_id)] > max:
-                max = self.aco_env.pheromone[(agent.target_id, neighbor_id)]
+        # the edges leaving the target node are contiguous in the pheromone array
+        graph = self.aco_env
+        v = graph.node_index[agent.target_id]
+        first, last = graph.indptr[v], graph.indptr[v + 1]
+        for neighbor_id, pheromone in zip(graph.edges[first:last, 1].tolist(), graph.pheromone[first:last].tolist()):
+            if neighbor_id not in agent.node_visited and pheromone > max:
+                max = pheromone
                 idx = neighbor_id
         # max = np.argmax(self.pheromones[agent.target_id])
         # if idx != agent.target_id:
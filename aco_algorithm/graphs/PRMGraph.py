@@ -29,10 +29,11 @@ class PRMGraph(BasicGraph):
         self.nodes = dict()
 
         # Add random nodes
+        rng = self.env.random.graph
         for id in range(self.n):
             free = False
             while not free:
-                pos = (np.random.uniform(self.border, self.env.get_width()-self.border), np.random.uniform(self.border, self.env.get_height()-self.border))
+                pos = (rng.uniform(self.border, self.env.get_width()-self.border), rng.uniform(self.border, self.env.get_height()-self.border))
                 free = self.env.check_is_position_free(pos) and (pos not in check_node_positions)
             self.nodes[id] = Node(id, pos)
             self.nodes_id_set.add(id)
@@ -61,27 +62,33 @@ class PRMGraph(BasicGraph):
         nodes_list = list(self.nodes.values())
         tree = KDTree(np.array([node.pos for node in nodes_list]))
 
+        # Candidate edges to the k nearest neighbors, checked against walls and exits all at once
+        positions = np.array([node.pos for node in nodes_list], dtype=float)
+        _, idxs = tree.query(positions, k=self.k+1)
+        candidates = [(i, j) for i in range(len(nodes_list)) for j in idxs[i][1:]]  # skip itself
+        starts = positions[[i for i, _ in candidates]]
+        ends = positions[[j for _, j in candidates]]
+        walls_crossed = self.env.check_many_reached(starts, ends, "wall")
+        exits_crossed = self.env.check_many_reached(starts, ends, "exit")
+
         # Connect nodes
-        for i, p1 in enumerate(nodes_list):
-            point_coords = p1.pos
-            dists, idxs = tree.query(point_coords, k=self.k+1)
-            for dist, j in zip(dists[1:], idxs[1:]):  # skip itself
-                p2 = nodes_list[j]
+        for (i, j), wall_idx, exit_idx in zip(candidates, walls_crossed, exits_crossed):
+            p1 = nodes_list[i]
+            p2 = nodes_list[j]
 
-                if self.env.check_something_reached((p1.pos[0], p1.pos[1]), (p2.pos[0], p2.pos[1]), "wall") is None:
-                    exit_idx = self.env.check_something_reached((p1.pos[0], p1.pos[1]), (p2.pos[0], p2.pos[1]), "exit")
-                    if exit_idx is not None:
-                        for e in exit_to_nodes[exit_idx]:
-                            p2 = nodes_list[len(nodes_list) - len(exits) + exit_idx]
-                            cost = np.linalg.norm([p1.pos[0] - p2.pos[0], p1.pos[1] - p2.pos[1]])
-                            p1.edges[p2.id] = cost
-                            p2.edges[p1.id] = cost
-                    else:
+            if wall_idx < 0:
+                if exit_idx >= 0:
+                    for e in exit_to_nodes[exit_idx]:
+                        p2 = nodes_list[len(nodes_list) - len(exits) + exit_idx]
                         cost = np.linalg.norm([p1.pos[0] - p2.pos[0], p1.pos[1] - p2.pos[1]])
-                        # if p2 not in p1.edges:
                         p1.edges[p2.id] = cost
-                        # if p1 not in p2.edges:
                         p2.edges[p1.id] = cost
+                else:
+                    cost = np.linalg.norm([p1.pos[0] - p2.pos[0], p1.pos[1] - p2.pos[1]])
+                    # if p2 not in p1.edges:
+                    p1.edges[p2.id] = cost
+                    # if p1 not in p2.edges:
+                    p2.edges[p1.id] = cost
     
     def nodes_of(self, path_indices):
         return [np.array(self.nodes[i].pos) for i in path_indices]
\ No newline at end of file
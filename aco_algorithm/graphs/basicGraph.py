@@ -1,6 +1,9 @@
 from environments.environment import Environment
 from aco_algorithm.graphs.node import Node
+from backends import get_backend, AntWalkBuffers
+from environments.utils import vector_norms
 import numpy as np
+import copy
 import time
 
 class BasicGraph():
@@ -37,87 +40,201 @@ class BasicGraph():
         self.evaporation_rate = None
         self.alpha = None  # Importance of pheromone
         self.beta = None    # Importance of heuristic information
-        self.pheromone = dict()  # key: (node1_id, node2_id), value: pheromone level
+        self.colonies = 1
+        self.migration_interval = 10
+        self.merge_policy = "average"
+        self.pheromone = None   # pheromone level of every edge, in the order of index_edges
+        self.eta = None         # heuristic information of every edge
         
         self.border = 0.5  # margin from the environment borders to place nodes
         
-    def initialize_aco_parameters(self, num_ants, num_iterations, evaporation_rate, alpha, beta):
+    def add_edges_not_crossing_walls(self, candidates):
+        '''
+        Add the edges (node1_id, node2_id) of `candidates`, in order, whose segment
+        does not cross any wall. The walls are checked for all the candidates at once.
+        '''
+        if len(candidates) == 0:
+            return
+        
+        starts = np.array([self.nodes[a].pos for a, _ in candidates], dtype=float)
+        ends = np.array([self.nodes[b].pos for _, b in candidates], dtype=float)
+        walls_crossed = self.env.check_many_reached(starts, ends, "wall")
+        
+        for (a, b), wall, start, end in zip(candidates, walls_crossed, starts, ends):
+            if wall < 0:
+                dist = np.linalg.norm(start - end)
+                self.nodes[a].edges[b] = dist
+                self.nodes[b].edges[a] = dist
+        
+    def initialize_aco_parameters(self, num_ants, num_iterations, evaporation_rate, alpha, beta, colonies=1, migration_interval=10, merge_policy="average"):
         self.num_ants = num_ants
         self.num_iterations = num_iterations
         self.evaporation_rate = evaporation_rate
         self.alpha = alpha  
         self.beta = beta    
+        # island model (see aco_algorithm/graphs/colonies.py), with more than one colony
+        self.colonies = colonies
+        self.migration_interval = migration_interval
+        self.merge_policy = merge_policy
+        
+    def index_edges(self):
+        '''
+        Number the nodes and the edges of the graph, for the arrays of the ACO
+        (pheromone, heuristic) and the ant walks of the compute backend: the nodes
+        are numbered 0..V-1 in the order of self.nodes (node_index maps their ids to
+        these numbers), the edges in compressed sparse row order: edges[indptr[v]:
+        indptr[v+1]] are the edges leaving node v, whose end nodes are indices[...].
+        Row e of `edges` holds the (node1_id, node2_id) of edge e, `costs` its length.
+        '''
+        self.node_ids = list(self.nodes.keys())
+        self.node_index = {node_id: v for v, node_id in enumerate(self.node_ids)}
+        
+        degree = [len(self.nodes[node_id].edges) for node_id in self.node_ids]
+        self.indptr = np.concatenate(([0], np.cumsum(degree))).astype(int)
+        neighbor_ids = [neighbor_id for node_id in self.node_ids for neighbor_id in self.nodes[node_id].edges.keys()]
+        self.indices = np.array([self.node_index[neighbor_id] for neighbor_id in neighbor_ids], dtype=int)
+        self.edges = np.column_stack((np.repeat(np.array(self.node_ids, dtype=int), degree), np.array(neighbor_ids, dtype=int))).reshape(-1, 2)
+        self.costs = np.array([cost for node_id in self.node_ids for cost in self.nodes[node_id].edges.values()], dtype=float)
+        self.is_exit = np.array([node_id in self.exit_nodes for node_id in self.node_ids], dtype=bool)
+        self.node_pos = np.array([np.asarray(self.nodes[node_id].pos, dtype=float) for node_id in self.node_ids]).reshape(-1, 2)
+        
+        # edge keys (first node * V + second node) in increasing order, for edge_indices
+        keys = np.repeat(np.arange(len(self.node_ids)), degree) * len(self.node_ids) + self.indices
+        self._edge_order = np.argsort(keys, kind="stable")
+        self._edge_keys = keys[self._edge_order]
+    
+    def edge_indices(self, first, second):
+        '''
+        Indices of the edges from the nodes `first` to the nodes `second` (numbers
+        of node_index, not ids), or -1 where there is no such edge
+        '''
+        keys = np.asarray(first, dtype=int) * len(self.node_ids) + np.asarray(second, dtype=int)
+        if len(self._edge_keys) == 0:
+            return np.full(keys.shape, -1, dtype=int)
+        found = np.minimum(np.searchsorted(self._edge_keys, keys), len(self._edge_keys) - 1)
+        return np.where(self._edge_keys[found] == keys, self._edge_order[found], -1)
         
     def run_aco(self):
         self.initialize_pheromones()
+        self.eta = (1 / self.costs) ** self.beta
         
-        for iteration in range(self.num_iterations):
-            ants_pos = self.initialize_ants_positions() # here we place the ants in a random position on the graph in a uniform way
-            all_paths = []
-            all_path_lengths = []
-            
-            #print(f"ACO iteration {iteration+1}/{self.num_iterations}...")
-                        
-            for agent in range(self.num_ants):
-                start_node_id = ants_pos[agent]
-                
-                path = [start_node_id]
-                visited_id = set(path)
-                
-                create_path = False
-                while True:
-                    current_node_id = path[-1]
-                    if current_node_id in self.exit_nodes: # reached an exit node
-                        # here we should check if the exit corresponds to the agent's target
-                        # otherwise we should penalize the visit of this node !! (we do not want the agent to go out from the wrong exit)
-                        # print(f"> Agent {agent.id} reached exit node {current_node_id} during simulation {iteration}.")
-                        create_path = True
-                        break
-                    
-                    neighbors = list(self.nodes[current_node_id].edges.items())
-                    probabilities = []
-                    for neighbor_id, cost in neighbors:
-                        if neighbor_id not in visited_id:
-                            tau = self.pheromone[(current_node_id, neighbor_id)] ** self.alpha
-                            eta = (1 / cost) ** self.beta
-                            probabilities.append(tau * eta)
-                        else:
-                            probabilities.append(0)
-                                                
-                    total = sum(probabilities)
-                    if total == 0: # no unvisited_id neighbors
-                        create_path = False
-                        break
-                    
-                    probabilities = [p / total for p in probabilities]
-                    next_node = np.random.choice([n for n, _ in neighbors], p=probabilities)
-                    
-                    path.append(next_node)
-                    visited_id.add(next_node)
-                
-                if create_path:
-                    path_length = sum(np.linalg.norm(np.array(self.nodes[path[i]].pos) - np.array(self.nodes[path[i+1]].pos)) for i in range(len(path)-1))
-                    all_paths.append(path)
-                    all_path_lengths.append(path_length)
-            
-            # Update pheromone
-            for k in self.pheromone:
-                self.pheromone[k] *= (1 - self.evaporation_rate)
-            for path, length in zip(all_paths, all_path_lengths):
-                if path[-1] in self.exit_nodes:
-                    for i in range(len(path) - 1):
-                        self.pheromone[(path[i], path[i+1])] += 1 / length
+        if self.colonies > 1:
+            from aco_algorithm.graphs.colonies import run_colonies
+            self.pheromone = run_colonies(self, self.env.random.aco, self.colonies, self.migration_interval, self.merge_policy)
+        else:
+            self.colony_iterations(self.pheromone[None, :], [self.env.random.aco], self.num_ants, self.num_iterations)
                         
         return self.pheromone
 
+    def colony_iterations(self, pheromones, rngs, num_ants, iterations):
+        '''
+        Run `iterations` iterations of colonies of `num_ants` ants each, updating
+        `pheromones` (one row per colony, one level per edge) in place and drawing
+        the random numbers of every colony from its generator of `rngs`. The ants
+        of all the colonies walk together, but every colony evolves as if it ran
+        alone. Only the arrays of index_edges are used, see colony_view.
+        
+        :return: length of the shortest path to an exit found by every colony (inf if none)
+        '''
+        backend = get_backend()
+        buffers = AntWalkBuffers()  # the memory of the walks, reused at every iteration
+        colonies = len(rngs)
+        colony = np.repeat(np.arange(colonies), num_ants)
+        best = np.full(colonies, np.inf)
+        
+        for iteration in range(iterations):
+            # here we place the ants in a random position on the graph in a uniform way
+            starts = np.stack([rng.integers(len(self.node_ids), size=num_ants) for rng in rngs])
+            
+            #print(f"ACO iteration {iteration+1}/{iterations}...")
+            
+            # the pheromone does not change during an iteration
+            weights = pheromones ** self.alpha * self.eta
+            
+            # all the ants walk together
+            walks, lengths, create_path = backend.ant_walks(self.indptr, self.indices, weights, self.is_exit, starts, rngs, buffers)
+            
+            # edges and lengths of the hops of all the walks
+            hops = np.arange(walks.shape[1] - 1)[None, :] < (lengths - 1)[:, None]
+            hop_edges = np.full(hops.shape, -1, dtype=int)
+            hop_edges[hops] = self.edge_indices(walks[:, :-1][hops], walks[:, 1:][hops])
+            hop_lengths = np.zeros(hops.shape)
+            hop_lengths[hops] = vector_norms(self.node_pos[walks[:, 1:][hops]] - self.node_pos[walks[:, :-1][hops]])
+            
+            # here we should check if the exit of a path corresponds to the agent's target
+            # otherwise we should penalize the visit of this node !! (we do not want the agent to go out from the wrong exit)
+            paths = np.flatnonzero(create_path & (lengths > 1))  # the ants started at an exit leave nothing
+            path_lengths = [sum(hop_lengths[a, :lengths[a] - 1].tolist()) for a in paths]
+            deposits = np.array([1 / length for length in path_lengths], dtype=float)
+            np.minimum.at(best, colony[paths], np.array(path_lengths, dtype=float))
+            
+            # Update pheromone: the deposits are added path after path, hop after hop
+            pheromones *= (1 - self.evaporation_rate)
+            on_path = hops[paths]
+            np.add.at(pheromones, (np.broadcast_to(colony[paths][:, None], on_path.shape)[on_path], hop_edges[paths][on_path]),
+                      np.broadcast_to(deposits[:, None], on_path.shape)[on_path])
+        
+        return best
+    
+    def colony_view(self):
+        '''
+        Copy of the graph with only what colony_iterations needs (no environment,
+        nodes nor pheromone), light to send to the processes running other colonies
+        '''
+        view = copy.copy(self)
+        view.env = None
+        view.nodes = dict()
+        view.nodes_id_set = set()
+        view.exit_nodes = set()
+        view.node_index = None
+        view.pheromone = None
+        return view
+
+    def get_state(self):
+        '''
+        Arrays describing the graph (nodes, edges in insertion order) and the
+        pheromone, e.g. to save a checkpoint: see from_state.
+        '''
+        node_ids = list(self.nodes.keys())
+        edges = [(a, b, cost) for a in node_ids for b, cost in self.nodes[a].edges.items()]
+        return {
+            "graph_shape": np.array([-1 if v is None else v for v in (self.n, self.m, self.k, self.N)], dtype=int),
+            "graph_node_ids": np.array(node_ids, dtype=int),
+            "graph_node_pos": np.array([np.asarray(self.nodes[v].pos, dtype=float) for v in node_ids]).reshape(-1, 2),
+            "graph_exit_nodes": np.array([v in self.exit_nodes for v in node_ids], dtype=bool),
+            "graph_id_set": np.array(list(self.nodes_id_set), dtype=int),
+            "graph_edges": np.array([(a, b) for a, b, _ in edges], dtype=int).reshape(-1, 2),
+            "graph_edge_costs": np.array([cost for _, _, cost in edges], dtype=float),
+            "pheromone_edges": self.edges,
+            "pheromone_levels": self.pheromone,
+        }
+    
+    @classmethod
+    def from_state(cls, env_instance, state):
+        '''
+        Graph rebuilt from get_state, without creating it again nor running ACO.
+        Exit nodes get array positions and the other nodes tuples, as when created.
+        '''
+        n, m, k, N = [None if v < 0 else int(v) for v in state["graph_shape"]]
+        graph = cls.__new__(cls)
+        BasicGraph.__init__(graph, env_instance, n, m, k)
+        graph.N = N
+        
+        for node_id, pos, is_exit in zip(state["graph_node_ids"], state["graph_node_pos"], state["graph_exit_nodes"]):
+            node_id = int(node_id)
+            graph.nodes[node_id] = Node(node_id, pos.copy() if is_exit else (float(pos[0]), float(pos[1])))
+            if is_exit:
+                graph.exit_nodes.add(node_id)
+        graph.nodes_id_set = set(int(v) for v in state["graph_id_set"])
+        for (a, b), cost in zip(state["graph_edges"], state["graph_edge_costs"]):
+            graph.nodes[int(a)].edges[int(b)] = float(cost)
+        
+        graph.initialize_pheromones(0.0)
+        first = [graph.node_index[int(a)] for a in state["pheromone_edges"][:, 0]]
+        second = [graph.node_index[int(b)] for b in state["pheromone_edges"][:, 1]]
+        graph.pheromone[graph.edge_indices(first, second)] = state["pheromone_levels"]
+        return graph
+        
     def initialize_pheromones(self, initial_pheromone = 1.0):
-        for i in self.nodes:
-            for j in self.nodes[i].edges.keys():
-                self.pheromone[(i, j)] = initial_pheromone
-        
-    def initialize_ants_positions(self):
-        ants_pos = []
-        for _ in range(self.num_ants):
-            ants_pos.append(np.random.choice(list(self.nodes.keys())))
-        return ants_pos
-                
\ No newline at end of file
+        self.index_edges()
+        self.pheromone = np.full(len(self.edges), initial_pheromone, dtype=float)
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import numpy as np
+from backends import get_backend, set_backend
+
+# Island model of ACO: several independent colonies explore the same graph, each one
+# with its own pheromone and random stream, and every `migration_interval` iterations
+# their pheromone is merged and given back to all of them. The colonies share the ants
+# of the single colony, so the work of an iteration is the same, split over processes:
+# the colonies given to a process walk their ants together (see BasicGraph.colony_iterations).
+
+MERGE_POLICIES = ("average", "best")
+
+def merge_pheromone(pheromones, best_lengths, policy):
+    '''
+    Pheromone given to all the colonies after an epoch.
+
+    :param pheromones: pheromone of every colony
+    :param best_lengths: shortest path to an exit found by every colony in the epoch
+    :param policy: "average" (mean level of every edge) or "best" (elitism: the
+                   pheromone of the colony that found the shortest path)
+    '''
+    if policy == "average":
+        return np.mean(pheromones, axis=0)
+    if policy == "best":
+        return pheromones[int(np.argmin(best_lengths))].copy()
+    raise ValueError("Merge policy " + str(policy) + " not recognized.")
+
+# Graph (see BasicGraph.colony_view) of the colonies run by a worker process
+_graph = None
+
+def _initialize_worker(graph, backend):
+    global _graph
+    _graph = graph
+    set_backend(backend)
+
+def _run_colonies(task):
+    pheromones, rngs, num_ants, iterations = task
+    best = _graph.colony_iterations(pheromones, rngs, num_ants, iterations)
+    # the generators go back with their new state, for the next epoch
+    return pheromones, rngs, best
+
+def run_colonies(graph, rng, colonies, migration_interval, merge_policy, workers=None):
+    '''
+    Run the ACO of `graph` (with its pheromone and heuristic initialized) as
+    `colonies` colonies, in parallel on `workers` processes (by default one per
+    colony, up to the number of CPUs). The random streams of the colonies are
+    spawned from `rng` and the merges wait for all the colonies, hence the result
+    depends only on the seed, not on the number of workers.
+
+    :return: the merged pheromone at the end of the last epoch
+    '''
+    if merge_policy not in MERGE_POLICIES:
+        raise ValueError("Merge policy " + str(merge_policy) + " not recognized.")
+    workers = min(colonies, workers or os.cpu_count() or 1)
+    num_ants = max(-(-graph.num_ants // colonies), 1)
+    interval = migration_interval if migration_interval > 0 else graph.num_iterations
+
+    rngs = rng.spawn(colonies)
+    pheromones = np.tile(graph.pheromone, (colonies, 1))
+    merged = graph.pheromone.copy()
+    # the colonies of every process, in contiguous groups
+    groups = np.array_split(np.arange(colonies), workers)
+
+    # the processes of a pool (e.g. of a parameter sweep) cannot start other processes
+    pool = None
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        pool = multiprocessing.Pool(workers, initializer=_initialize_worker, initargs=(graph.colony_view(), get_backend().name))
+    try:
+        done = 0
+        while done < graph.num_iterations:
+            iterations = min(interval, graph.num_iterations - done)
+            if pool is not None:
+                tasks = [(pheromones[group], [rngs[c] for c in group], num_ants, iterations) for group in groups]
+                results = pool.map(_run_colonies, tasks, chunksize=1)
+                pheromones = np.concatenate([result[0] for result in results])
+                rngs = [colony_rng for result in results for colony_rng in result[1]]
+                best_lengths = np.concatenate([result[2] for result in results])
+            else:
+                best_lengths = graph.colony_iterations(pheromones, rngs, num_ants, iterations)
+
+            merged = merge_pheromone(pheromones, best_lengths, merge_policy)
+            pheromones[:] = merged
+            done += iterations
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return merged
@@ -49,8 +49,10 @@ class GridGraph(BasicGraph):
                     self.nodes_id_set.add(id)
                     # Like this, not all ids are used, but this enumeration is better to create edges
 
-        # Create edges between nodes
+        # Create edges between nodes: candidate edges are collected first and
+        # checked against the walls all at once
         nodes_set = set(self.nodes.keys())
+        candidates = []
         for i in range(self.n):
             for j in range(self.m):
                 neighbors = [
@@ -72,11 +74,9 @@ class GridGraph(BasicGraph):
                     if neighbor_id < 0:
                         continue
                     if neighbor_id in nodes_set and neighbor_id != node_id:
-                        neighbor_node = self.nodes[neighbor_id]
-                        if self.env.check_something_reached((node.pos[0], node.pos[1]), (neighbor_node.pos[0], neighbor_node.pos[1]), "wall") is None:
-                            dist = np.linalg.norm(np.array(node.pos) - np.array(neighbor_node.pos))
-                            node.edges[neighbor_id] = dist 
-                            neighbor_node.edges[node_id] = dist
+                        candidates.append((node_id, neighbor_id))
+        
+        self.add_edges_not_crossing_walls(candidates)
 
         # Add exit nodes
         exits = self.env.get_safety_exits()
@@ -98,14 +98,15 @@ class GridGraph(BasicGraph):
             
                 # Add edges to the exit node only if distance is less than a threshold
                 threshold = 3.0 # meters
+                candidates = []
                 for node_id, node in self.nodes.items():
                     if node_id == new_node.id:
                         continue
                     dist = np.linalg.norm(np.array(node.pos) - new_exit_node_pos)
                     if dist <= threshold:
-                        if self.env.check_something_reached((node.pos[0], node.pos[1]), (new_node.pos[0], new_node.pos[1]), "wall") is None:
-                            node.edges[new_node.id] = dist
-                            new_node.edges[node.id] = dist               
+                        candidates.append((node_id, new_node.id))
+                
+                self.add_edges_not_crossing_walls(candidates)
     
     def nodes_of(self, path_indices):
         return [np.array(self.nodes[i].pos) for i in path_indices]
\ No newline at end of file
@@ -0,0 +1,38 @@
+from backends.reference import NumpyBackend, AntWalkBuffers
+
+# Compute backends of the simulators. The kernels are always called through
+# get_backend(), so that the implementation can be chosen once (e.g. from the
+# "backend" key of the configuration) for the whole program.
+
+try:
+    from backends.jit import NumbaBackend
+except ImportError:  # numba is an optional dependency
+    NumbaBackend = None
+
+BACKENDS = {"numpy": NumpyBackend}
+if NumbaBackend is not None:
+    BACKENDS["numba"] = NumbaBackend
+
+_active = NumpyBackend()
+
+def available_backends():
+    return list(BACKENDS.keys())
+
+def get_backend():
+    return _active
+
+def set_backend(name):
+    '''
+    Select the backend used from now on. If it is not available (e.g. numba is not
+    installed) the NumPy reference backend is used instead. Returns the backend in use.
+    '''
+    global _active
+    if name not in ("numpy", "numba"):
+        raise ValueError("Backend " + str(name) + " not recognized.")
+
+    if name not in BACKENDS:
+        print("Backend " + str(name) + " is not available, falling back to numpy.")
+        name = "numpy"
+    if _active.name != name:
+        _active = BACKENDS[name]()
+    return _active
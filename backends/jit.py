@@ -0,0 +1,326 @@
+import math
+import numpy as np
+from numba import njit
+from backends.reference import NumpyBackend
+from environments.forces import pair_repulsion
+
+# Kernels compiled with numba. They follow the NumPy reference step by step, but
+# the random directions of overlapping agents are left to the reference code
+# (with the same random generator): the kernels only return the pairs to fix.
+
+@njit(cache=True)
+def _pair_force(pxi, pyi, vxi, vyi, ri, pxj, pyj, vxj, vyj, rj, A, B, k, kappa):
+    dx = pxi - pxj
+    dy = pyi - pyj
+    dist = math.sqrt(dx * dx + dy * dy)
+    nx = dx / dist
+    ny = dy / dist
+    tx = -ny
+    ty = nx
+    r_ij = ri + rj
+
+    g = max(r_ij - dist, 0.0)
+    f_normal = A * math.exp((r_ij - dist) / B) + k * g
+    f_slide = kappa * g * ((vxj - vxi) * tx + (vyj - vyi) * ty)
+    return f_normal * nx + f_slide * tx, f_normal * ny + f_slide * ty
+
+
+@njit(cache=True)
+def _is_overlap(pxi, pyi, pxj, pyj):
+    dx = pxi - pxj
+    dy = pyi - pyj
+    return math.sqrt(dx * dx + dy * dy) < 1e-8
+
+
+@njit(cache=True)
+def _social_forces(pos, vel, radius, A, B, k, kappa, tile_size):
+    n = len(pos)
+    forces = np.zeros((n, 2))
+    overlap_i = []
+    overlap_j = []
+
+    # same tiles (and hence same order of the overlapping pairs) of the reference
+    for start_i in range(0, n, tile_size):
+        stop_i = min(start_i + tile_size, n)
+        for start_j in range(start_i, n, tile_size):
+            stop_j = min(start_j + tile_size, n)
+            for i in range(start_i, stop_i):
+                for j in range(max(start_j, i + 1), stop_j):
+                    if _is_overlap(pos[i, 0], pos[i, 1], pos[j, 0], pos[j, 1]):
+                        overlap_i.append(i)
+                        overlap_j.append(j)
+                        continue
+                    fx, fy = _pair_force(
+                        pos[i, 0], pos[i, 1], vel[i, 0], vel[i, 1], radius[i],
+                        pos[j, 0], pos[j, 1], vel[j, 0], vel[j, 1], radius[j],
+                        A, B, k, kappa
+                    )
+                    forces[i, 0] += fx
+                    forces[i, 1] += fy
+                    forces[j, 0] -= fx
+                    forces[j, 1] -= fy
+
+    return forces, np.array(overlap_i, dtype=np.int64), np.array(overlap_j, dtype=np.int64)
+
+
+@njit(cache=True)
+def _social_forces_from_pairs(pos, vel, radius, pair_i, pair_j, A, B, k, kappa):
+    forces = np.zeros((len(pos), 2))
+    overlap = np.zeros(len(pair_i), dtype=np.bool_)
+
+    for p in range(len(pair_i)):
+        i = pair_i[p]
+        j = pair_j[p]
+        if _is_overlap(pos[i, 0], pos[i, 1], pos[j, 0], pos[j, 1]):
+            overlap[p] = True
+            continue
+        fx, fy = _pair_force(
+            pos[i, 0], pos[i, 1], vel[i, 0], vel[i, 1], radius[i],
+            pos[j, 0], pos[j, 1], vel[j, 0], vel[j, 1], radius[j],
+            A, B, k, kappa
+        )
+        forces[i, 0] += fx
+        forces[i, 1] += fy
+        forces[j, 0] -= fx
+        forces[j, 1] -= fy
+
+    return forces, overlap
+
+
+@njit(cache=True)
+def _wall_forces(pos, vel, radius, start, direction, length_sq, A, B, k, kappa):
+    n = len(pos)
+    forces = np.zeros((n, 2))
+    overlap = np.zeros((n, len(start)), dtype=np.bool_)
+
+    for i in range(n):
+        for s in range(len(start)):
+            # closest point of the wall
+            t = 0.0
+            if length_sq[s] > 0:
+                t = ((pos[i, 0] - start[s, 0]) * direction[s, 0] + (pos[i, 1] - start[s, 1]) * direction[s, 1]) / length_sq[s]
+                t = min(max(t, 0.0), 1.0)
+            cx = start[s, 0] + t * direction[s, 0]
+            cy = start[s, 1] + t * direction[s, 1]
+
+            if _is_overlap(pos[i, 0], pos[i, 1], cx, cy):
+                overlap[i, s] = True
+                continue
+            fx, fy = _pair_force(
+                pos[i, 0], pos[i, 1], vel[i, 0], vel[i, 1], radius[i],
+                cx, cy, 0.0, 0.0, 0.0,
+                A, B, k, kappa
+            )
+            forces[i, 0] += fx
+            forces[i, 1] += fy
+
+    return forces, overlap
+
+
+@njit(cache=True)
+def _orient(px, py, qx, qy, rx, ry):
+    return (qx - px) * (ry - py) - (qy - py) * (rx - px)
+
+
+@njit(cache=True)
+def _first_intersection(A, B, C, D):
+    result = np.full(len(A), -1, dtype=np.int64)
+    for q in range(len(A)):
+        for s in range(len(C)):
+            o1 = _orient(A[q, 0], A[q, 1], B[q, 0], B[q, 1], C[s, 0], C[s, 1])
+            o2 = _orient(A[q, 0], A[q, 1], B[q, 0], B[q, 1], D[s, 0], D[s, 1])
+            if not o1 * o2 < 0:
+                continue
+            o3 = _orient(C[s, 0], C[s, 1], D[s, 0], D[s, 1], A[q, 0], A[q, 1])
+            o4 = _orient(C[s, 0], C[s, 1], D[s, 0], D[s, 1], B[q, 0], B[q, 1])
+            if o3 * o4 < 0:
+                result[q] = s
+                break
+    return result
+
+
+@njit(cache=True)
+def _bfs_distance_map(grid, source_i, source_j):
+    width, height = grid.shape
+    distance_map = np.full((width, height), np.inf)
+    visited = np.zeros((width, height), dtype=np.bool_)
+
+    # every cell enters the queue at most once
+    queue_i = np.empty(width * height + len(source_i), dtype=np.int64)
+    queue_j = np.empty(width * height + len(source_i), dtype=np.int64)
+    head = 0
+    tail = 0
+    for s in range(len(source_i)):
+        queue_i[tail] = source_i[s]
+        queue_j[tail] = source_j[s]
+        tail += 1
+        visited[source_i[s], source_j[s]] = True
+        distance_map[source_i[s], source_j[s]] = 0
+
+    di = (-1, 1, 0, 0)
+    dj = (0, 0, -1, 1)
+    while head < tail:
+        i = queue_i[head]
+        j = queue_j[head]
+        head += 1
+        for d in range(4):
+            ni = i + di[d]
+            nj = j + dj[d]
+            if 0 <= ni < width and 0 <= nj < height:
+                if not visited[ni, nj] and grid[ni, nj] == 0:
+                    visited[ni, nj] = True
+                    distance_map[ni, nj] = distance_map[i, j] + 1
+                    queue_i[tail] = ni
+                    queue_j[tail] = nj
+                    tail += 1
+
+    return distance_map
+
+
+@njit(cache=True)
+def _ant_walk(indptr, indices, weights, is_exit, start, uniforms):
+    visited = np.zeros(len(indptr) - 1, dtype=np.bool_)
+    path = np.empty(len(indptr) - 1, dtype=np.int64)
+    path[0] = start
+    length = 1
+    visited[start] = True
+
+    while not is_exit[path[length - 1]]:
+        first = indptr[path[length - 1]]
+        last = indptr[path[length - 1] + 1]
+
+        total = 0.0
+        for e in range(first, last):
+            if not visited[indices[e]]:
+                total += weights[e]
+        if total == 0:  # no unvisited neighbors
+            return path[:length], False
+
+        target = uniforms[length - 1] * total
+        cumulative = 0.0
+        choice = -1
+        for e in range(first, last):
+            if not visited[indices[e]] and weights[e] != 0:
+                cumulative += weights[e]
+                choice = e
+                if cumulative > target:
+                    break
+
+        path[length] = indices[choice]
+        visited[indices[choice]] = True
+        length += 1
+
+    return path[:length], True
+
+
+@njit(cache=True)
+def _walk_block(indptr, indices, weights, is_exit, paths, lengths, visited, finished, reached, walking, colony, uniforms):
+    for r in range(len(walking)):
+        a = walking[r]
+        c = colony[a]
+        for hop in range(uniforms.shape[1]):
+            current = paths[a, lengths[a] - 1]
+            first = indptr[current]
+            last = indptr[current + 1]
+
+            total = 0.0
+            for e in range(first, last):
+                if not visited[a, indices[e]]:
+                    total += weights[c, e]
+            if total == 0:  # no unvisited neighbors
+                finished[a] = True
+                break
+
+            target = uniforms[r, hop] * total
+            cumulative = 0.0
+            choice = -1
+            for e in range(first, last):
+                if not visited[a, indices[e]] and weights[c, e] != 0:
+                    cumulative += weights[c, e]
+                    choice = e
+                    if cumulative > target:
+                        break
+
+            following = indices[choice]
+            paths[a, lengths[a]] = following
+            lengths[a] += 1
+            visited[a, following] = True
+            if is_exit[following]:
+                reached[a] = True
+                finished[a] = True
+                break
+
+
+class NumbaBackend(NumpyBackend):
+    '''Kernels of NumpyBackend compiled with numba (optional dependency)'''
+
+    name = "numba"
+
+    def social_forces(self, pos, vel, radius, A, B, k, kappa, rng=None, tile_size=256):
+        pos = np.ascontiguousarray(pos, dtype=float)
+        vel = np.ascontiguousarray(vel, dtype=float)
+        radius = np.ascontiguousarray(radius, dtype=float)
+        forces, i, j = _social_forces(pos, vel, radius, A, B, k, kappa, tile_size)
+        if len(i) > 0:
+            self._add_overlapping(forces, pos, vel, radius, i, j, A, B, k, kappa, rng)
+        return forces
+
+    def social_forces_from_pairs(self, pos, vel, radius, i, j, A, B, k, kappa, rng=None):
+        pos = np.ascontiguousarray(pos, dtype=float)
+        vel = np.ascontiguousarray(vel, dtype=float)
+        radius = np.ascontiguousarray(radius, dtype=float)
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        forces, overlap = _social_forces_from_pairs(pos, vel, radius, i, j, A, B, k, kappa)
+        if np.any(overlap):
+            self._add_overlapping(forces, pos, vel, radius, i[overlap], j[overlap], A, B, k, kappa, rng)
+        return forces
+
+    @staticmethod
+    def _add_overlapping(forces, pos, vel, radius, i, j, A, B, k, kappa, rng):
+        f = pair_repulsion(pos[i], vel[i], radius[i], pos[j], vel[j], radius[j], A, B, k, kappa, rng=rng)
+        np.add.at(forces, i, f)
+        np.subtract.at(forces, j, f)
+
+    def wall_forces(self, pos, vel, radius, walls, A, B, k, kappa, rng=None):
+        pos = np.ascontiguousarray(pos, dtype=float)
+        vel = np.ascontiguousarray(vel, dtype=float)
+        radius = np.ascontiguousarray(radius, dtype=float)
+        if len(walls) == 0:
+            return np.zeros((len(pos), 2))
+
+        forces, overlap = _wall_forces(pos, vel, radius, walls.start, walls.direction, walls.length_sq, A, B, k, kappa)
+        if np.any(overlap):
+            i, s = np.nonzero(overlap)
+            closest = walls.start[s] + np.clip(
+                np.sum((pos[i] - walls.start[s]) * walls.direction[s], axis=1) / np.where(walls.length_sq[s] > 0, walls.length_sq[s], 1.0), 0, 1
+            )[:, None] * walls.direction[s]
+            f = pair_repulsion(pos[i], vel[i], radius[i], closest, np.zeros(2), 0.0, A, B, k, kappa, rng=rng)
+            np.add.at(forces, i, f)
+        return forces
+
+    def first_intersection(self, A, B, C, D):
+        A = np.ascontiguousarray(np.asarray(A, dtype=float).reshape(-1, 2))
+        B = np.ascontiguousarray(np.asarray(B, dtype=float).reshape(-1, 2))
+        C = np.ascontiguousarray(np.asarray(C, dtype=float).reshape(-1, 2))
+        D = np.ascontiguousarray(np.asarray(D, dtype=float).reshape(-1, 2))
+        return _first_intersection(A, B, C, D)
+
+    def bfs_distance_map(self, grid, sources):
+        sources = np.asarray(sources, dtype=np.int64).reshape(-1, 2)
+        return _bfs_distance_map(np.ascontiguousarray(grid), sources[:, 0].copy(), sources[:, 1].copy())
+
+    def ant_walk(self, indptr, indices, weights, is_exit, start, uniforms):
+        path, reached = _ant_walk(
+            np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64),
+            np.asarray(weights, dtype=float), np.asarray(is_exit, dtype=np.bool_),
+            int(start), np.asarray(uniforms, dtype=float)
+        )
+        return path, reached
+
+    def _walk_block(self, indptr, indices, weights, is_exit, paths, lengths, visited, finished, reached, walking, colony, uniforms):
+        _walk_block(
+            np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64),
+            np.ascontiguousarray(weights, dtype=float), np.asarray(is_exit, dtype=np.bool_),
+            paths, lengths, visited, finished, reached, walking, colony, uniforms
+        )
@@ -0,0 +1,239 @@
+import numpy as np
+from collections import deque
+from environments.forces import social_forces, social_forces_from_pairs, wall_forces
+from environments.utils import first_intersection
+
+class NumpyBackend:
+    '''
+    Reference implementation of the compute kernels of the simulators, written
+    with NumPy only. Other backends must return the same results (up to the
+    floating point rounding) and draw the same random numbers, in the same order.
+    '''
+
+    name = "numpy"
+
+    # Social-force model
+
+    def social_forces(self, pos, vel, radius, A, B, k, kappa, rng=None):
+        '''Repulsion among all the N agents, see environments.forces.social_forces'''
+        return social_forces(pos, vel, radius, A, B, k, kappa, rng=rng)
+
+    def social_forces_from_pairs(self, pos, vel, radius, i, j, A, B, k, kappa, rng=None):
+        '''Repulsion among the pairs (i, j), see environments.forces.social_forces_from_pairs'''
+        return social_forces_from_pairs(pos, vel, radius, i, j, A, B, k, kappa, rng=rng)
+
+    def wall_forces(self, pos, vel, radius, walls, A, B, k, kappa, rng=None):
+        '''Repulsion of the walls (a SegmentTable), see environments.forces.wall_forces'''
+        return wall_forces(pos, vel, radius, walls, A, B, k, kappa, rng=rng)
+
+    # Geometry
+
+    def first_intersection(self, A, B, C, D):
+        '''First segment C[s]-D[s] crossed by each A[q]-B[q], see environments.utils.first_intersection'''
+        return first_intersection(A, B, C, D)
+
+    # Grids and graphs
+
+    def bfs_distance_map(self, grid, sources):
+        '''
+        Number of 4-connected steps from the closest source to every free cell of
+        `grid` (0 = free, 1 = wall), inf for the cells that cannot be reached.
+
+        :param sources: cells (i, j) at distance 0, visited in the given order
+        '''
+        width, height = grid.shape
+        distance_map = np.full((width, height), np.inf)
+        visited = np.zeros((width, height), dtype=bool)
+        queue = deque()
+
+        for i, j in sources:
+            queue.append((i, j, 0))
+            visited[i, j] = True
+            distance_map[i, j] = 0
+
+        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+        while queue:
+            i, j, dist = queue.popleft()
+            for di, dj in directions:
+                ni, nj = i + di, j + dj
+                if 0 <= ni < width and 0 <= nj < height:
+                    if not visited[ni, nj] and grid[ni, nj] == 0:
+                        visited[ni, nj] = True
+                        distance_map[ni, nj] = dist + 1
+                        queue.append((ni, nj, dist + 1))
+
+        return distance_map
+
+    def ant_walk(self, indptr, indices, weights, is_exit, start, uniforms):
+        '''
+        Walk of one ant on a graph in CSR format (the neighbors of node v are
+        indices[indptr[v]:indptr[v+1]]), from `start` until an exit node or a dead
+        end. At every hop the next node is drawn among the unvisited neighbors with
+        probability proportional to the weight of the edge, using uniforms[hop].
+
+        :param uniforms: random numbers in [0, 1), at least one per node of the graph
+        :return: the visited nodes, and whether the walk reached an exit
+        '''
+        visited = np.zeros(len(indptr) - 1, dtype=bool)
+        path = [start]
+        visited[start] = True
+
+        hop = 0
+        while not is_exit[path[-1]]:
+            first, last = indptr[path[-1]], indptr[path[-1] + 1]
+            neighbors = indices[first:last]
+            w = np.where(visited[neighbors], 0.0, weights[first:last])
+            cumulative = np.cumsum(w)
+            if len(w) == 0 or cumulative[-1] == 0:  # no unvisited neighbors
+                return np.array(path), False
+
+            # first neighbor whose cumulative weight exceeds the drawn value, or the
+            # last one that can be visited if the rounding made it fall beyond the total
+            choice = int(np.searchsorted(cumulative, uniforms[hop] * cumulative[-1], side="right"))
+            if choice >= len(w):
+                choice = int(np.flatnonzero(w)[-1])
+
+            path.append(neighbors[choice])
+            visited[neighbors[choice]] = True
+            hop += 1
+
+        return np.array(path), True
+
+    def ant_walks(self, indptr, indices, weights, is_exit, starts, rng, buffers=None, block=64):
+        '''
+        Walks of many ants on the same graph, each one as ant_walk from its node of
+        `starts`, advanced all together hop by hop. The random numbers are drawn
+        from `rng` in blocks: before every `block` hops, one row of `block` numbers
+        for every ant still walking (in the order of the ants), so that the memory
+        does not grow with the size of the graph and all the backends draw the
+        same numbers.
+
+        Several colonies can walk together: with `weights` of shape (colonies, edges),
+        `starts` of shape (colonies, ants) and `rng` a list of one generator per
+        colony, the ants of every colony use its weights and draw from its own
+        generator, exactly as if each colony walked alone.
+
+        :param buffers: AntWalkBuffers reused from call to call (e.g. over the
+                        iterations of ACO), None to allocate new ones
+        :return: the visited nodes (one row per ant, padded with -1, a view on
+                 the buffers valid until the next call), the number of nodes of
+                 every walk and whether it reached an exit (colony after colony)
+        '''
+        starts = np.asarray(starts, dtype=int)
+        weights = np.asarray(weights, dtype=float)
+        if starts.ndim == 1:
+            starts, weights, rng = starts[None, :], weights[None, :], [rng]
+        per_colony = starts.shape[1]
+        starts = starts.reshape(-1)
+        ants, nodes = len(starts), len(indptr) - 1
+        colony = np.arange(ants) // max(per_colony, 1)
+        if buffers is None:
+            buffers = AntWalkBuffers()
+        visited = buffers.prepare(ants, nodes)
+
+        paths = buffers.reserve(block + 1)
+        paths[:, 0] = starts
+        lengths = np.ones(ants, dtype=int)
+        visited[np.arange(ants), starts] = True
+        reached = is_exit[starts].copy()
+        finished = reached.copy()
+
+        while True:
+            walking = np.flatnonzero(~finished)
+            if len(walking) == 0:
+                break
+            counts = np.bincount(colony[walking], minlength=len(rng))
+            uniforms = np.concatenate([colony_rng.random((count, block)) for colony_rng, count in zip(rng, counts) if count > 0])
+            paths = buffers.reserve(int(lengths.max()) + block)
+            self._walk_block(indptr, indices, weights, is_exit, paths, lengths, visited, finished, reached, walking, colony, uniforms)
+
+        buffers.release(lengths)
+        return paths[:, :int(lengths.max()) if ants > 0 else 0], lengths, reached
+
+    def _walk_block(self, indptr, indices, weights, is_exit, paths, lengths, visited, finished, reached, walking, colony, uniforms):
+        # up to uniforms.shape[1] hops of the ants `walking`, ant walking[r] using the row r of uniforms
+        # and the weights of its colony
+        nodes = len(indptr) - 1
+        degrees = np.diff(indptr)
+        rows = np.arange(len(walking))
+        length = lengths[walking]
+        current = paths[walking, length - 1]
+        group = colony[walking]
+        for hop in range(uniforms.shape[1]):
+            # edges leaving the current nodes, padded to the largest of their degrees
+            first = indptr[current]
+            degree = degrees[current]
+            slots = np.arange(max(int(degree.max()), 1))
+            valid = slots < degree[:, None]
+            edges = np.where(valid, first[:, None] + slots, 0)
+            candidates = np.where(valid, indices[edges], nodes)  # column `nodes` of visited: always visited
+
+            w = np.where(visited[walking[:, None], candidates], 0.0, weights[group[:, None], edges])
+            cumulative = np.cumsum(w, axis=1)
+            total = cumulative[:, -1]
+            dead = total == 0  # no unvisited neighbors
+            if dead.any():
+                finished[walking[dead]] = True
+                lengths[walking[dead]] = length[dead]
+                alive = ~dead
+                walking, rows, length, group, w, cumulative, total, candidates = (
+                    walking[alive], rows[alive], length[alive], group[alive], w[alive], cumulative[alive], total[alive], candidates[alive])
+                if len(walking) == 0:
+                    return
+
+            # first neighbor whose cumulative weight exceeds the drawn value, or the
+            # last one that can be visited if the rounding made it fall beyond the total
+            choice = (cumulative <= (uniforms[rows, hop] * total)[:, None]).sum(axis=1)
+            beyond = choice >= w.shape[1]
+            if beyond.any():
+                choice[beyond] = w.shape[1] - 1 - np.argmax(w[beyond, ::-1] > 0, axis=1)
+
+            current = candidates[np.arange(len(walking)), choice]
+            paths[walking, length] = current
+            length += 1
+            visited[walking, current] = True
+
+            arrived = is_exit[current]
+            if arrived.any():
+                reached[walking[arrived]] = True
+                finished[walking[arrived]] = True
+                lengths[walking[arrived]] = length[arrived]
+                on = ~arrived
+                walking, rows, length, group, current = walking[on], rows[on], length[on], group[on], current[on]
+                if len(walking) == 0:
+                    return
+        lengths[walking] = length
+
+
+class AntWalkBuffers:
+    '''
+    Memory of ant_walks kept from call to call: the visited flags of every ant
+    (cleared after every call, only where the ants went) and the paths, whose
+    columns grow with the longest walk.
+    '''
+
+    def __init__(self):
+        self.visited = np.zeros((0, 1), dtype=bool)
+        self.paths = np.full((0, 0), -1, dtype=int)
+        self.used = 0
+
+    def prepare(self, ants, nodes):
+        if self.visited.shape != (ants, nodes + 1):
+            self.visited = np.zeros((ants, nodes + 1), dtype=bool)
+            self.visited[:, nodes] = True  # column of the padding of the neighbors
+            self.paths = np.full((ants, 0), -1, dtype=int)
+        self.paths[:, :self.used] = -1
+        self.used = 0
+        return self.visited
+
+    def reserve(self, columns):
+        if self.paths.shape[1] < columns:
+            paths = np.full((len(self.paths), max(columns, 2 * self.paths.shape[1])), -1, dtype=int)
+            paths[:, :self.paths.shape[1]] = self.paths
+            self.paths = paths
+        self.used = max(self.used, columns)
+        return self.paths
+
+    def release(self, lengths):
+        columns = np.arange(self.paths.shape[1])[None, :] < lengths[:, None]
+        self.visited[np.nonzero(columns)[0], self.paths[columns]] = False
@@ -16,6 +16,21 @@ class BoidsAgent(Agent):
         self.acc = np.zeros(2)  # Agent does not init acc
 
         self.radius = getattr(config, 'agent_radius', 0.2)
+        self.configure(config)
+
+        self.f_desired = np.zeros(2)
+        self.f_agents = np.zeros(2)
+        self.f_walls = np.zeros(2)
+
+    @classmethod
+    def bare(cls, environment, uid, index, config=None):
+        agent = super().bare(environment, uid, index)
+        agent.acc = np.zeros(2)
+        agent.configure(config)
+        return agent
+
+    def configure(self, config):
+        '''Parameters of the agent taken from the config (not stored in the crowd arrays)'''
         self.base_speed = config.speed_limit
         self.base_force = config.force_limit
 
@@ -29,9 +44,8 @@ class BoidsAgent(Agent):
 
         self.cur_speed = self.base_speed
         self.cur_force = self.base_force
-        self.f_desired = np.zeros(2)
-        self.f_agents = np.zeros(2)
-        self.f_walls = np.zeros(2)
+        # speed cap of the crowd (see update: 1.5 times the base speed near the target)
+        self.max_speed = self.base_speed * 1.5
         angles = [i * (math.pi / 12) for i in range(1, 13)]
         self.rays = []
         for a in angles:
@@ -47,7 +61,11 @@ class BoidsAgent(Agent):
         self.f_desired.fill(0)
         self.f_agents.fill(0)
         self.f_walls.fill(0)
-        target = self.vision(self.get_smart_target())
+        profiler = self.env.profiler
+        with profiler.phase("target_selection"):
+            target = self.get_smart_target()
+        with profiler.phase("boids_vision"):
+            target = self.vision(target)
         dist_sq = np.sum((target - self.pos) ** 2)
         if dist_sq < 16.0:
             self.cur_speed = self.base_speed * 1.5
@@ -55,25 +73,30 @@ class BoidsAgent(Agent):
         else:
             self.cur_speed = self.base_speed
             self.cur_force = self.base_force
-        self.f_desired = self.seek(target) * self.weights['seek']
-        self.f_walls = self.avoid_walls() * self.weights['avoid']
+        with profiler.phase("driving_force"):
+            self.f_desired = self.seek(target) * self.weights['seek']
+        with profiler.phase("wall_forces"):
+            self.f_walls = self.avoid_walls() * self.weights['avoid']
         if agents_snapshot:
-            sep, ali, coh = self._flock(agents_snapshot)
-            self.f_agents = (
-                    sep * self.weights['separate'] +
-                    ali * self.weights['align'] +
-                    coh * self.weights['cohere']
-            )
-        self.acc += self.f_desired
-        self.acc += self.f_walls
-        self.acc += self.f_agents
-        self.vel += self.acc
-        speed = np.linalg.norm(self.vel)
-        if speed > self.cur_speed:
-            self.vel = (self.vel / speed) * self.cur_speed
-
-        self.pos += self.vel * dt
-        self._check_and_resolve_collision()
+            with profiler.phase("agent_forces"):
+                sep, ali, coh = self._flock(agents_snapshot)
+                self.f_agents = (
+                        sep * self.weights['separate'] +
+                        ali * self.weights['align'] +
+                        coh * self.weights['cohere']
+                )
+        with profiler.phase("integration"):
+            self.acc += self.f_desired
+            self.acc += self.f_walls
+            self.acc += self.f_agents
+            self.vel += self.acc
+            speed = np.linalg.norm(self.vel)
+            if speed > self.cur_speed:
+                self.vel = (self.vel / speed) * self.cur_speed
+
+            self.pos += self.vel * dt
+        with profiler.phase("wall_checks"):
+            self._check_and_resolve_collision()
 
     def vision(self, target):
         to_target = target - self.pos
@@ -98,27 +121,28 @@ class BoidsAgent(Agent):
         sep = np.zeros(2)
         ali = np.zeros(2)
         coh = np.zeros(2)
-        count = 0
 
-        for other in agents_snapshot:
-            if getattr(other, 'id', id(other)) == self.id:
-                continue
+        # Only the agents seen by the spatial hash of the environment, built at the
+        # beginning of the step on the same agents of the snapshot, can be in sight
+        crowd = self.env.crowd
+        idx = self.env.agents_within(self.pos, self.vision_radius)
+        idx = idx[idx != self.index]
 
-            other_pos = other.get_position()
-            if hasattr(other, 'get_velocity'):
-                other_vel = other.get_velocity()
-            else:
-                other_vel = other.vel
+        other_pos = crowd.pos[idx]
+        other_vel = crowd.vel[idx]
 
-            diff = self.pos - other_pos
-            dist = np.linalg.norm(diff)
+        diff = self.pos - other_pos
+        dist = np.sqrt(np.sum(diff ** 2, axis=1))
 
-            if 0 < dist < self.vision_radius:
-                if dist < self.min_separation:
-                    sep += diff / dist
-                ali += other_vel
-                coh += other_pos
-                count += 1
+        in_sight = (dist > 0) & (dist < self.vision_radius)
+        too_close = in_sight & (dist < self.min_separation)
+        count = int(np.count_nonzero(in_sight))
+
+        if np.any(too_close):
+            sep = np.sum(diff[too_close] / dist[too_close, None], axis=0)
+        if count > 0:
+            ali = np.sum(other_vel[in_sight], axis=0)
+            coh = np.sum(other_pos[in_sight], axis=0)
 
         if np.linalg.norm(sep) > 0:
             sep = self._limit_vector(
@@ -140,21 +164,18 @@ class BoidsAgent(Agent):
 
     def avoid_walls(self):
         steer = np.zeros(2)
-        count = 0
         avoid_radius = self.wall_avoid_dist
-        avoid_radius_sq = avoid_radius ** 2
-        for p1, p2 in self.env.get_walls():
-            p1, p2 = np.array(p1), np.array(p2)
-            closest = self.closest_point_on_segment(self.pos, p1, p2)
-            diff = self.pos - closest
-            dist_sq = np.dot(diff, diff)
-            if 0 < dist_sq < avoid_radius_sq:
-                dist = math.sqrt(dist_sq)
-                weight = (avoid_radius - dist) / dist
-                steer += (diff / dist) * weight
-                count += 1
+
+        closest, dist = self.env.get_wall_table().closest_points(self.pos)
+        closest, dist = closest[0], dist[0]
+        near = (dist > 0) & (dist < avoid_radius)
+        count = int(np.count_nonzero(near))
 
         if count > 0:
+            diff = self.pos - closest[near]
+            dist = dist[near]
+            weight = (avoid_radius - dist) / dist
+            steer = np.sum((diff / dist[:, None]) * weight[:, None], axis=0)
             steer /= count
             steer = self._limit_vector(
                 self._set_mag(steer, self.cur_speed) - self.vel,
@@ -1,5 +1,6 @@
 import numpy as np
 from boids_algorithm.boidsAgent import BoidsAgent
+from environments.checkpoint import environment_state, restore_environment
 
 class CrowdSimulator:
     def __init__(self, world, config):
@@ -8,6 +9,12 @@ class CrowdSimulator:
 
         self.agents_escaped = []
 
+        # the agents may come from a fork of another simulation (e.g. of a parameter
+        # sweep): they take the parameters of this one
+        for agent in self.world.agents:
+            if isinstance(agent, BoidsAgent):
+                agent.configure(config)
+
         # # Initialize agents if they haven't been added yet
         # if len(self.world.agents) == 0:
         #     spawn_positions = []
@@ -20,24 +27,65 @@ class CrowdSimulator:
         #         agent = BoidsAgent(self.world, self.config, start_pos=start_pos)
         #         self.world.add_agent(agent)
 
+    def save_checkpoint(self, path):
+        '''
+        Save the state of the simulation to `path` (compressed .npz): agents (with their
+        previous positions), simulation time, random streams and steering state.
+        '''
+        agents = self.world.agents
+        np.savez_compressed(
+            path,
+            algorithm=np.array("boids"),
+            agents_escaped=np.array([agent.id for agent in self.agents_escaped], dtype=int),
+            agents_escaped_index=np.array([agent.index for agent in self.agents_escaped], dtype=int),
+            acc=np.array([agent.acc for agent in agents], dtype=float).reshape(-1, 2),
+            cur_speed=np.array([agent.cur_speed for agent in agents], dtype=float),
+            cur_force=np.array([agent.cur_force for agent in agents], dtype=float),
+            **environment_state(self.world)
+        )
+
+    @classmethod
+    def load_checkpoint(cls, path, world, config):
+        '''
+        Simulator restored from a checkpoint of save_checkpoint, in `world` (the same
+        scenario, its agents are replaced). The escaped agents are restored as bare
+        agents on their crowd rows.
+        '''
+        with np.load(path) as data:
+            state = dict(data)
+        if str(state["algorithm"]) != "boids":
+            raise ValueError("Checkpoint " + str(path) + " is not of a boids simulation.")
+
+        sim = cls(world, config)
+        agents = restore_environment(world, state, lambda uid, index: BoidsAgent.bare(world, uid, index, config))
+        for i, agent in enumerate(agents):
+            agent.acc = state["acc"][i].copy()
+            agent.cur_speed = float(state["cur_speed"][i])
+            agent.cur_force = float(state["cur_force"][i])
+        sim.agents_escaped = [BoidsAgent.bare(world, int(uid), int(index), config) for uid, index in zip(state["agents_escaped"], state["agents_escaped_index"])]
+        return sim
+
     def update(self, dt):
         """
         Updates the simulation one step.
         Iterates over a copy of the list to safely remove agents.
         """
+        profiler = self.world.profiler
         agents_snapshot = list(self.world.agents)
+        with profiler.phase("neighbor_search"):
+            self.world.update_spatial_hash()
 
         for agent in agents_snapshot:
             agent.update(dt, agents_snapshot)
 
-            # 1. EXIT CHECK: Intersection
-            reached_object = self.world.check_something_reached(
-                agent.prev_pos,
-                agent.pos,
-                "exit"
-            )
+        # 1. EXIT CHECK: Intersection, for all the agents at once
+        crowd = self.world.crowd
+        idx = np.array([agent.index for agent in agents_snapshot], dtype=int)
+        with profiler.phase("exit_checks"):
+            reached_objects = self.world.check_many_reached(crowd.prev_pos[idx], crowd.pos[idx], "exit")
 
-            if reached_object is not None:
+        for agent, reached_object in zip(agents_snapshot, reached_objects):
+            if reached_object >= 0:
                 self.remove_agent(agent)
 
         self.world.simulation_time += dt
@@ -45,5 +93,5 @@ class CrowdSimulator:
     def remove_agent(self, agent):
         if agent in self.world.agents:
             agent.safe = True
-            self.world.agents.remove(agent)
+            self.world.remove_agent(agent)
             self.agents_escaped.append(agent)
\ No newline at end of file
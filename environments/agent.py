@@ -1,27 +1,62 @@
 import numpy as np
+import copy
+from environments.forces import pair_repulsion
+from environments.geometry import SegmentTable
+from backends import get_backend
+
+def _crowd_field(name, cast=None):
+    # Property exposing the row of the agent inside the CrowdState array `name`
+    def getter(self):
+        value = getattr(self.env.crowd, name)[self.index]
+        return cast(value) if cast is not None else value
+
+    def setter(self, value):
+        getattr(self.env.crowd, name)[self.index] = value
+
+    return property(getter, setter)
 
 class Agent:
+    # The state of the agent lives in the structure-of-arrays of the environment
+    # (see environments.crowd.CrowdState), the agent object is only a view on it
+    pos = _crowd_field("pos")
+    prev_pos = _crowd_field("prev_pos")
+    vel = _crowd_field("vel")
+    f_desired = _crowd_field("f_desired")
+    f_walls = _crowd_field("f_walls")
+    f_agents = _crowd_field("f_agents")
+    radius = _crowd_field("radius", float)
+    mass = _crowd_field("mass", float)
+    max_speed = _crowd_field("max_speed", float)
+    safe = _crowd_field("safe", bool)
+    fail = _crowd_field("fail", bool)
+
+    # SFM parameters, shared by the whole crowd
+    A = 2.0
+    B = 0.08
+    k = 1.2e5
+    kappa = 2.4e5
+    # Beyond this distance (m) the repulsion between two agents is below 1e-6 N
+    # and it is neglected when the forces are computed from a neighbor search
+    interaction_range = 2.0
+
     def __init__(self, env_instance, uid):
         self.id = uid
         self.env = env_instance
+        self.index = self.env.crowd.allocate()
         
-        self.radius = np.random.uniform(0.2, 0.4)
+        rng = self.env.random.spawn
+        self.radius = rng.uniform(0.2, 0.4)
         
         self.pos = np.array(self.env.get_random_spawn(agent=self), dtype=float)
         self.global_target = np.array(self.env.get_random_exit(), dtype=float)
         self.target = None
 
-        self.max_speed = np.random.uniform(3.0, 5.0)
-        init_v = (np.random.rand(2) - 0.5) * 2 # random initial velocity in range [-1,1)
+        self.max_speed = rng.uniform(3.0, 5.0)
+        init_v = (rng.random(2) - 0.5) * 2 # random initial velocity in range [-1,1)
         self.vel = self.max_speed * init_v / np.linalg.norm(init_v)
-        self.mass = np.random.uniform(45.0, 75.0)
+        self.mass = rng.uniform(45.0, 75.0)
         self.tau = 0.5  
         
-        # SFM parameters
-        self.A = 2.0
-        self.B = 0.08
-        self.k = 1.2e5
-        self.kappa = 2.4e5
         self.tau = 0.5
         
         self.f_desired = np.zeros(2)
@@ -29,43 +64,80 @@ class Agent:
         self.f_agents = np.zeros(2)
         
         self.color = (
-            np.random.randint(50, 255),
-            np.random.randint(50, 255),
-            np.random.randint(50, 255)
+            int(rng.integers(50, 255)),
+            int(rng.integers(50, 255)),
+            int(rng.integers(50, 255))
         )
         
         self.safe = False
         self.fail = False
         
+    @classmethod
+    def bare(cls, env_instance, uid, index):
+        '''
+        Agent object for the existing row `index` of the crowd of `env_instance`,
+        without spawning it nor drawing any random number, e.g. to restore a
+        checkpoint: the other attributes are set by the caller.
+        '''
+        agent = cls.__new__(cls)
+        agent.id = uid
+        agent.env = env_instance
+        agent.index = index
+        agent.global_target = None
+        agent.target = None
+        agent.tau = 0.5
+        agent.color = (255, 255, 255)
+        return agent
+    
+    def fork(self, env):
+        '''
+        Copy of the agent bound to `env`, a fork of its environment holding a copy
+        of the crowd arrays. Containers owned by the agent (e.g. visited nodes or
+        best positions) are copied, anything else is shared.
+        '''
+        new = copy.copy(self)
+        new.env = env
+        for name, value in vars(self).items():
+            if isinstance(value, (np.ndarray, list, set, dict)):
+                setattr(new, name, value.copy())
+        return new
+    
     def get_position(self):
         return self.pos
     
-    def update(self, agent_snapshot, env, dt):
+    def update(self, agent_snapshot, env, dt, f_agents=None, f_walls=None):
+        '''
+        Move the agent of one time step. If `f_agents` or `f_walls` are given (e.g.
+        computed for the whole crowd with `Agent.crowd_repulsive_forces` and
+        `Agent.crowd_obstacle_forces`) they are used instead of computing the
+        repulsion from `agent_snapshot` and from the walls of `env`.
+        '''
        
         if self.target is None:
             raise ValueError("Agent " + str(self.id) + " has no target assigned. If no specific target is needed, set target to global target.")
 
-        f_desired = self.driving_force()
+        profiler = self.env.profiler
+        with profiler.phase("driving_force"):
+            f_desired = self.driving_force()
 
-        f_agents = self.repulsive_force(
-            agent_snapshot
-        )
+        if f_agents is None:
+            with profiler.phase("agent_forces"):
+                f_agents = self.repulsive_force(
+                    agent_snapshot
+                )
 
-        f_walls = self.obstacle_force(
-            env.get_walls()
-        )
+        if f_walls is None:
+            with profiler.phase("wall_forces"):
+                f_walls = self.obstacle_force(
+                    env.get_wall_table()
+                )
 
         self.f_desired = f_desired
         self.f_walls = f_walls
         self.f_agents = f_agents
 
-        self.vel += dt * (f_desired + (f_agents + f_walls) / self.mass)
-
-        speed = np.linalg.norm(self.vel)
-        if speed > self.max_speed:
-            self.vel = (self.vel / speed) * self.max_speed
-
-        self.pos = self.pos + self.vel * dt
+        with profiler.phase("integration"):
+            self.env.crowd.integrate(self.index, dt)
 
 
     # Function described in https://pedestriandynamics.org/models/social_force_model/
@@ -89,42 +161,63 @@ class Agent:
 
 
     def repulsive_force(self, agents):
-        total = np.zeros(2)
-        for other in agents:
-            if other is self:
-                continue
-            r_j = other.radius if hasattr(other, "radius") else self.radius
-            total += self._repulsion_from_point(
-                p_j=other.pos,
-                v_j=other.vel,
-                r_j=r_j
+        others = [other for other in agents if other is not self]
+        if len(others) == 0:
+            return np.zeros(2)
+
+        crowd = self.env.crowd
+        idx = np.array([other.index for other in others])
+        f = pair_repulsion(
+            self.pos, self.vel, self.radius,
+            crowd.pos[idx], crowd.vel[idx], crowd.radius[idx],
+            self.A, self.B, self.k, self.kappa, rng=self.env.random.noise
+        )
+        return f.sum(axis=0)
+
+    @classmethod
+    def crowd_repulsive_forces(cls, crowd, idx, pairs=None, rng=None):
+        '''
+        Repulsive forces among all the agents in `idx`, computed in one pass and
+        stored in `crowd.f_agents`. Without `pairs` every couple of agents interacts,
+        which is equivalent to calling `repulsive_force` on every agent with the same
+        snapshot; otherwise only the given pairs (i, j) of crowd indices are used.
+        `rng` draws the directions of the overlapping agents (np.random by default).
+        '''
+        if pairs is None:
+            crowd.f_agents[idx] = get_backend().social_forces(
+                crowd.pos[idx], crowd.vel[idx], crowd.radius[idx],
+                cls.A, cls.B, cls.k, cls.kappa, rng
+            )
+        else:
+            forces = get_backend().social_forces_from_pairs(
+                crowd.pos, crowd.vel, crowd.radius, pairs[0], pairs[1],
+                cls.A, cls.B, cls.k, cls.kappa, rng
             )
-        return total
+            crowd.f_agents[idx] = forces[idx]
+        return crowd.f_agents[idx]
 
 
     def obstacle_force(self, walls):
-        total = np.zeros(2)
-
-        for (wA, wB) in walls:
-            wA = np.array(wA, float)
-            wB = np.array(wB, float)
-            seg = wB - wA
-            seg_len_sq = np.dot(seg, seg)
-
-            if seg_len_sq == 0:
-                closest = wA
-            else:
-                t = np.dot(self.pos - wA, seg) / seg_len_sq
-                t = np.clip(t, 0, 1)
-                closest = wA + t * seg
-
-            total += self._repulsion_from_point(
-                p_j = closest,
-                v_j = np.zeros(2),
-                r_j = 0.0
-            )
-
-        return total
+        '''Repulsion of the walls, given as a SegmentTable or as a list of segments'''
+        if not isinstance(walls, SegmentTable):
+            walls = SegmentTable(walls)
+
+        return get_backend().wall_forces(
+            self.pos[None], self.vel[None], np.array([self.radius]), walls,
+            self.A, self.B, self.k, self.kappa, self.env.random.noise
+        )[0]
+
+    @classmethod
+    def crowd_obstacle_forces(cls, crowd, idx, walls, rng=None):
+        '''
+        Repulsion of the walls (a SegmentTable) on all the agents in `idx`,
+        computed in one pass and stored in `crowd.f_walls`
+        '''
+        crowd.f_walls[idx] = get_backend().wall_forces(
+            crowd.pos[idx], crowd.vel[idx], crowd.radius[idx], walls,
+            cls.A, cls.B, cls.k, cls.kappa, rng
+        )
+        return crowd.f_walls[idx]
 
 
     def _repulsion_from_point(self, p_j, v_j, r_j, r_i=None):
@@ -133,7 +226,7 @@ class Agent:
 
         # Collision handling
         if dist < 1e-8:
-            n_ij = np.random.uniform(-1, 1, 2)
+            n_ij = self.env.random.noise.uniform(-1, 1, 2)
             n_ij /= np.linalg.norm(n_ij)
             dist = 1e-8
         else:
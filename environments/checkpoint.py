@@ -0,0 +1,59 @@
+import json
+import numpy as np
+from environments.crowd import CrowdState
+
+# Checkpoints of the simulations: the state common to all the algorithms (crowd
+# arrays, agents, simulation time and random streams) is stored as flat arrays,
+# which the simulators save with numpy.savez_compressed together with their own
+# state (see save_checkpoint / load_checkpoint of the crowd simulators).
+
+def environment_state(env):
+    '''Arrays of the state of the agents of `env`, see restore_environment'''
+    crowd = env.crowd
+    state = {"crowd_" + name: getattr(crowd, name)[:crowd.size].copy() for name in CrowdState.VECTOR_FIELDS + CrowdState.SCALAR_FIELDS + CrowdState.FLAG_FIELDS}
+    state["crowd_size"] = np.array(crowd.size)
+    state["simulation_time"] = np.array(env.simulation_time)
+    state["initial_agent_count"] = np.array(env.initial_agent_count)
+    state["random_state"] = np.array(json.dumps(env.random.state()))
+
+    agents = env.agents
+    state["agent_id"] = np.array([agent.id for agent in agents], dtype=int)
+    state["agent_index"] = np.array([agent.index for agent in agents], dtype=int)
+    state["agent_tau"] = np.array([agent.tau for agent in agents], dtype=float)
+    state["agent_color"] = np.array([agent.color for agent in agents], dtype=int).reshape(-1, 3)
+    for name in ("global_target", "target"):
+        # missing targets are stored as NaN
+        state["agent_" + name] = np.array([np.full(2, np.nan) if getattr(agent, name) is None else np.asarray(getattr(agent, name), dtype=float) for agent in agents]).reshape(-1, 2)
+    return state
+
+def restore_environment(env, state, make_agent):
+    '''
+    Replace the agents of `env` (with the same walls and exits of the saved one)
+    with the ones of `state`. `make_agent(uid, index)` returns the bare agent
+    object of a crowd row (e.g. Agent.bare), whose common attributes are set here.
+
+    :return: the restored agents, in the saved order
+    '''
+    size = int(state["crowd_size"])
+    crowd = CrowdState(size)
+    crowd.size = size
+    for name in CrowdState.VECTOR_FIELDS + CrowdState.SCALAR_FIELDS + CrowdState.FLAG_FIELDS:
+        getattr(crowd, name)[:size] = state["crowd_" + name]
+    env.crowd = crowd
+    env.simulation_time = float(state["simulation_time"])
+    env.random.set_state(json.loads(str(state["random_state"])))
+
+    agents = []
+    for i, (uid, index) in enumerate(zip(state["agent_id"], state["agent_index"])):
+        agent = make_agent(int(uid), int(index))
+        agent.tau = float(state["agent_tau"][i])
+        agent.color = tuple(int(c) for c in state["agent_color"][i])
+        for name in ("global_target", "target"):
+            value = state["agent_" + name][i]
+            setattr(agent, name, None if np.isnan(value[0]) else value.copy())
+        agents.append(agent)
+
+    env.set_agents(agents)
+    # set_agents counts only the agents still in the simulation
+    env.initial_agent_count = int(state["initial_agent_count"])
+    return agents
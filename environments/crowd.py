@@ -0,0 +1,81 @@
+import numpy as np
+
+class CrowdState:
+    '''
+    Structure-of-arrays storage of the state of all the agents of an environment.
+
+    Every agent owns one row (its `index`) of the arrays below, and the Agent
+    objects only expose views on that row. In this way the simulators can work
+    on the whole crowd at once, e.g. `crowd.pos[idx]` for all the agents in `idx`.
+    Rows are never reused: agents leaving the simulation are only marked as not active.
+    '''
+
+    VECTOR_FIELDS = ("pos", "prev_pos", "vel", "f_desired", "f_walls", "f_agents")
+    SCALAR_FIELDS = ("radius", "mass", "max_speed")
+    FLAG_FIELDS = ("active", "safe", "fail")
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.capacity = max(int(capacity), 1)
+
+        for name in self.VECTOR_FIELDS:
+            setattr(self, name, np.zeros((self.capacity, 2), dtype=float))
+        for name in self.SCALAR_FIELDS:
+            setattr(self, name, np.zeros(self.capacity, dtype=float))
+        for name in self.FLAG_FIELDS:
+            setattr(self, name, np.zeros(self.capacity, dtype=bool))
+
+    def __len__(self):
+        return self.size
+
+    def allocate(self):
+        '''Reserve a new row and return its index'''
+        if self.size == self.capacity:
+            self._grow(self.capacity * 2)
+        idx = self.size
+        self.size += 1
+        return idx
+
+    def _grow(self, new_capacity):
+        # Agents always access their row through the environment, hence
+        # reallocating the arrays does not invalidate them
+        for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.FLAG_FIELDS:
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.capacity = new_capacity
+
+    def active_indices(self):
+        '''Indices of the agents still in the simulation, in insertion order'''
+        return np.flatnonzero(self.active[:self.size])
+
+    def integrate(self, idx, dt):
+        '''
+        Explicit Euler step of the social-force model for the agents in `idx`,
+        using the forces currently stored in `f_desired`, `f_agents` and `f_walls`.
+        The speed of every agent is capped to its own `max_speed`.
+        '''
+        idx = np.atleast_1d(idx)
+        vel = self.vel[idx] + dt * (self.f_desired[idx] + (self.f_agents[idx] + self.f_walls[idx]) / self.mass[idx, None])
+
+        speed = np.linalg.norm(vel, axis=1)
+        max_speed = self.max_speed[idx]
+        too_fast = speed > max_speed
+        vel[too_fast] = (vel[too_fast] / speed[too_fast, None]) * max_speed[too_fast, None]
+
+        self.vel[idx] = vel
+        self.pos[idx] = self.pos[idx] + vel * dt
+
+    def copy(self):
+        new = CrowdState.__new__(CrowdState)
+        new.size = self.size
+        new.capacity = self.capacity
+        for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.FLAG_FIELDS:
+            setattr(new, name, getattr(self, name).copy())
+        return new
+
+    def __deepcopy__(self, memo):
+        new = self.copy()
+        memo[id(self)] = new
+        return new
@@ -0,0 +1,192 @@
+import copy
+import numpy as np
+from environments.crowd import CrowdState
+from environments.profiler import StepProfiler
+
+# Ensembles of K independent replicas of the same scenario and parameters, e.g. to
+# collect statistics over many seeds in one process. The crowds of the replicas are
+# stored together, in arrays of shape (K, N, 2) and (K, N), where N is the largest
+# crowd: the simulators that support it (see update_ensemble of the ACO simulator)
+# advance all the replicas at once, the others one replica at a time.
+
+def _escaped_ids(sim):
+    # the boids simulator keeps the escaped agents themselves, the others their ids
+    return [getattr(agent, "id", agent) for agent in sim.agents_escaped]
+
+class _OverlapInEnsemble(Exception):
+    pass
+
+class _ReplicaNoise:
+    # Generator given to the force kernels run on the whole ensemble: the random
+    # directions of overlapping agents must be drawn from the noise stream of their
+    # own replica, hence when they are needed the forces are computed per replica
+    def uniform(self, *args, **kwargs):
+        raise _OverlapInEnsemble()
+
+class ReplicaCrowd(CrowdState):
+    '''
+    Crowd of one replica of an ensemble: its arrays are views on the rows of the
+    replica in the arrays of the whole ensemble, hence they cannot grow.
+    '''
+
+    def __init__(self, ensemble, k, size):
+        self.size = size
+        self.capacity = ensemble.capacity
+        for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.FLAG_FIELDS:
+            setattr(self, name, getattr(ensemble, name)[k])
+
+    def _grow(self, new_capacity):
+        raise ValueError("Agents cannot be added to the replicas of an ensemble.")
+
+
+class EnsembleCrowd:
+    '''
+    The CrowdState arrays of K crowds, stacked: `pos` has shape (K, N, 2), `active`
+    shape (K, N), ... Row i of replica k is also row k * N + i of `flat`, a
+    CrowdState over the same memory, for the kernels working on the whole ensemble.
+    '''
+
+    def __init__(self, crowds):
+        self.replicas = len(crowds)
+        self.capacity = max(max(crowd.size for crowd in crowds), 1)
+
+        for name in CrowdState.VECTOR_FIELDS + CrowdState.SCALAR_FIELDS + CrowdState.FLAG_FIELDS:
+            first = getattr(crowds[0], name)
+            stacked = np.zeros((self.replicas, self.capacity) + first.shape[1:], dtype=first.dtype)
+            for k, crowd in enumerate(crowds):
+                stacked[k, :crowd.size] = getattr(crowd, name)[:crowd.size]
+            setattr(self, name, stacked)
+
+        self.flat = CrowdState.__new__(CrowdState)
+        self.flat.size = self.flat.capacity = self.replicas * self.capacity
+        for name in CrowdState.VECTOR_FIELDS + CrowdState.SCALAR_FIELDS + CrowdState.FLAG_FIELDS:
+            array = getattr(self, name)
+            setattr(self.flat, name, array.reshape((self.flat.size,) + array.shape[2:]))
+
+    def replica(self, k, size):
+        '''CrowdState of replica k (with `size` rows in use), a view on its rows'''
+        return ReplicaCrowd(self, k, size)
+
+    def rows(self, k, idx):
+        '''Rows of `flat` of the crowd indices `idx` of replica k'''
+        return k * self.capacity + np.asarray(idx, dtype=int)
+
+
+class Ensemble:
+    '''
+    K replicas of one simulation, with the seeds `seeds` (by default random_seed,
+    random_seed + 1, ... of the config, so that replica 0 is the single run with
+    the same config): every replica has its own environment, random streams,
+    agents and simulator, hence its own escape bookkeeping, but the crowds live
+    in one EnsembleCrowd and the compiled walls and exits (and the precomputed
+    fields of the simulators, e.g. the fitness map of PSO) are shared.
+
+    :param make_environment: function config -> environment with its agents
+    :param make_simulator: function (environment, config, **shared) -> simulator
+    '''
+
+    def __init__(self, config, make_environment, make_simulator, replicas=None, seeds=None):
+        if getattr(config, "time_stepping", "fixed") != "fixed":
+            raise ValueError("The replicas of an ensemble advance with the same fixed time step.")
+        if seeds is None:
+            base = getattr(config, "random_seed", None)
+            seeds = [None if base is None else base + k for k in range(replicas)]
+        self.seeds = list(seeds)
+        self.config = config
+        self.profiler = StepProfiler(getattr(config, "profile", False))
+
+        self.configs, self.envs = [], []
+        for seed in self.seeds:
+            replica_config = copy.copy(config)
+            replica_config.random_seed = seed
+            self.configs.append(replica_config)
+            self.envs.append(make_environment(replica_config))
+
+        # one copy of the geometry for all the replicas
+        first = self.envs[0]
+        first.get_wall_table()
+        first.get_exit_table()
+        for env in self.envs[1:]:
+            env.wall_table = first.wall_table
+            env.exit_table = first.exit_table
+            env.segment_index = first.segment_index
+
+        self.crowd = EnsembleCrowd([env.crowd for env in self.envs])
+        for k, env in enumerate(self.envs):
+            env.crowd = self.crowd.replica(k, env.crowd.size)
+
+        self.sims = [make_simulator(first, self.configs[0])]
+        shared = {"fitness_map": self.sims[0].fitness_map} if hasattr(self.sims[0], "fitness_map") else {}
+        for env, replica_config in zip(self.envs[1:], self.configs[1:]):
+            self.sims.append(make_simulator(env, replica_config, **shared))
+
+        self.steps = 0
+        self.finished = [False] * len(self.envs)
+        self.termination = [None] * len(self.envs)
+
+    def __len__(self):
+        return len(self.envs)
+
+    def running(self):
+        '''Indices of the replicas not finished yet'''
+        return [k for k, finished in enumerate(self.finished) if not finished]
+
+    def update(self, dt):
+        '''Advance all the running replicas of one step'''
+        running = self.running()
+        sims = [self.sims[k] for k in running]
+        update_ensemble = getattr(type(sims[0]), "update_ensemble", None)
+        if update_ensemble is not None:
+            update_ensemble(sims, self, running, dt)
+        else:
+            for sim in sims:
+                sim.update(dt)
+        self.steps += 1
+
+    def social_forces(self, agent_class, replicas, active, pairs):
+        '''
+        Repulsive forces among the agents and from the walls (as crowd_repulsive_forces
+        and crowd_obstacle_forces of `agent_class`) for the running `replicas`, given
+        for each of them its active crowd indices and its interacting pairs: computed
+        in one pass over the whole ensemble, with the results of a pass per replica
+        (the same, except for the rounding of very long lists of pairs).
+        '''
+        flat, walls = self.crowd.flat, self.envs[0].get_wall_table()
+        rows = np.concatenate([self.crowd.rows(k, idx) for k, idx in zip(replicas, active)])
+        i = np.concatenate([self.crowd.rows(k, p[0]) for k, p in zip(replicas, pairs)])
+        j = np.concatenate([self.crowd.rows(k, p[1]) for k, p in zip(replicas, pairs)])
+
+        with self.profiler.phase("agent_forces"):
+            try:
+                agent_class.crowd_repulsive_forces(flat, rows, (i, j), rng=_ReplicaNoise())
+            except _OverlapInEnsemble:
+                for k, idx, p in zip(replicas, active, pairs):
+                    agent_class.crowd_repulsive_forces(self.envs[k].crowd, idx, p, rng=self.envs[k].random.noise)
+        with self.profiler.phase("wall_forces"):
+            try:
+                agent_class.crowd_obstacle_forces(flat, rows, walls, rng=_ReplicaNoise())
+            except _OverlapInEnsemble:
+                for k, idx in zip(replicas, active):
+                    agent_class.crowd_obstacle_forces(self.envs[k].crowd, idx, walls, rng=self.envs[k].random.noise)
+        return rows
+
+    def finish(self, k, reason=None):
+        '''Stop updating replica k, because of `reason` (see environments.termination)'''
+        self.finished[k] = True
+        self.termination[k] = reason
+
+    def results(self):
+        '''
+        For every replica: its seed, simulation time, agents escaped (ids, in order)
+        and remaining, and the reason of its end (None if still running)
+        '''
+        return [
+            {
+                "seed": seed,
+                "simulation_time": env.simulation_time,
+                "agents_escaped": _escaped_ids(sim),
+                "agents_remaining": env.initial_agent_count - len(sim.agents_escaped),
+                "termination": reason,
+            }
+            for seed, env, sim, reason in zip(self.seeds, self.envs, self.sims, self.termination)
+        ]
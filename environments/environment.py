@@ -1,4 +1,10 @@
 from environments.utils import segments_intersect
+from environments.crowd import CrowdState
+from environments.spatial import SpatialHash, SegmentGrid
+from environments.geometry import SegmentTable
+from environments.streams import RandomStreams
+from environments.profiler import StepProfiler
+from backends import get_backend
 from parser.config import Config
 import numpy as np
 import copy
@@ -13,18 +19,26 @@ class Environment:
         
 
         self.walls = list()
+        self.exits = list()
+        self.invalidate_geometry()
         if walls != [None]:
             self.set_walls(walls)
         self.add_external_walls()
         
-        self.exits = list()
         if exits != [None]:
             self.set_safety_exits(exits)
             
         self.agents = []
+        self.crowd = CrowdState()
+        self.agents_by_index = dict()
+        self.spatial_hash = SpatialHash(self.__dimensions)
         self.initial_agent_count = 0
         self.simulation_time = 0.0
         self.algorithm = None
+        # all the random numbers of the run come from these streams, seeded by the config
+        self.random = RandomStreams(getattr(config, "random_seed", None) if config is not None else None)
+        # timing of the phases of the simulation steps, see environments.profiler
+        self.profiler = StepProfiler(getattr(config, "profile", False) if config is not None else False)
         
         #self.env.set_agents([AcoAgent(self.env, uid=i) for i in range(num_agents)])
         if isinstance(agents, list) and len(agents) == 2:
@@ -53,11 +67,37 @@ class Environment:
         
     def add_agent(self, agent):
         self.agents.append(agent)
+        self.agents_by_index[agent.index] = agent
+        self.crowd.active[agent.index] = True
         self.initial_agent_count += 1
         
     def set_agents(self, agents):
         self.agents = agents
+        self.agents_by_index = {agent.index: agent for agent in agents}
+        self.crowd.active[:] = False
+        for agent in agents:
+            self.crowd.active[agent.index] = True
         self.initial_agent_count = len(agents)
+        
+    def remove_agent(self, agent):
+        self.agents.remove(agent)
+        self.crowd.active[agent.index] = False
+        
+    def get_agent(self, index):
+        return self.agents_by_index[index]
+    
+    def update_spatial_hash(self):
+        '''Index the current positions of the agents in the simulation (once per step)'''
+        idx = self.crowd.active_indices()
+        self.spatial_hash.build(self.crowd.pos[idx], idx)
+        
+    def agents_within(self, point, radius):
+        '''Crowd indices of the agents within `radius` from `point`, as of the last update_spatial_hash'''
+        return self.spatial_hash.query_radius(point, radius)
+    
+    def agent_pairs_within(self, radius):
+        '''Pairs (i, j) of crowd indices of the agents closer than `radius`, as of the last update_spatial_hash'''
+        return self.spatial_hash.query_pairs(radius)
     
     def get_agents(self):
         return self.agents
@@ -69,12 +109,46 @@ class Environment:
                 for point in wall:
                     assert isinstance(point, tuple) and len(point) == 2, "Wall positions must be provided as a list of two tuples indicating the starting and ending point of the wall"
                 self.walls.append((tuple(wall[0]), tuple(wall[1])))
+            self.invalidate_geometry()
         else:
             raise ValueError("Positions must be provided as a tuple or as a list of tuples")  
            
     def get_walls(self):
         return self.walls
     
+    def invalidate_geometry(self):
+        '''Drop the compiled walls and exits, to be called whenever they change'''
+        self.wall_table = None
+        self.exit_table = None
+        self.segment_index = dict()
+    
+    def get_wall_table(self):
+        '''
+        Walls compiled as read-only arrays (see environments.geometry.SegmentTable).
+        The table is rebuilt after set_walls or set_safety_exits change the walls.
+        '''
+        if self.wall_table is None:
+            self.wall_table = SegmentTable(self.walls)
+        return self.wall_table
+    
+    def get_exit_table(self):
+        '''Safety exits compiled as read-only arrays, as get_wall_table'''
+        if self.exit_table is None:
+            self.exit_table = SegmentTable(self.exits)
+        return self.exit_table
+    
+    def get_segment_index(self, name):
+        '''Spatial index (see environments.spatial.SegmentGrid) over the walls or the exits'''
+        if name not in self.segment_index:
+            if name == "exit":
+                table = self.get_exit_table()
+            elif name == "wall":
+                table = self.get_wall_table()
+            else:
+                raise ValueError("Unknown name provided to get_segment_index: {}".format(name))
+            self.segment_index[name] = SegmentGrid(table, self.__dimensions)
+        return self.segment_index[name]
+    
     def get_wall(self, i:int):
         return self.walls[i]
     
@@ -133,6 +207,7 @@ class Environment:
                 
                 #self.exits.add(exit_tuple)
                 self.exits.append(exit_tuple)
+            self.invalidate_geometry()
         else:
             raise ValueError("Safety exit positions must be provided as a tuple or as a list of tuples")
   
@@ -180,6 +255,7 @@ class Environment:
     def remove_safety_exit(self, position):
         if position in self.exits:
             self.exits.remove(position)
+            self.invalidate_geometry()
     
     def get_dimensions(self):
         return self.__dimensions
@@ -199,11 +275,12 @@ class Environment:
             )
         
     def check_something_reached(self, prev_pos, pos, name):
-        if name == "exit":
-            to_check = self.get_safety_exits()
-        elif name == "wall":
-            to_check = self.walls
-        else:
+        '''
+        Index of the first wall or exit (name="wall" or "exit") crossed by the
+        motion prev_pos -> pos, or None. Only the segments close to the motion
+        are tested, thanks to the spatial index of get_segment_index.
+        '''
+        if name not in ("exit", "wall"):
             raise ValueError("Unknown name provided to check_something_reached: {}".format(name))
         
         if pos is None or prev_pos is None:
@@ -213,11 +290,22 @@ class Environment:
         # if pos[0] < 0 or pos[0] > self.__dimensions[0] or pos[1] < 0 or pos[1] > self.__dimensions[1]:
         #     return None
         
-        for i, item in enumerate(to_check):
-            if segments_intersect(prev_pos, pos,
-                                  item[0], item[1]):
-                return i
-        return None
+        return self.get_segment_index(name).first_hit(prev_pos, pos)
+    
+    def check_many_reached(self, prev_pos, pos, name):
+        '''
+        Batched check_something_reached for many motions prev_pos[q] -> pos[q]
+        (arrays of shape (Q, 2)): index of the first wall or exit crossed by each
+        of them, or -1 if none is crossed.
+        '''
+        if name == "exit":
+            table = self.get_exit_table()
+        elif name == "wall":
+            table = self.get_wall_table()
+        else:
+            raise ValueError("Unknown name provided to check_many_reached: {}".format(name))
+        
+        return get_backend().first_intersection(prev_pos, pos, table.start, table.end)
     
     def check_is_position_free(self, position, agent=None):
         for wall in self.walls:
@@ -230,15 +318,11 @@ class Environment:
                 return False
             
         if agent is not None and len(self.agents) > 0:
-            for other_agent in self.agents:
-                if other_agent.id == agent.id:
-                    if len(self.agents) == 1:
-                        return True
-                    continue
-                
-                dist = np.linalg.norm(other_agent.pos - np.array(position))
-                if dist < (other_agent.radius + agent.radius):
-                    return False
+            # distances from all the other agents at once, from the crowd arrays
+            idx = np.array([other_agent.index for other_agent in self.agents if other_agent.id != agent.id], dtype=int)
+            dist = np.linalg.norm(self.crowd.pos[idx] - np.array(position), axis=1)
+            if np.any(dist < self.crowd.radius[idx] + agent.radius):
+                return False
             
         return True
     
@@ -267,11 +351,12 @@ class Environment:
     ###########################################
     
     def get_random_spawn(self, agent=None):
-        gx = np.random.uniform(1, self.__dimensions[0] - 2)
-        gy = np.random.uniform(1, self.__dimensions[1] - 2)
+        rng = self.random.spawn
+        gx = rng.uniform(1, self.__dimensions[0] - 2)
+        gy = rng.uniform(1, self.__dimensions[1] - 2)
         while not self.check_is_position_free((gx, gy), agent=agent):
-            gx = np.random.uniform(1, self.__dimensions[0] - 2)
-            gy = np.random.uniform(1, self.__dimensions[1] - 2)
+            gx = rng.uniform(1, self.__dimensions[0] - 2)
+            gy = rng.uniform(1, self.__dimensions[1] - 2)
         return (gx, gy)
 
     def get_random_exit(self, overshoot=0.5):
@@ -279,7 +364,7 @@ class Environment:
             raise ValueError("No exits defined in the environment")
 
         exits = list(self.exits)
-        idx = np.random.choice(len(exits))
+        idx = self.random.spawn.integers(len(exits))
         A, B = exits[idx]
         point = (
             (A[0] + B[0]) / 2,
@@ -289,6 +374,29 @@ class Environment:
     
     #############################################à
     
+    def fork(self):
+        '''
+        Cheap copy of the environment, e.g. to run many simulations from the same
+        initial population. The geometry (compiled walls and exits and their spatial
+        indices) is shared with the original, since it is read-only: only the lists
+        of walls and exits are copied, so that changing them in the fork rebuilds the
+        fork's own tables. The state of the agents (crowd arrays, agent objects and
+        random streams) is copied, and the fork keeps the class of the original.
+        '''
+        new_env = copy.copy(self)
+        
+        new_env.walls = list(self.walls)
+        new_env.exits = list(self.exits)
+        new_env.segment_index = dict(self.segment_index)
+        new_env.spatial_hash = SpatialHash(self.__dimensions, self.spatial_hash.cell_size)
+        new_env.random = copy.deepcopy(self.random)
+        new_env.profiler = StepProfiler(self.profiler.enabled)
+        
+        new_env.crowd = self.crowd.copy()
+        new_env.agents = [agent.fork(new_env) for agent in self.agents]
+        new_env.agents_by_index = {agent.index: agent for agent in new_env.agents}
+        return new_env
+    
     def __deepcopy__(self, memo):
         # Prevent infinite recursion
         if id(self) in memo:
@@ -308,17 +416,23 @@ class Environment:
         # Copy simple attributes
         new_env.simulation_time = self.simulation_time
         new_env.initial_agent_count = self.initial_agent_count
+        new_env.random = copy.deepcopy(self.random, memo)
+        new_env.profiler = StepProfiler(self.profiler.enabled)
 
         # Deep copy walls & exits (tuples are immutable, but list is not)
         new_env.walls = copy.deepcopy(self.walls, memo)
         new_env.exits = copy.deepcopy(self.exits, memo)
+        new_env.invalidate_geometry()
 
-        # Deep copy agents and rebind them to the new environment
+        # Deep copy agents and rebind them to the new environment,
+        # their state is held by the copied crowd arrays
+        new_env.crowd = copy.deepcopy(self.crowd, memo)
         new_env.agents = []
         for agent in self.agents:
             new_agent = copy.deepcopy(agent, memo)
             new_agent.env = new_env
             new_env.agents.append(new_agent)
+            new_env.agents_by_index[new_agent.index] = new_agent
 
         return new_env
         
\ No newline at end of file
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Function described in https://pedestriandynamics.org/models/social_force_model/
+def pair_repulsion(pos_i, vel_i, r_i, pos_j, vel_j, r_j, A, B, k, kappa, valid=None, rng=None):
+    '''
+    Social-force repulsion exerted by j on i (exponential, pushing and sliding
+    friction terms), for arrays of pairs. Positions and velocities have shape
+    (..., 2) and radii shape (...), and all the inputs are broadcast together.
+    The force exerted by i on j is the opposite one.
+
+    `valid` optionally masks the pairs to consider (e.g. to skip i == j): the
+    force of the other pairs is not meaningful and must be discarded by the caller.
+    '''
+    if rng is None:
+        rng = np.random
+
+    d_vec = pos_i - pos_j
+    dist = np.sqrt(d_vec[..., 0] ** 2 + d_vec[..., 1] ** 2)
+
+    # Collision handling: overlapping agents are pushed apart in a random direction
+    overlap = dist < 1e-8
+    if np.any(overlap):
+        d_vec = np.array(np.broadcast_to(d_vec, dist.shape + (2,)))
+        colliding = overlap if valid is None else overlap & valid
+        dirs = rng.uniform(-1, 1, (int(colliding.sum()), 2))
+        d_vec[colliding] = 1e-8 * dirs / np.linalg.norm(dirs, axis=1, keepdims=True)
+        dist = np.where(overlap, 1e-8, dist)
+    n_ij = d_vec / dist[..., None]
+
+    t_ij = np.stack((-n_ij[..., 1], n_ij[..., 0]), axis=-1)
+    r_ij = r_i + r_j
+
+    g = np.maximum(r_ij - dist, 0.0)
+
+    # Exponential repulsive force + pushing force
+    f_normal = A * np.exp((r_ij - dist) / B) + k * g
+
+    # Sliding friction force
+    dv = vel_j - vel_i
+    dv_t = dv[..., 0] * t_ij[..., 0] + dv[..., 1] * t_ij[..., 1]
+    f_slide = kappa * g * dv_t
+
+    return f_normal[..., None] * n_ij + f_slide[..., None] * t_ij
+
+
+def social_forces(pos, vel, radius, A, B, k, kappa, tile_size=256, rng=None):
+    '''
+    Total repulsive force acting on each of the N agents because of all the others.
+
+    Every pair is evaluated only once (Newton's third law) and the interactions
+    are computed in tiles of `tile_size` x `tile_size` pairs, so that memory does
+    not grow as N^2.
+
+    :param pos: positions, shape (N, 2)
+    :param vel: velocities, shape (N, 2)
+    :param radius: radii, shape (N,)
+    :return: forces, shape (N, 2)
+    '''
+    n = len(pos)
+    forces = np.zeros((n, 2))
+
+    for start_i in range(0, n, tile_size):
+        stop_i = min(start_i + tile_size, n)
+        for start_j in range(start_i, n, tile_size):
+            stop_j = min(start_j + tile_size, n)
+
+            # Diagonal tiles: keep only the pairs i < j
+            valid = None
+            if start_i == start_j:
+                valid = np.triu(np.ones((stop_i - start_i, stop_j - start_j), dtype=bool), 1)
+
+            f = pair_repulsion(
+                pos[start_i:stop_i, None], vel[start_i:stop_i, None], radius[start_i:stop_i, None],
+                pos[None, start_j:stop_j], vel[None, start_j:stop_j], radius[None, start_j:stop_j],
+                A, B, k, kappa, valid, rng
+            )
+            if valid is not None:
+                f[~valid] = 0.0
+
+            forces[start_i:stop_i] += f.sum(axis=1)
+            forces[start_j:stop_j] -= f.sum(axis=0)
+
+    return forces
+
+
+def social_forces_from_pairs(pos, vel, radius, i, j, A, B, k, kappa, chunk_size=65536, rng=None):
+    '''
+    Total repulsive force acting on each agent, considering only the given pairs
+    (i, j) of indices into `pos`, e.g. the pairs closer than an interaction cutoff
+    returned by a neighbor search. Each pair must appear once.
+
+    :return: forces, shape (len(pos), 2); agents in no pair get a null force
+    '''
+    forces = np.zeros((len(pos), 2))
+
+    for start in range(0, len(i), chunk_size):
+        ii = i[start:start + chunk_size]
+        jj = j[start:start + chunk_size]
+        f = pair_repulsion(
+            pos[ii], vel[ii], radius[ii],
+            pos[jj], vel[jj], radius[jj],
+            A, B, k, kappa, rng=rng
+        )
+        for axis in range(2):
+            forces[:, axis] += np.bincount(ii, weights=f[:, axis], minlength=len(pos))
+            forces[:, axis] -= np.bincount(jj, weights=f[:, axis], minlength=len(pos))
+
+    return forces
+
+
+def wall_forces(pos, vel, radius, walls, A, B, k, kappa, chunk_size=1024, rng=None):
+    '''
+    Total repulsive force of all the walls on each agent: every wall pushes the
+    agent as a still, point-like obstacle placed on its closest point.
+
+    :param walls: compiled walls (environments.geometry.SegmentTable)
+    :return: forces, shape (N, 2)
+    '''
+    n = len(pos)
+    forces = np.zeros((n, 2))
+    if len(walls) == 0:
+        return forces
+
+    # Chunks of agents, to bound the memory of the agents x walls arrays
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        closest, _ = walls.closest_points(pos[start:stop])
+        f = pair_repulsion(
+            pos[start:stop, None], vel[start:stop, None], radius[start:stop, None],
+            closest, np.zeros(2), 0.0,
+            A, B, k, kappa, rng=rng
+        )
+        forces[start:stop] = f.sum(axis=1)
+
+    return forces
@@ -0,0 +1,173 @@
+import numpy as np
+from multiprocessing import shared_memory
+from environments.recorder import ACTIVE, SAFE, FAIL
+
+# Slots of the header of a SharedFrameBuffer (int64)
+LATEST, SEQUENCE, FRAMES, PLAYING, STOP, FINISHED = 0, 1, 3, 4, 5, 6
+HEADER_SLOTS = 8
+
+class SharedFrameBuffer:
+    '''
+    State of the crowd of a simulation running in another process, in a block of
+    multiprocessing.shared_memory: one process (the simulation) publishes a frame
+    after every step, another one (the visualizer) reads the latest complete frame,
+    and neither of them waits for the other.
+
+    The block holds two frames, with a sequence number each. The writer fills the
+    frame not being read, incrementing its sequence number before (odd: being
+    written) and after (even: complete) it, and then marks it as the latest one.
+    The reader copies the latest frame and checks that its sequence number was
+    even and did not change meanwhile, otherwise it reads again. The header also
+    holds the flags controlling the simulation (play/pause, stop) and its end.
+
+    :param name: name of the block created by another process, None to create it
+    '''
+
+    def __init__(self, num_agents, name=None):
+        self.num_agents = int(num_agents)
+        n = self.num_agents
+        # per frame: time, then positions, velocities and targets of every agent
+        self.frame_floats = 1 + 6 * n
+        size = 8 * HEADER_SLOTS + 2 * 8 * self.frame_floats + 2 * n
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=max(size, 1))
+
+        buffer = self.shm.buf
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=buffer)
+        self.floats = np.ndarray((2, self.frame_floats), dtype=float, buffer=buffer, offset=8 * HEADER_SLOTS)
+        self.flags = np.ndarray((2, n), dtype=np.uint8, buffer=buffer, offset=8 * HEADER_SLOTS + 2 * 8 * self.frame_floats)
+        if self.owner:
+            self.header[:] = 0
+            self.header[LATEST] = -1
+            self.header[PLAYING] = 1
+
+        self._last_read = -1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _views(self, b):
+        n = self.num_agents
+        floats = self.floats[b]
+        return floats[1:1 + 2 * n].reshape(n, 2), floats[1 + 2 * n:1 + 4 * n].reshape(n, 2), floats[1 + 4 * n:].reshape(n, 2)
+
+    ########################## WRITER ##########################
+
+    def publish(self, env):
+        '''Write the current state of the agents of `env` as the latest frame'''
+        crowd = env.crowd
+        if crowd.size != self.num_agents:
+            raise ValueError("Agents cannot be added to a simulation publishing its frames.")
+        n = self.num_agents
+
+        latest = self.header[LATEST]
+        b = 0 if latest < 0 else 1 - latest
+        self.header[SEQUENCE + b] += 1
+
+        pos, vel, target = self._views(b)
+        self.floats[b, 0] = env.simulation_time
+        pos[:] = crowd.pos[:n]
+        vel[:] = crowd.vel[:n]
+        target[:] = np.nan
+        for agent in env.agents:
+            if agent.target is not None and len(agent.target) == 2:
+                target[agent.index] = agent.target
+        self.flags[b] = crowd.active[:n] * ACTIVE + crowd.safe[:n] * SAFE + crowd.fail[:n] * FAIL
+
+        self.header[SEQUENCE + b] += 1
+        self.header[LATEST] = b
+        self.header[FRAMES] += 1
+
+    @property
+    def playing(self):
+        return bool(self.header[PLAYING])
+
+    @property
+    def stopped(self):
+        return bool(self.header[STOP])
+
+    def finish(self):
+        '''Mark the end of the simulation'''
+        self.header[FINISHED] = 1
+
+    ########################## READER ##########################
+
+    def set_playing(self, playing):
+        self.header[PLAYING] = int(bool(playing))
+
+    def stop(self):
+        '''Ask the simulation to stop'''
+        self.header[STOP] = 1
+
+    @property
+    def finished(self):
+        return bool(self.header[FINISHED])
+
+    @property
+    def frames(self):
+        '''Number of frames published so far'''
+        return int(self.header[FRAMES])
+
+    def latest(self):
+        '''
+        Copy of the latest complete frame (time, positions, velocities, targets and
+        flags active, safe and fail, one row per crowd index), None if no frame has
+        been published yet
+        '''
+        while True:
+            b = int(self.header[LATEST])
+            if b < 0:
+                return None
+            sequence = self.header[SEQUENCE + b]
+            floats = self.floats[b].copy()
+            flags = self.flags[b].copy()
+            if sequence % 2 == 0 and self.header[SEQUENCE + b] == sequence:
+                break
+
+        n = self.num_agents
+        return {
+            "time": float(floats[0]),
+            "pos": floats[1:1 + 2 * n].reshape(n, 2),
+            "vel": floats[1 + 2 * n:1 + 4 * n].reshape(n, 2),
+            "target": floats[1 + 4 * n:].reshape(n, 2),
+            "active": (flags & ACTIVE) > 0,
+            "safe": (flags & SAFE) > 0,
+            "fail": (flags & FAIL) > 0,
+        }
+
+    def load_latest(self, env, agents):
+        '''
+        Copy the latest frame into `env`, a copy of the simulated environment with
+        the objects `agents` of all its agents, if it was not loaded yet.
+
+        :return: True if a new frame was loaded
+        '''
+        frames = self.frames
+        if frames == self._last_read:
+            return False
+        frame = self.latest()
+        if frame is None:
+            return False
+        self._last_read = frames
+
+        n = self.num_agents
+        crowd = env.crowd
+        crowd.pos[:n] = frame["pos"]
+        crowd.vel[:n] = frame["vel"]
+        for name in ("active", "safe", "fail"):
+            getattr(crowd, name)[:n] = frame[name]
+        env.agents = [agent for agent in agents if crowd.active[agent.index]]
+        env.agents_by_index = {agent.index: agent for agent in env.agents}
+        for agent in env.agents:
+            target = frame["target"][agent.index]
+            agent.target = None if np.isnan(target[0]) else target
+        env.simulation_time = frame["time"]
+        return True
+
+    def close(self):
+        # the views on the block must be released before closing it
+        self.header = self.floats = self.flags = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,45 @@
+import numpy as np
+
+class SegmentTable:
+    '''
+    Compiled, read-only arrays describing a list of segments ((x1, y1), (x2, y2)),
+    e.g. the walls of an environment: start points, direction vectors, squared
+    lengths and unit normals. Degenerate segments have a null normal.
+    '''
+
+    def __init__(self, segments):
+        segments = np.array([(tuple(a), tuple(b)) for a, b in segments], dtype=float).reshape(-1, 2, 2)
+
+        self.start = segments[:, 0]
+        self.end = segments[:, 1]
+        self.direction = self.end - self.start
+        self.length_sq = np.sum(self.direction ** 2, axis=1)
+
+        length = np.sqrt(self.length_sq)
+        safe_length = np.where(length > 0, length, 1.0)
+        self.normal = np.stack((-self.direction[:, 1], self.direction[:, 0]), axis=1) / safe_length[:, None]
+        self.normal[length == 0] = 0.0
+
+        for array in (self.start, self.end, self.direction, self.length_sq, self.normal):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.start)
+
+    def closest_points(self, points):
+        '''
+        Closest point of every segment to every point.
+
+        :param points: shape (P, 2)
+        :return: closest points, shape (P, S, 2), and distances, shape (P, S)
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        rel = points[:, None, :] - self.start[None, :, :]
+        safe_length_sq = np.where(self.length_sq > 0, self.length_sq, 1.0)
+        t = np.sum(rel * self.direction[None], axis=2) / safe_length_sq
+        t = np.where(self.length_sq > 0, np.clip(t, 0, 1), 0.0)
+
+        closest = self.start[None] + t[..., None] * self.direction[None]
+        d = points[:, None, :] - closest
+        dist = np.sqrt(d[..., 0] ** 2 + d[..., 1] ** 2)
+        return closest, dist
@@ -0,0 +1,92 @@
+import time
+
+class _Phase:
+    # Context manager timing one phase of the step, reused for every call
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullPhase:
+    # Context manager doing nothing, used when the profiler is disabled
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = _NullPhase()
+
+
+class StepProfiler:
+    '''
+    Wall time and number of calls of the phases of the simulation steps (and of
+    the setup of the simulators: graph_build, run_aco, fitness_map), e.g.
+
+        with env.profiler.phase("agent_forces"):
+            ...
+
+    The time of a phase includes the one of the phases nested in it. When the
+    profiler is disabled phase() returns a context manager doing nothing, hence
+    the instrumentation costs only a method call.
+    '''
+
+    def __init__(self, enabled=False):
+        self.enabled = bool(enabled)
+        self.time = dict()
+        self.calls = dict()
+        self._phases = dict()
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+        return phase
+
+    def add(self, name, elapsed):
+        self.time[name] = self.time.get(name, 0.0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reset(self):
+        self.time.clear()
+        self.calls.clear()
+
+    def summary(self):
+        '''
+        :return: for every phase, its total time (s), number of calls, time per call
+                 and fraction of the time of the whole steps (phase "step"), if timed
+        '''
+        total = self.time.get("step", 0.0)
+        return {
+            name: {
+                "time": elapsed,
+                "calls": self.calls[name],
+                "time_per_call": elapsed / self.calls[name],
+                "fraction": elapsed / total if total > 0 else 0.0,
+            }
+            for name, elapsed in sorted(self.time.items(), key=lambda item: -item[1])
+        }
+
+    def report(self):
+        '''Summary as a text table, slowest phases first'''
+        lines = ["{:<20s} {:>10s} {:>10s} {:>14s} {:>8s}".format("phase", "time (s)", "calls", "per call (us)", "step %")]
+        for name, data in self.summary().items():
+            lines.append("{:<20s} {:>10.3f} {:>10d} {:>14.2f} {:>8.1f}".format(
+                name, data["time"], data["calls"], data["time_per_call"] * 1e6, data["fraction"] * 100
+            ))
+        return "\n".join(lines)
@@ -0,0 +1,258 @@
+import json
+import os
+import numpy as np
+
+# Trajectories of a simulation, stored in a directory:
+#
+# - meta.json: number of frames, number of agents, stride, compression, ...
+# - static.npz: geometry of the environment and fixed properties of the agents
+# - chunk_<k>_<field>.npy: memory-mapped arrays of `chunk_frames` frames each, with
+#   the time, the positions, the velocities and the flags (active, safe, fail)
+#
+# With "delta" compression the first frame of every chunk is a keyframe stored in
+# float32 and the others are float16 differences from the previous frame.
+
+COMPRESSIONS = ("none", "float16", "delta")
+
+ACTIVE, SAFE, FAIL = 1, 2, 4
+
+class TrajectoryRecorder:
+    '''
+    Stream the state of the crowd of an environment to memory-mapped files on disk,
+    one frame every `stride` calls to record(). The files of a chunk are preallocated
+    when its first frame is recorded, hence memory does not grow with the length of
+    the run. Agents must not be added after the first frame.
+
+    :param compression: "none" (float32), "float16" (about 3 significant digits,
+                        e.g. ~3 cm at 50 m) or "delta" (float16 differences from the
+                        previous frame, without accumulating the rounding errors)
+    '''
+
+    def __init__(self, path, stride=1, compression="none", chunk_frames=1024):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Compression " + str(compression) + " not recognized.")
+        assert stride >= 1 and chunk_frames >= 1, "Stride and chunk size must be positive"
+        self.path = path
+        self.stride = int(stride)
+        self.compression = compression
+        self.chunk_frames = int(chunk_frames)
+
+        self.calls = 0
+        self.frames = 0
+        self.num_agents = None
+        self.chunk = None
+        self.previous = None  # last frame as decoded by the reader (delta compression)
+        os.makedirs(path, exist_ok=True)
+
+    def record(self, env):
+        '''Record the current state of `env` (only once every `stride` calls)'''
+        self.calls += 1
+        if (self.calls - 1) % self.stride != 0:
+            return
+
+        crowd = env.crowd
+        if self.num_agents is None:
+            self._write_static(env)
+        elif crowd.size != self.num_agents:
+            raise ValueError("Agents cannot be added to a recorded simulation.")
+
+        position = self.frames % self.chunk_frames
+        if position == 0:
+            self._open_chunk(self.frames // self.chunk_frames)
+
+        n = self.num_agents
+        self.chunk["time"][position] = env.simulation_time
+        self.chunk["flags"][position] = crowd.active[:n] * ACTIVE + crowd.safe[:n] * SAFE + crowd.fail[:n] * FAIL
+        for name in ("pos", "vel"):
+            value = getattr(crowd, name)[:n]
+            if self.compression != "delta":
+                self.chunk[name][position] = value
+            elif position == 0:
+                self.chunk[name + "_key"][...] = value
+                self.chunk[name][position] = 0
+                self.previous[name] = self.chunk[name + "_key"].astype(float)
+            else:
+                delta = (value - self.previous[name]).astype(np.float16)
+                self.chunk[name][position] = delta
+                self.previous[name] += delta
+        self.frames += 1
+
+    def close(self):
+        '''Flush the chunks and write the number of frames recorded'''
+        self._flush()
+        self.chunk = None
+
+    def _open_chunk(self, k):
+        self._flush()
+        dtype = np.float32 if self.compression == "none" else np.float16
+        shape = (self.chunk_frames, self.num_agents)
+        self.chunk = {
+            "time": self._memmap(k, "time", np.float64, shape[:1]),
+            "flags": self._memmap(k, "flags", np.uint8, shape),
+            "pos": self._memmap(k, "pos", dtype, shape + (2,)),
+            "vel": self._memmap(k, "vel", dtype, shape + (2,)),
+        }
+        if self.compression == "delta":
+            self.chunk["pos_key"] = self._memmap(k, "pos_key", np.float32, (self.num_agents, 2))
+            self.chunk["vel_key"] = self._memmap(k, "vel_key", np.float32, (self.num_agents, 2))
+            self.previous = dict()
+
+    def _memmap(self, k, field, dtype, shape):
+        return np.lib.format.open_memmap(chunk_file(self.path, k, field), mode="w+", dtype=dtype, shape=shape)
+
+    def _flush(self):
+        if self.chunk is not None:
+            for array in self.chunk.values():
+                array.flush()
+        if self.num_agents is not None:
+            self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "frames": self.frames,
+            "num_agents": self.num_agents,
+            "stride": self.stride,
+            "compression": self.compression,
+            "chunk_frames": self.chunk_frames,
+        }
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    def _write_static(self, env):
+        crowd = env.crowd
+        self.num_agents = crowd.size
+        agents = sorted(env.agents, key=lambda agent: agent.index)
+        uid = np.full(crowd.size, -1, dtype=int)
+        color = np.full((crowd.size, 3), 255, dtype=int)
+        for agent in agents:
+            uid[agent.index] = agent.id
+            color[agent.index] = agent.color
+        np.savez(
+            os.path.join(self.path, "static.npz"),
+            name=np.array(str(env.name)),
+            algorithm=np.array(str(env.algorithm)),
+            dimensions=np.array(env.get_dimensions(), dtype=float),
+            walls=np.array(env.walls, dtype=float).reshape(-1, 2, 2),
+            exits=np.array(env.exits, dtype=float).reshape(-1, 2, 2),
+            initial_agent_count=np.array(env.initial_agent_count),
+            agent_id=uid,
+            agent_color=color,
+            radius=crowd.radius[:crowd.size].copy(),
+            mass=crowd.mass[:crowd.size].copy(),
+            max_speed=crowd.max_speed[:crowd.size].copy(),
+        )
+        self._write_meta()
+
+
+class TrajectoryReader:
+    '''Frames of a directory written by TrajectoryRecorder, decoded as float64 arrays'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        with np.load(os.path.join(path, "static.npz")) as data:
+            self.static = dict(data)
+        self.chunk_frames = self.meta["chunk_frames"]
+        self._chunks = dict()
+        self._decoded = None  # (frame, pos, vel) of the last decoded frame (delta compression)
+
+    def __len__(self):
+        return self.meta["frames"]
+
+    def time(self, i):
+        k, position = divmod(i, self.chunk_frames)
+        return float(self._chunk(k)["time"][position])
+
+    def frame(self, i):
+        '''
+        State of the crowd at frame `i`: time, positions, velocities and the flags
+        active, safe and fail, one row per agent (crowd index). Frames read in order
+        (or skipping forward) are decoded incrementally.
+        '''
+        if not 0 <= i < len(self):
+            raise IndexError("Frame " + str(i) + " out of range.")
+        k, position = divmod(i, self.chunk_frames)
+        chunk = self._chunk(k)
+
+        if self.meta["compression"] != "delta":
+            pos = chunk["pos"][position].astype(float)
+            vel = chunk["vel"][position].astype(float)
+        else:
+            # from the keyframe (or from the last decoded frame of the same chunk, if
+            # not after i), adding the differences in the same order as the recorder
+            if self._decoded is not None and i - position <= self._decoded[0] <= i:
+                first, pos, vel = self._decoded[0] - (i - position) + 1, self._decoded[1].copy(), self._decoded[2].copy()
+            else:
+                first, pos, vel = 1, chunk["pos_key"].astype(float), chunk["vel_key"].astype(float)
+            for p in range(first, position + 1):
+                pos += chunk["pos"][p]
+                vel += chunk["vel"][p]
+        if self.meta["compression"] == "delta":
+            self._decoded = (i, pos.copy(), vel.copy())
+
+        flags = chunk["flags"][position]
+        return {
+            "time": float(chunk["time"][position]),
+            "pos": pos,
+            "vel": vel,
+            "active": (flags & ACTIVE) > 0,
+            "safe": (flags & SAFE) > 0,
+            "fail": (flags & FAIL) > 0,
+        }
+
+    def environment(self):
+        '''
+        Environment with the recorded geometry and one bare agent per crowd row, to
+        be updated with load_frame (e.g. to replay the run with the Visualizer)
+        '''
+        from environments.environment import Environment
+        from environments.agent import Agent
+        from environments.crowd import CrowdState
+
+        s = self.static
+        env = Environment(name=str(s["name"]), dimensions=tuple(float(v) for v in s["dimensions"]), walls=[], exits=[])
+        env.walls = [tuple(tuple(float(c) for c in point) for point in wall) for wall in s["walls"]]
+        env.exits = [tuple(tuple(float(c) for c in point) for point in exit) for exit in s["exits"]]
+        env.invalidate_geometry()
+        env.algorithm = str(s["algorithm"])
+
+        n = self.meta["num_agents"]
+        env.crowd = CrowdState(n)
+        env.crowd.size = n
+        for name in ("radius", "mass", "max_speed"):
+            getattr(env.crowd, name)[:n] = s[name]
+        env.replay_agents = []
+        for index in range(n):
+            agent = Agent.bare(env, int(s["agent_id"][index]), index)
+            agent.color = tuple(int(c) for c in s["agent_color"][index])
+            env.replay_agents.append(agent)
+        self.load_frame(env, 0)
+        env.initial_agent_count = int(s["initial_agent_count"])
+        return env
+
+    def load_frame(self, env, i):
+        '''Copy frame `i` into an environment built by environment()'''
+        frame = self.frame(i)
+        n = self.meta["num_agents"]
+        crowd = env.crowd
+        crowd.pos[:n] = frame["pos"]
+        crowd.vel[:n] = frame["vel"]
+        for name in ("active", "safe", "fail"):
+            getattr(crowd, name)[:n] = frame[name]
+        env.agents = [agent for agent in env.replay_agents if crowd.active[agent.index]]
+        env.agents_by_index = {agent.index: agent for agent in env.agents}
+        env.simulation_time = frame["time"]
+        return frame
+
+    def _chunk(self, k):
+        if k not in self._chunks:
+            fields = ("time", "flags", "pos", "vel")
+            if self.meta["compression"] == "delta":
+                fields += ("pos_key", "vel_key")
+            self._chunks[k] = {field: np.load(chunk_file(self.path, k, field), mmap_mode="r") for field in fields}
+        return self._chunks[k]
+
+
+def chunk_file(path, k, field):
+    return os.path.join(path, "chunk_{:05d}_{}.npy".format(k, field))
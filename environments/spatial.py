@@ -0,0 +1,247 @@
+import numpy as np
+from environments.utils import segment_hits
+
+class SpatialHash:
+    '''
+    Uniform-grid cell list over the points of a rectangular world.
+
+    Points are sorted by cell (row-major), so that the points of consecutive
+    cells of the same row are contiguous: any neighborhood query becomes a few
+    slices, one per row of cells. Points outside the world are assigned to the
+    closest border cell, hence queries stay exact for them too.
+    '''
+
+    def __init__(self, dimensions, cell_size=1.0):
+        self.width, self.height = float(dimensions[0]), float(dimensions[1])
+        self.cell_size = None
+        self.cols = self.rows = 0
+        self.set_cell_size(cell_size)
+
+        self.ids = np.zeros(0, dtype=int)
+        self.points = np.zeros((0, 2))
+        self.cells = np.zeros((0, 2), dtype=int)
+        self.cell_start = np.zeros(self.cols * self.rows + 1, dtype=int)
+
+    def set_cell_size(self, cell_size):
+        assert cell_size > 0, "Cell size must be positive"
+        self.cell_size = float(cell_size)
+        self.cols = max(int(np.ceil(self.width / self.cell_size)), 1)
+        self.rows = max(int(np.ceil(self.height / self.cell_size)), 1)
+
+    def _cell_of(self, points):
+        cx = np.clip(np.floor(points[..., 0] / self.cell_size), 0, self.cols - 1).astype(int)
+        cy = np.clip(np.floor(points[..., 1] / self.cell_size), 0, self.rows - 1).astype(int)
+        return cx, cy
+
+    def build(self, points, ids=None):
+        '''
+        Index `points` (shape (N, 2)). `ids` are the identifiers returned by the
+        queries (e.g. the crowd indices of the agents), by default 0..N-1.
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if ids is None:
+            ids = np.arange(len(points))
+
+        cx, cy = self._cell_of(points)
+        keys = cy * self.cols + cx
+        order = np.argsort(keys, kind="stable")
+
+        self.points = points[order]
+        self.ids = np.asarray(ids)[order]
+        self.cells = np.stack((cx[order], cy[order]), axis=1)
+
+        counts = np.bincount(keys, minlength=self.cols * self.rows)
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query_radius(self, point, radius):
+        '''Ids of the indexed points within `radius` from `point`'''
+        if len(self.ids) == 0:
+            return self.ids
+
+        point = np.asarray(point, dtype=float)
+        x0, y0 = self._cell_of(point - radius)
+        x1, y1 = self._cell_of(point + radius)
+
+        # one contiguous slice for every row of cells
+        rows = np.arange(y0, y1 + 1)
+        starts = self.cell_start[rows * self.cols + x0]
+        stops = self.cell_start[rows * self.cols + x1 + 1]
+        candidates = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+
+        d = self.points[candidates] - point
+        close = d[:, 0] ** 2 + d[:, 1] ** 2 <= radius ** 2
+        return self.ids[candidates[close]]
+
+    def query_pairs(self, radius):
+        '''
+        All the pairs of indexed points closer than `radius`, each pair once.
+
+        :return: two arrays (i, j) of ids
+        '''
+        n = len(self.ids)
+        if n < 2:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+        reach_x = min(int(np.ceil(radius / self.cell_size)), self.cols - 1)
+        reach_y = min(int(np.ceil(radius / self.cell_size)), self.rows - 1)
+
+        cx, cy = self.cells[:, 0], self.cells[:, 1]
+        x0 = np.maximum(cx - reach_x, 0)
+        x1 = np.minimum(cx + reach_x, self.cols - 1)
+        own = np.arange(n)
+
+        all_i, all_j = [], []
+        # Each point is paired with the following points of its own row of cells
+        # and with all the points of the rows above it: every pair is seen once
+        for dy in range(reach_y + 1):
+            ny = cy + dy
+            inside = ny < self.rows
+            ny = np.minimum(ny, self.rows - 1)
+            starts = self.cell_start[ny * self.cols + x0]
+            stops = self.cell_start[ny * self.cols + x1 + 1]
+            if dy == 0:
+                starts = np.maximum(starts, own + 1)
+            counts = np.where(inside, np.maximum(stops - starts, 0), 0)
+
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            i = np.repeat(own, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = np.repeat(starts, counts) + offsets
+
+            d = self.points[i] - self.points[j]
+            close = d[:, 0] ** 2 + d[:, 1] ** 2 < radius ** 2
+            all_i.append(i[close])
+            all_j.append(j[close])
+
+        if len(all_i) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        i = np.concatenate(all_i)
+        j = np.concatenate(all_j)
+        return self.ids[i], self.ids[j]
+
+
+class VerletList:
+    '''
+    Verlet neighbor list: the pairs closer than `cutoff + skin`, reused over many
+    steps. The list is rebuilt (with a spatial hash) only when some agent has moved
+    more than half the skin since the last rebuild, because until then no pair
+    can have come closer than `cutoff` without being in the list.
+    '''
+
+    def __init__(self, dimensions, cutoff, skin=0.3):
+        assert skin > 0, "Skin distance must be positive"
+        self.cutoff = cutoff
+        self.skin = skin
+        self.spatial_hash = SpatialHash(dimensions, cell_size=cutoff + skin)
+
+        self.ref_pos = None
+        self.members = None
+        self.i = np.zeros(0, dtype=int)
+        self.j = np.zeros(0, dtype=int)
+
+        # statistics
+        self.steps = 0
+        self.rebuilds = 0
+        self.agents_sum = 0
+        self.pairs_sum = 0
+
+    def _needs_rebuild(self, pos, idx):
+        if self.ref_pos is None or len(self.ref_pos) != len(pos):
+            return True
+        if not np.all(self.members[idx]):
+            return True
+        if len(idx) == 0:
+            return False
+        d = pos[idx] - self.ref_pos[idx]
+        return np.max(d[:, 0] ** 2 + d[:, 1] ** 2) > (self.skin / 2) ** 2
+
+    def rebuild(self, pos, idx):
+        self.spatial_hash.build(pos[idx], idx)
+        self.i, self.j = self.spatial_hash.query_pairs(self.cutoff + self.skin)
+        self.ref_pos = pos.copy()
+        self.members = np.zeros(len(pos), dtype=bool)
+        self.members[idx] = True
+        self.rebuilds += 1
+
+    def pairs(self, pos, idx):
+        '''
+        Candidate interacting pairs (i, j) among the agents `idx`.
+
+        :param pos: positions of the whole crowd, indexed by crowd index
+        :param idx: crowd indices of the agents in the simulation
+        '''
+        if self._needs_rebuild(pos, idx):
+            self.rebuild(pos, idx)
+        elif len(idx) < np.count_nonzero(self.members):
+            # some agents left the simulation, drop their pairs
+            self.members[:] = False
+            self.members[idx] = True
+            keep = self.members[self.i] & self.members[self.j]
+            self.i, self.j = self.i[keep], self.j[keep]
+
+        self.steps += 1
+        self.agents_sum += len(idx)
+        self.pairs_sum += len(self.i)
+        return self.i, self.j
+
+    def statistics(self):
+        return {
+            "steps": self.steps,
+            "rebuilds": self.rebuilds,
+            "rebuild_frequency": self.rebuilds / self.steps if self.steps > 0 else 0.0,
+            # every pair is in the list of both its agents
+            "average_list_length": 2 * self.pairs_sum / self.agents_sum if self.agents_sum > 0 else 0.0,
+        }
+
+
+class SegmentGrid:
+    '''
+    Static uniform-grid index over segments (e.g. the walls or the exits of an
+    environment, compiled in a SegmentTable). Every segment is registered in the
+    cells covered by its bounding box, so a query only tests the segments
+    registered in the cells covered by the bounding box of the query segment.
+    '''
+
+    def __init__(self, table, dimensions, cell_size=1.0):
+        self.table = table
+        self.grid = SpatialHash(dimensions, cell_size)
+
+        lower = np.minimum(table.start, table.end)
+        upper = np.maximum(table.start, table.end)
+        x0, y0 = self.grid._cell_of(lower)
+        x1, y1 = self.grid._cell_of(upper)
+
+        cells = [[] for _ in range(self.grid.cols * self.grid.rows)]
+        for s in range(len(table)):
+            for cy in range(y0[s], y1[s] + 1):
+                for cx in range(x0[s], x1[s] + 1):
+                    cells[cy * self.grid.cols + cx].append(s)
+        # segment ids of every cell, sorted
+        self.cells = [np.array(c, dtype=int) for c in cells]
+
+    def candidates(self, a, b):
+        '''Sorted ids of the segments whose cells overlap the bounding box of a-b'''
+        points = np.array((a, b), dtype=float)
+        x0, y0 = self.grid._cell_of(points.min(axis=0))
+        x1, y1 = self.grid._cell_of(points.max(axis=0))
+        if x0 == x1 and y0 == y1:
+            return self.cells[y0 * self.grid.cols + x0]
+
+        cols = self.grid.cols
+        ids = [self.cells[cy * cols + cx] for cy in range(y0, y1 + 1) for cx in range(x0, x1 + 1)]
+        return np.unique(np.concatenate(ids))
+
+    def first_hit(self, a, b):
+        '''Lowest id of the segments crossed by a-b (as in segments_intersect), or None'''
+        ids = self.candidates(a, b)
+        if len(ids) == 0:
+            return None
+        hits = segment_hits(a, b, self.table.start[ids], self.table.end[ids])
+        if not np.any(hits):
+            return None
+        return int(ids[np.argmax(hits)])
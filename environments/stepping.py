@@ -0,0 +1,109 @@
+import numpy as np
+
+class AdaptiveStepper:
+    '''
+    Adaptive time step for the social-force simulators.
+
+    The step is chosen at the beginning of every simulation step so that no free
+    agent moves more than `cfl` times its radius, neither because of its speed
+    nor because of its acceleration, within [min_dt, max_dt]. The stiff contact
+    terms of the model are integrated only for the agents in contact (or that can
+    touch another agent or a wall within the step): they are sub-stepped with
+    steps not longer than `min_dt`, i.e. the fixed time step of the simulation.
+    '''
+
+    def __init__(self, min_dt, max_dt=0.1, cfl=0.5):
+        assert 0 < min_dt <= max_dt, "Time steps must be positive, with min_dt <= max_dt"
+        assert cfl > 0, "CFL number must be positive"
+        self.min_dt = min_dt
+        self.max_dt = max_dt
+        self.cfl = cfl
+
+        # statistics
+        self.steps = 0
+        self.time = 0.0
+        self.substeps = 0
+        self.contacts_sum = 0
+        self.agents_sum = 0
+
+    def contacts(self, crowd, idx, pairs, walls):
+        '''
+        Boolean mask of the agents in `idx` in contact: closer to another agent
+        than (1 + cfl) times the sum of the radii, or closer to a wall than (1 + cfl)
+        times their radius. Agents moving at most cfl times their radius per step
+        cannot touch anything else within the step.
+        '''
+        in_contact = np.zeros(crowd.size, dtype=bool)
+
+        i, j = pairs
+        if len(i) > 0:
+            d = crowd.pos[i] - crowd.pos[j]
+            touching = np.sqrt(d[:, 0] ** 2 + d[:, 1] ** 2) < (1 + self.cfl) * (crowd.radius[i] + crowd.radius[j])
+            in_contact[i[touching]] = True
+            in_contact[j[touching]] = True
+
+        if len(walls) > 0 and len(idx) > 0:
+            _, dist = walls.closest_points(crowd.pos[idx])
+            in_contact[idx[np.any(dist < (1 + self.cfl) * crowd.radius[idx, None], axis=1)]] = True
+
+        return in_contact[idx]
+
+    def plan(self, crowd, idx, pairs, walls):
+        '''
+        Choose the next step for the agents `idx`, whose forces have already been
+        computed, given the interacting `pairs` of crowd indices and the `walls`.
+
+        :return: the time step, the crowd indices of the agents in contact and the
+                 number of sub-steps to use for them
+        '''
+        idx = np.asarray(idx, dtype=int)
+        contact = self.contacts(crowd, idx, pairs, walls)
+        free = idx[~contact]
+
+        dt = self.max_dt
+        if len(free) > 0:
+            radius = crowd.radius[free]
+            speed = np.linalg.norm(crowd.vel[free], axis=1)
+            acc = np.linalg.norm(crowd.f_desired[free] + (crowd.f_agents[free] + crowd.f_walls[free]) / crowd.mass[free, None], axis=1)
+
+            # CFL-like bounds: speed * dt <= cfl * r and acc * dt^2 / 2 <= cfl * r
+            with np.errstate(divide="ignore"):
+                dt = min(dt, np.min(self.cfl * radius / speed), np.min(np.sqrt(2 * self.cfl * radius / acc)))
+        dt = float(max(dt, self.min_dt))
+        n_sub = int(np.ceil(dt / self.min_dt - 1e-9))
+
+        self.steps += 1
+        self.time += dt
+        self.contacts_sum += int(np.count_nonzero(contact))
+        self.agents_sum += len(idx)
+        self.substeps += n_sub * int(np.count_nonzero(contact))
+        return dt, idx[contact], n_sub
+
+    def substep(self, agent_class, crowd, contact, pairs, walls, dt, n_sub, move, rng=None):
+        '''
+        Advance the agents in `contact` of `dt` in `n_sub` sub-steps, calling
+        `move(sub_dt)` to move them once. Their forces are the ones already stored
+        for the first sub-step, and are recomputed for the next ones; the agents
+        not in contact stay where they are meanwhile. `rng` is used by the forces
+        of overlapping agents.
+        '''
+        i, j = pairs
+        involved = np.zeros(crowd.size, dtype=bool)
+        involved[contact] = True
+        keep = involved[i] | involved[j]
+        contact_pairs = (i[keep], j[keep])
+
+        sub_dt = dt / n_sub
+        for s in range(n_sub):
+            if s > 0:
+                agent_class.crowd_repulsive_forces(crowd, contact, contact_pairs, rng=rng)
+                agent_class.crowd_obstacle_forces(crowd, contact, walls, rng=rng)
+            move(sub_dt)
+
+    def statistics(self):
+        return {
+            "steps": self.steps,
+            "average_time_step": self.time / self.steps if self.steps > 0 else 0.0,
+            "contact_fraction": self.contacts_sum / self.agents_sum if self.agents_sum > 0 else 0.0,
+            "contact_substeps": self.substeps,
+        }
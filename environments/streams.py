@@ -0,0 +1,40 @@
+import numpy as np
+
+class RandomStreams:
+    '''
+    Independent random generators of one simulation run, all derived from the
+    same seed (numpy SeedSequence), one for every use:
+
+    - spawn: positions, parameters and targets of the agents
+    - graph: construction of the graphs (e.g. PRM sampling)
+    - aco: ant colony optimization
+    - noise: random numbers used while the simulation runs
+
+    Since the streams are independent, e.g. changing the number of ACO iterations
+    does not change where the agents are spawned. A seed of None gives fresh,
+    unpredictable streams.
+    '''
+
+    NAMES = ("spawn", "graph", "aco", "noise")
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.seed_sequence = np.random.SeedSequence(seed)
+        for name, child in zip(self.NAMES, self.seed_sequence.spawn(len(self.NAMES))):
+            setattr(self, name, np.random.Generator(np.random.PCG64(child)))
+
+    def step_noise(self, size, per_agent):
+        '''
+        One block of uniform numbers in [0, 1) for one simulation step, shape
+        (size, per_agent): the row of every agent is given by its crowd index, so
+        that the numbers of an agent do not depend on the order of the updates.
+        '''
+        return self.noise.random((size, per_agent))
+
+    def state(self):
+        '''Internal state of all the generators (e.g. to save a checkpoint)'''
+        return {name: getattr(self, name).bit_generator.state for name in self.NAMES}
+
+    def set_state(self, state):
+        for name in self.NAMES:
+            getattr(self, name).bit_generator.state = state[name]
@@ -0,0 +1,120 @@
+import collections
+import numpy as np
+
+# Reasons for the end of a simulation, recorded in its results
+ALL_ESCAPED = "all_escaped"     # every agent reached an exit
+TIME_LIMIT = "time_limit"       # simulation time budget used up
+GRIDLOCK = "gridlock"           # no escape and no agent making progress within the window
+NO_PATH = "no_path"             # every agent left has no path to an exit (marked `fail`)
+MAX_STEPS = "max_steps"         # number of steps requested reached
+STOPPED = "stopped"             # stopped from outside (e.g. the window was closed)
+BLOW_UP = "blow_up"             # numerical blow-up: non-finite values, runaway speeds or agents out of the world
+
+class TerminationDetector:
+    '''
+    Early termination of the runs that cannot make progress any more, e.g. with the
+    agents left stuck behind walls or oscillating against a wall.
+
+    The positions of the agents and the number of agents escaped are sampled every
+    `window` / `samples` seconds of simulation. A run is in gridlock when, over the
+    last `window` seconds, no agent escaped and no agent still moving got farther
+    than `min_displacement` meters from where it was: agents oscillating in place do
+    not count as progress. A run with only `fail` agents left has no path to an exit.
+    '''
+
+    def __init__(self, window=5.0, min_displacement=0.5, samples=10):
+        assert window > 0 and samples >= 1, "Window and number of samples must be positive"
+        self.window = float(window)
+        self.min_displacement = float(min_displacement)
+        self.interval = self.window / samples
+        self.history = collections.deque()
+        self.reason = None
+
+    def check(self, env, escaped):
+        '''
+        To be called after every step of the simulation of `env`, with the number of
+        agents escaped so far.
+
+        :return: GRIDLOCK or NO_PATH if the run should end, None otherwise
+        '''
+        crowd = env.crowd
+        moving = crowd.active[:crowd.size] & ~crowd.fail[:crowd.size]
+        if not np.any(moving):
+            if np.any(crowd.active[:crowd.size]):
+                self.reason = NO_PATH
+            return self.reason
+
+        now = env.simulation_time
+        if len(self.history) > 0 and now - self.history[-1][0] < self.interval - 1e-9:
+            return None
+        self.history.append((now, escaped, crowd.pos[:crowd.size].copy()))
+        # keep the most recent sample at least `window` seconds old
+        while len(self.history) > 1 and now - self.history[1][0] >= self.window - 1e-9:
+            self.history.popleft()
+
+        start, escaped_then, pos_then = self.history[0]
+        if now - start < self.window - 1e-9 or escaped > escaped_then:
+            return None
+        d = crowd.pos[:crowd.size][moving] - pos_then[moving]
+        if np.max(d[:, 0] ** 2 + d[:, 1] ** 2) < self.min_displacement ** 2:
+            self.reason = GRIDLOCK
+        return self.reason
+
+    def reset(self):
+        self.history.clear()
+        self.reason = None
+
+
+class HealthCheck:
+    '''
+    Cheap checks, after every step, of the state of the active agents, to abort the
+    runs whose integration blew up (e.g. with unstable boids weights or PSO
+    coefficients) instead of integrating them up to the time limit: non-finite
+    positions or velocities, kinetic energy spikes (speeds above `speed_factor`
+    times the maximum speed of the agent), jumps of the positions (moves since the
+    previous check longer than what that speed allows, plus `margin` meters, e.g.
+    the boids, whose velocity is clamped, pushed away by their wall collisions) and
+    agents farther than `margin` meters outside the world, e.g. after going through
+    a wall. The maximum speed is the crowd field `max_speed`, the speed cap of the
+    algorithm of the agents. One HealthCheck per simulation.
+    '''
+
+    def __init__(self, speed_factor=10.0, margin=1.0):
+        self.speed_factor = float(speed_factor)
+        self.margin = float(margin)
+        self.problem = None
+        self.last = None  # simulation time and positions of the previous check
+
+    def check(self, env):
+        '''
+        :return: BLOW_UP if the state of `env` is broken (described by `problem`),
+                 None otherwise
+        '''
+        crowd = env.crowd
+        active = crowd.active[:crowd.size]
+        pos = crowd.pos[:crowd.size][active]
+        vel = crowd.vel[:crowd.size][active]
+        max_speed = crowd.max_speed[:crowd.size][active]
+        now = env.simulation_time
+
+        if not (np.all(np.isfinite(pos)) and np.all(np.isfinite(vel))):
+            self.problem = "non-finite positions or velocities"
+        elif np.any(vel[:, 0] ** 2 + vel[:, 1] ** 2 > (self.speed_factor * max_speed) ** 2):
+            self.problem = "speed above " + str(self.speed_factor) + " times the maximum speed"
+        elif len(pos) > 0 and (np.min(pos) < -self.margin or np.any(pos > np.array([env.get_width(), env.get_height()]) + self.margin)):
+            self.problem = "agents outside the world"
+        elif self._jumped(crowd, active, now):
+            self.problem = "positions jumping farther than " + str(self.speed_factor) + " times the maximum speed allows"
+        else:
+            self.last = (now, crowd.pos[:crowd.size].copy())
+            return None
+        return BLOW_UP
+
+    def _jumped(self, crowd, active, now):
+        if self.last is None:
+            return False
+        then, pos_then = self.last
+        rows = np.flatnonzero(active[:len(pos_then)])
+        d = crowd.pos[rows] - pos_then[rows]
+        reach = self.speed_factor * crowd.max_speed[rows] * (now - then) + self.margin
+        return bool(np.any(d[:, 0] ** 2 + d[:, 1] ** 2 > reach ** 2))
@@ -1,5 +1,12 @@
 import numpy as np
 
+def vector_norms(v):
+    '''
+    Norms of the rows of v (shape (Q, 2)), rounded as np.linalg.norm of every single
+    row (a dot product), so that the vectorized code reproduces the per-row one exactly
+    '''
+    return np.sqrt((v[:, None, :] @ v[:, :, None])[:, 0, 0])
+
 def segments_intersect(A, B, C, D):
     def orient(p, q, r):
         return np.cross(q - p, r - p)
@@ -20,6 +27,59 @@ def segments_intersect(A, B, C, D):
 
     return False
 
+def segments_intersect_matrix(A, B, C, D):
+    '''
+    Vectorized segments_intersect: tests every query segment A[q]-B[q] against
+    every obstacle segment C[s]-D[s] with the same strict-crossing test.
+
+    :param A, B: query segments end points, shape (Q, 2)
+    :param C, D: obstacle segments end points, shape (S, 2)
+    :return: boolean matrix, shape (Q, S)
+    '''
+    A = np.asarray(A, dtype=float).reshape(-1, 2)[:, None, :]
+    B = np.asarray(B, dtype=float).reshape(-1, 2)[:, None, :]
+    C = np.asarray(C, dtype=float).reshape(-1, 2)[None, :, :]
+    D = np.asarray(D, dtype=float).reshape(-1, 2)[None, :, :]
+
+    def orient(p, q, r):
+        u = q - p
+        v = r - p
+        return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+    o1 = orient(A, B, C)
+    o2 = orient(A, B, D)
+    o3 = orient(C, D, A)
+    o4 = orient(C, D, B)
+
+    return (o1 * o2 < 0) & (o3 * o4 < 0)
+
+def first_intersection(A, B, C, D, chunk_size=4096):
+    '''
+    Index of the first obstacle segment C[s]-D[s] crossed by each query segment
+    A[q]-B[q], or -1 if none is crossed (see segments_intersect_matrix). Queries
+    are processed in chunks to bound the memory used.
+
+    :return: integer array, shape (Q,)
+    '''
+    A = np.asarray(A, dtype=float).reshape(-1, 2)
+    B = np.asarray(B, dtype=float).reshape(-1, 2)
+    result = np.full(len(A), -1, dtype=int)
+    if len(C) == 0:
+        return result
+
+    for start in range(0, len(A), chunk_size):
+        hits = segments_intersect_matrix(A[start:start + chunk_size], B[start:start + chunk_size], C, D)
+        crossed = np.any(hits, axis=1)
+        result[start:start + chunk_size] = np.where(crossed, np.argmax(hits, axis=1), -1)
+    return result
+
+def segment_hits(A, B, starts, ends):
+    '''
+    Same test of segments_intersect between the segment A-B and many segments
+    starts[k]-ends[k] (arrays of shape (K, 2)), returned as a boolean array.
+    '''
+    return segments_intersect_matrix(A, B, starts, ends)[0]
+
 def path_intersection_in_time(p1, v1, p2, v2, dt, eps=1e-8):
     dp = p1 - p2
     dv = v1 - v2
@@ -1,10 +1,16 @@
 import numpy as np
 import asyncio
+import multiprocessing
 import time
 
 from environments.environment import Environment
 from parser.config import Config
 from environments.scenarios import get_scenario_by_name
+from backends import set_backend
+from environments.recorder import TrajectoryRecorder, TrajectoryReader
+from environments.ensemble import Ensemble
+from environments.framebuffer import SharedFrameBuffer
+from environments.termination import TerminationDetector, HealthCheck, ALL_ESCAPED, TIME_LIMIT, MAX_STEPS, STOPPED
 
 config = Config("resources/config.yaml")
 if config.visualization:
@@ -19,39 +25,117 @@ async def visualization_loop(visualizer):
         visualizer.create_drawing()
         await asyncio.sleep(0)  # yield control
 
-async def main_program(world, config, visualizer=None):
-    if visualizer is not None:
-        assert isinstance(visualizer, Visualizer)
-    loop = asyncio.get_running_loop()
-    
-    num_agents = config.num_agents 
-    dt = config.dt
+def create_environment(config):
+    '''Scenario of the config with its agents, seeded by config.random_seed'''
+    if config.world_type == "custom":
+        env = Environment(
+            name=config.world_name,
+            dimensions=config.world_dimensions,
+            exits=config.exits,
+            walls=config.walls,
+            agents=[config.num_agents, config.algorithm], 
+            config = config
+            #agents_spawn_method=config.spawn_agent_method
+        )
+    else:
+        env = get_scenario_by_name(config.world_type, agents = [config.num_agents, config.algorithm], config = config)
+        if env is None:
+            raise ValueError("Scenario " + str(config.world_type) + " not recognized.")
+    return env
+
+def create_simulator(world, config, **shared):
+    '''
+    :param shared: precomputed fields of another simulation of the same scenario
+                   (e.g. fitness_map for PSO), instead of computing them again
+    '''
+    set_backend(getattr(config, "backend", "numpy"))
     
     if config.algorithm == "boids":
         from boids_algorithm.crowdSimulator import CrowdSimulator
-        sim = CrowdSimulator(world, config = config)
-        print("Starting Boids algorithm simulation with " + str(num_agents) + " agents.")
+        sim = CrowdSimulator(world, config = config, **shared)
+        print("Starting Boids algorithm simulation with " + str(config.num_agents) + " agents.")
     elif config.algorithm == "aco":
         from aco_algorithm.crowdSimulator import CrowdSimulator
-        sim = CrowdSimulator(world, config = config)
-        
-        if visualizer is not None:
-            visualizer.associate_graph(sim.aco_env)
-            visualizer.enable_graph()
-            
+        sim = CrowdSimulator(world, config = config, **shared)
         # print("Starting ACO algorithm simulation with " + str(num_agents) + " agents.")
     elif config.algorithm == "pso":
         from pso_algorithm.crowdSimulator import CrowdSimulator
-        sim = CrowdSimulator(world, config = config)
+        sim = CrowdSimulator(world, config = config, **shared)
     else:
         raise ValueError("Algorithm " + str(config.algorithm) + " not recognized.")
+    return sim
+
+def create_recorder(config):
+    '''Recorder of the trajectories, if a "record" directory is given in the config'''
+    if not getattr(config, "record", ""):
+        return None
+    return TrajectoryRecorder(config.record, getattr(config, "record_stride", 1), getattr(config, "record_compression", "none"))
+
+def simulation_time_limit(config):
+    return max(10, config.num_agents*1.5)
+
+def create_termination_detector(config):
+    '''Detector of the runs without progress, if a "termination-window" is given in the config'''
+    window = getattr(config, "termination_window", 0.0)
+    if not window:
+        return None
+    return TerminationDetector(window, getattr(config, "termination_displacement", 0.5))
+
+def create_health_check(config):
+    '''Checks of the numerical blow-ups, unless disabled by "health-check" in the config'''
+    if not getattr(config, "health_check", True):
+        return None
+    return HealthCheck(getattr(config, "blow_up_speed", 10.0), getattr(config, "bounds_margin", 1.0))
+
+def stop_reason(world, sim, config, detector=None, health=None):
+    '''Reason to end the simulation after the last step (see environments.termination), or None'''
+    if health is not None:
+        reason = health.check(world)
+        if reason is not None:
+            print("Simulation aborted at " + str(world.simulation_time) + " seconds: " + health.problem + ".")
+            return reason
+    if len(sim.agents_escaped) == config.num_agents:
+        return ALL_ESCAPED
+    if world.simulation_time >= simulation_time_limit(config):
+        return TIME_LIMIT
+    if detector is not None:
+        return detector.check(world, len(sim.agents_escaped))
+    return None
+
+def print_statistics(sim):
+    env = getattr(sim, "env", None) or getattr(sim, "world", None)
+    if env is not None and env.profiler.enabled:
+        print("Time of the phases of the simulation steps:\n" + env.profiler.report())
+    if getattr(sim, "neighbor_list", None) is not None:
+        print("Neighbor lists statistics: " + str(sim.neighbor_list.statistics()))
+    if getattr(sim, "stepper", None) is not None:
+        print("Adaptive time stepping statistics: " + str(sim.stepper.statistics()))
+
+async def main_program(world, config, visualizer=None):
+    if visualizer is not None:
+        assert isinstance(visualizer, Visualizer)
+    loop = asyncio.get_running_loop()
+    
+    num_agents = config.num_agents 
+    dt = config.dt
+    
+    sim = create_simulator(world, config)
+    detector = create_termination_detector(config)
+    health = create_health_check(config)
+    recorder = create_recorder(config)
+    if recorder is not None:
+        recorder.record(world)
+    if config.algorithm == "aco" and visualizer is not None:
+        visualizer.associate_graph(sim.aco_env)
+        visualizer.enable_graph()
     
     print("Simulation started")
     if visualizer is not None:
         visualizer.on = True
         await asyncio.sleep(0)
         
-    while world.simulation_time < max(10, config.num_agents*1.5):  # Main executions
+    reason = None
+    while reason is None:  # Main executions
 
         if visualizer is not None:
             if not visualizer.play:
@@ -60,53 +144,296 @@ async def main_program(world, config, visualizer=None):
         
         start = time.time()
         world.simulation_start_time = start
-        sim.update(dt)
+        simulation_time = world.simulation_time
+        with world.profiler.phase("step"):
+            sim.update(dt)
+        if recorder is not None:
+            recorder.record(world)
         end = time.time()
         
-        if (end - start) < dt:
-            await asyncio.sleep(dt - (end - start))
+        # with adaptive time stepping the simulation advances more than dt
+        step = world.simulation_time - simulation_time
+        if (end - start) < step:
+            await asyncio.sleep(step - (end - start))
                     
-        if len(sim.agents_escaped) == num_agents:
-            break
+        reason = stop_reason(world, sim, config, detector, health)
         await asyncio.sleep(0)
         
     if visualizer is not None:
         visualizer.play = False
+    if recorder is not None:
+        recorder.close()
     
-    print("Simulation ended: " + str(len(sim.agents_escaped)) + " agents escaped in " + str(world.simulation_time) + " seconds.")
+    print("Simulation ended (" + reason + "): " + str(len(sim.agents_escaped)) + " agents escaped in " + str(world.simulation_time) + " seconds.")
+    print_statistics(sim)
     
     return world.simulation_time, config.num_agents - len(sim.agents_escaped)
+
+def run_simulation(world, config, max_steps=None, callback=None, callback_every=1):
+    '''
+    Headless synchronous version of main_program: the simulation runs as fast as
+    possible, without any visualization nor real-time pacing.
+    
+    :param max_steps: stop after this number of steps, besides the usual stopping conditions
+    :param callback: called as callback(sim, step) every `callback_every` steps
+    :return: simulation time, number of agents remaining, timing statistics (with
+             the reason of the end of the simulation, "termination")
+    '''
+    num_agents = config.num_agents
+    dt = config.dt
+    
+    start = time.perf_counter()
+    sim = create_simulator(world, config)
+    setup_time = time.perf_counter() - start
+    
+    detector = create_termination_detector(config)
+    health = create_health_check(config)
+    recorder = create_recorder(config)
+    if recorder is not None:
+        recorder.record(world)
+    
+    steps = 0
+    reason = None
+    start = time.perf_counter()
+    while reason is None:
+        if max_steps is not None and steps >= max_steps:
+            reason = MAX_STEPS
+            break
+        
+        with world.profiler.phase("step"):
+            sim.update(dt)
+        steps += 1
+        if recorder is not None:
+            recorder.record(world)
+        
+        if callback is not None and steps % callback_every == 0:
+            callback(sim, steps)
+        
+        reason = stop_reason(world, sim, config, detector, health)
+    run_time = time.perf_counter() - start
+    if recorder is not None:
+        recorder.close()
+    
+    statistics = {
+        "termination": reason,
+        "steps": steps,
+        "setup_time": setup_time,
+        "run_time": run_time,
+        "step_time": run_time / steps if steps > 0 else 0.0,
+        "steps_per_second": steps / run_time if run_time > 0 else 0.0,
+        # simulated seconds per wall-clock second
+        "speedup": world.simulation_time / run_time if run_time > 0 else 0.0,
+    }
+    if getattr(sim, "neighbor_list", None) is not None:
+        statistics["neighbor_lists"] = sim.neighbor_list.statistics()
+    if getattr(sim, "stepper", None) is not None:
+        statistics["time_stepping"] = sim.stepper.statistics()
+    if world.profiler.enabled:
+        statistics["profile"] = world.profiler.summary()
+    return world.simulation_time, num_agents - len(sim.agents_escaped), statistics
+
+def simulation_process(world, config, buffer_name, connection):
+    '''
+    Simulation run in its own process by visualize_simulation_process: the state of
+    the agents is published in the SharedFrameBuffer `buffer_name` after every step,
+    with the same real-time pacing of main_program. The graph of ACO (for drawing
+    it) and finally the simulation time and the agents remaining are sent through
+    `connection`.
+    '''
+    frames = SharedFrameBuffer(world.crowd.size, name=buffer_name)
+    num_agents = config.num_agents
+    dt = config.dt
+    
+    sim = create_simulator(world, config)
+    detector = create_termination_detector(config)
+    health = create_health_check(config)
+    connection.send(("graph", sim.aco_env.get_state() if config.algorithm == "aco" else None))
+    recorder = create_recorder(config)
+    if recorder is not None:
+        recorder.record(world)
+    frames.publish(world)
+    print("Simulation started")
+    
+    reason = None
+    while reason is None:
+        if frames.stopped:
+            reason = STOPPED
+            break
+        if not frames.playing:
+            time.sleep(0.01)
+            continue
+        
+        start = time.time()
+        simulation_time = world.simulation_time
+        with world.profiler.phase("step"):
+            sim.update(dt)
+        frames.publish(world)
+        if recorder is not None:
+            recorder.record(world)
+        end = time.time()
+        
+        step = world.simulation_time - simulation_time
+        if (end - start) < step:
+            time.sleep(step - (end - start))
+        
+        reason = stop_reason(world, sim, config, detector, health)
+    
+    if recorder is not None:
+        recorder.close()
+    frames.finish()
+    print("Simulation ended (" + reason + "): " + str(len(sim.agents_escaped)) + " agents escaped in " + str(world.simulation_time) + " seconds.")
+    print_statistics(sim)
+    connection.send(("end", (world.simulation_time, num_agents - len(sim.agents_escaped))))
+    frames.close()
+
+def visualize_simulation_process(world, config, visualizer, fps=60):
+    '''
+    Version of main_program running the simulation in another process (see
+    simulation_process), while this one draws the latest state published by the
+    simulation at `fps` frames per second: slow steps do not freeze the window,
+    and drawing does not slow down the simulation. The window stays open at the
+    end of the simulation, until it is closed.
+    
+    :return: simulation time and number of agents remaining (None if the window
+             is closed before the end of the simulation)
+    '''
+    frames = SharedFrameBuffer(world.crowd.size)
+    connection, child_connection = multiprocessing.Pipe()
+    # a new interpreter, which does not inherit the window of this process
+    process = multiprocessing.get_context("spawn").Process(target=simulation_process, args=(world, config, frames.name, child_connection))
+    process.start()
+    
+    agents = list(world.agents)
+    if config.algorithm == "pso":
+        from pso_algorithm.psoAgent import GridFitness
+        fitness_map = GridFitness(world)
+        for agent in agents:
+            agent.fitness_map = fitness_map
+    
+    visualizer.set_frame_rate(fps)
+    result = None
+    while visualizer.window_is_open():
+        while connection.poll():
+            message, value = connection.recv()
+            if message == "graph" and value is not None:
+                from aco_algorithm.graphs.basicGraph import BasicGraph
+                visualizer.associate_graph(BasicGraph.from_state(world, value))
+                visualizer.enable_graph()
+            elif message == "end":
+                result = value
+                visualizer.play = False
+        
+        frames.load_latest(world, agents)
+        if frames.frames == 0:
+            visualizer.spawn_algorithm_loading()
+            continue
+        visualizer.on = True
+        frames.set_playing(visualizer.play)
+        visualizer.create_drawing()
+    
+    frames.stop()
+    process.join()
+    frames.close()
+    return result
+
+def run_ensemble(config, replicas=None, max_steps=None):
+    '''
+    Headless simulation of `replicas` (config.ensemble by default) replicas of the
+    scenario with consecutive seeds, all together (see environments.ensemble). Every
+    replica stops under the same conditions of run_simulation, with its own
+    termination detector and health checks.
+    
+    :return: the ensemble (with the results of the replicas) and timing statistics
+    '''
+    replicas = replicas or config.ensemble
+    
+    start = time.perf_counter()
+    ensemble = Ensemble(config, create_environment, create_simulator, replicas)
+    detectors = [create_termination_detector(config) for _ in range(len(ensemble))]
+    healths = [create_health_check(config) for _ in range(len(ensemble))]
+    setup_time = time.perf_counter() - start
+    
+    replica_steps = 0
+    start = time.perf_counter()
+    while len(ensemble.running()) > 0:
+        if max_steps is not None and ensemble.steps >= max_steps:
+            for k in ensemble.running():
+                ensemble.finish(k, MAX_STEPS)
+            break
+        
+        replica_steps += len(ensemble.running())
+        with ensemble.profiler.phase("step"):
+            ensemble.update(config.dt)
+        
+        for k in ensemble.running():
+            reason = stop_reason(ensemble.envs[k], ensemble.sims[k], config, detectors[k], healths[k])
+            if reason is not None:
+                ensemble.finish(k, reason)
+    run_time = time.perf_counter() - start
+    
+    statistics = {
+        "replicas": len(ensemble),
+        "steps": ensemble.steps,
+        "setup_time": setup_time,
+        "run_time": run_time,
+        "step_time": run_time / ensemble.steps if ensemble.steps > 0 else 0.0,
+        # steps of single replicas per wall-clock second
+        "replica_steps_per_second": replica_steps / run_time if run_time > 0 else 0.0,
+    }
+    if ensemble.profiler.enabled:
+        statistics["profile"] = ensemble.profiler.summary()
+    return ensemble, statistics
             
         
 async def initialize_main():
     
-    seed = config.random_seed
-    if seed is not None:
-        np.random.seed(seed)
+    if getattr(config, "replay", ""):
+        # play back recorded trajectories, without running any algorithm
+        from visualization.visualizer import Visualizer
+        if not config.visualization:
+            config.parse_visualization_params(config.get('visualization', {}) or {})
+        reader = TrajectoryReader(config.replay)
+        visualizer = Visualizer(environment=reader.environment(), config=config)
+        visualizer.replay(reader)
+        return
     
-    if config.world_type == "custom":
-        env = Environment(
-            name=config.world_name,
-            dimensions=config.world_dimensions,
-            exits=config.exits,
-            walls=config.walls,
-            agents=[config.num_agents, config.algorithm], 
-            config = config
-            #agents_spawn_method=config.spawn_agent_method
-        )
-    else:
-        env = get_scenario_by_name(config.world_type, agents = [config.num_agents, config.algorithm], config = config)
-        if env is None:
-            raise ValueError("Scenario " + str(config.world_type) + " not recognized.")
+    if getattr(config, "ensemble", 0) > 0:
+        # many seeds at once, always without visualization
+        ensemble, statistics = run_ensemble(config)
+        results = ensemble.results()
+        for result in results:
+            print("Replica with seed " + str(result["seed"]) + " (" + str(result["termination"]) + "): " + str(config.num_agents - result["agents_remaining"]) + " agents escaped in " + str(result["simulation_time"]) + " seconds.")
+        print("Mean over " + str(len(results)) + " replicas: " + str(np.mean([result["agents_remaining"] for result in results])) + " agents remaining, "
+              + str(np.mean([result["simulation_time"] for result in results])) + " seconds.")
+        profile = statistics.pop("profile", None)
+        print("Timing statistics: " + str(statistics))
+        if profile is not None:
+            print("Time of the phases of the simulation steps:\n" + ensemble.profiler.report())
+        return results
+    
+    # the random streams of the simulation are seeded by the environment, from config.random_seed
+    env = create_environment(config)
         
     if config.visualization:
         visualizer = Visualizer(environment=env, config=config)
+        
+        if getattr(config, "separate_process", False):
+            return visualize_simulation_process(env, config, visualizer)
 
         await asyncio.gather(
             visualization_loop(visualizer),
             main_program(env, config, visualizer),
         )
 
+    elif getattr(config, "headless", False):
+        simulation_time, agents_remaining, statistics = run_simulation(env, config)
+        print("Simulation ended (" + statistics["termination"] + "): " + str(config.num_agents - agents_remaining) + " agents escaped in " + str(simulation_time) + " seconds.")
+        profile = statistics.pop("profile", None)
+        print("Timing statistics: " + str(statistics))
+        if profile is not None:
+            print("Time of the phases of the simulation steps:\n" + env.profiler.report())
+        return simulation_time, agents_remaining
+
     else:
         return await main_program(env, config)
 
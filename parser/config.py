@@ -28,6 +28,8 @@ class Config:
         if self.random_seed is not None:
             self.random_seed = int(self.random_seed)
         
+        self.parse_simulation_params(self.config.get('simulation', {}) or {})
+        
         world = self.config.get('world', {})
         self.world_name = world.get('name')
         self.world_type = world.get('type', 'custom')
@@ -84,6 +86,11 @@ class Config:
         self.alpha = float(aco.get('alpha'))
         self.beta = float(aco.get('beta'))
         self.evaporation_rate = float(aco.get('evaporation-rate'))
+        self.colonies = int(aco.get('colonies', 1))
+        self.migration_interval = int(aco.get('migration-interval', 10))
+        self.merge_policy = aco.get('merge-policy', 'average')
+        if self.merge_policy not in ['average', 'best']:
+            raise ValueError("Merge policy " + str(self.merge_policy) + " not recognized.")
     
         self.graph_type = aco.get('graph-type')
         self.n = aco.get('n')
@@ -97,6 +104,35 @@ class Config:
         self.C1 = pso_section.get('cognitive_weight', 1.5)
         self.C2 = pso_section.get('social_weight', 1.5)
     
+    def parse_simulation_params(self, simulation):
+        self.headless = bool(simulation.get('headless', False))
+        self.neighbor_search = simulation.get('neighbor-search', 'grid')
+        if self.neighbor_search not in ['grid', 'verlet']:
+            raise ValueError("Neighbor search " + str(self.neighbor_search) + " not recognized.")
+        self.verlet_skin = float(simulation.get('verlet-skin', 0.3))
+        self.time_stepping = simulation.get('time-stepping', 'fixed')
+        if self.time_stepping not in ['fixed', 'adaptive']:
+            raise ValueError("Time stepping " + str(self.time_stepping) + " not recognized.")
+        self.max_time_step = float(simulation.get('max-time-step', 0.1))
+        self.cfl = float(simulation.get('cfl', 0.5))
+        self.backend = simulation.get('backend', 'numpy')
+        if self.backend not in ['numpy', 'numba']:
+            raise ValueError("Backend " + str(self.backend) + " not recognized.")
+        self.record = simulation.get('record', '') or ''
+        self.record_stride = int(simulation.get('record-stride', 1))
+        self.record_compression = simulation.get('record-compression', 'none')
+        if self.record_compression not in ['none', 'float16', 'delta']:
+            raise ValueError("Record compression " + str(self.record_compression) + " not recognized.")
+        self.replay = simulation.get('replay', '') or ''
+        self.profile = bool(simulation.get('profile', False))
+        self.ensemble = int(simulation.get('ensemble', 0))
+        self.separate_process = bool(simulation.get('separate-process', False))
+        self.termination_window = float(simulation.get('termination-window', 0.0))
+        self.termination_displacement = float(simulation.get('termination-displacement', 0.5))
+        self.health_check = bool(simulation.get('health-check', True))
+        self.blow_up_speed = float(simulation.get('blow-up-speed', 10.0))
+        self.bounds_margin = float(simulation.get('bounds-margin', 1.0))
+    
     def parse_custom_world(self, world):
         self.world_dimensions = world.get('dimensions')
         self.exits = [
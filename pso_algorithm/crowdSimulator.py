@@ -1,34 +1,138 @@
 from pso_algorithm.psoAgent import LocalPSOAgent
 from parser.config import Config
 from pso_algorithm.psoAgent import GridFitness
+from environments.spatial import VerletList
+from environments.stepping import AdaptiveStepper
+from environments.checkpoint import environment_state, restore_environment
 import numpy as np
 
 class CrowdSimulator:
     def __init__(self, environment_input, config: Config, fitness_map=None):
+        self.setup(environment_input, config, fitness_map)
+        for agent in self.env.agents:
+            if isinstance(agent, LocalPSOAgent):
+                agent.initialize(config, self.fitness_map)
+
+    def setup(self, environment_input, config, fitness_map=None):
         self.config = config
         self.env = environment_input
         self.agents_escaped = []
         
-        self.fitness_map = GridFitness(self.env)
-        for agent in self.env.agents:
-            if isinstance(agent, LocalPSOAgent):
-                agent.initialize(config, self.fitness_map)
+        self.neighbor_list = None
+        if getattr(config, "neighbor_search", "grid") == "verlet":
+            self.neighbor_list = VerletList(self.env.get_dimensions(), LocalPSOAgent.interaction_range, getattr(config, "verlet_skin", 0.3))
+        
+        self.stepper = None
+        if getattr(config, "time_stepping", "fixed") == "adaptive":
+            self.stepper = AdaptiveStepper(config.dt, getattr(config, "max_time_step", 0.1), getattr(config, "cfl", 0.5))
+        
+        # the fitness map depends only on the walls and exits: it can be shared
+        # among the simulations of the same scenario (e.g. the replicas of an ensemble)
+        self.fitness_map = fitness_map
+        if self.fitness_map is None:
+            with self.env.profiler.phase("fitness_map"):
+                self.fitness_map = GridFitness(self.env)
+
+    def save_checkpoint(self, path):
+        '''
+        Save the state of the simulation to `path` (compressed .npz): agents, simulation
+        time, random streams and personal best of every agent.
+        '''
+        agents = self.env.agents
+        np.savez_compressed(
+            path,
+            algorithm=np.array("pso"),
+            agents_escaped=np.array(self.agents_escaped, dtype=int),
+            pbest_position=np.array([agent.pbest_position for agent in agents], dtype=float).reshape(-1, 2),
+            pbest_time=np.array([agent.pbest_time for agent in agents], dtype=float),
+            **environment_state(self.env)
+        )
+
+    @classmethod
+    def load_checkpoint(cls, path, environment_input, config: Config):
+        '''
+        Simulator restored from a checkpoint of save_checkpoint, in `environment_input`
+        (the same scenario, its agents are replaced).
+        '''
+        with np.load(path) as data:
+            state = dict(data)
+        if str(state["algorithm"]) != "pso":
+            raise ValueError("Checkpoint " + str(path) + " is not of a PSO simulation.")
+
+        sim = cls.__new__(cls)
+        sim.setup(environment_input, config)
+        sim.agents_escaped = state["agents_escaped"].tolist()
+
+        agents = restore_environment(sim.env, state, lambda uid, index: LocalPSOAgent.bare(sim.env, uid, index))
+        for i, agent in enumerate(agents):
+            agent.initialize(config, sim.fitness_map)
+            agent.pbest_position = state["pbest_position"][i].copy()
+            agent.pbest_time = float(state["pbest_time"][i])
+        return sim
 
     def update(self, dt):
         snapshot = list(self.env.agents)
         N = len(self.env.agents)
+        
+        profiler = self.env.profiler
+        crowd = self.env.crowd
+        active = crowd.active_indices()
+        with profiler.phase("neighbor_search"):
+            self.env.update_spatial_hash() # also used for the local best
+            if self.neighbor_list is not None:
+                pairs = self.neighbor_list.pairs(crowd.pos, active)
+            else:
+                pairs = self.env.agent_pairs_within(LocalPSOAgent.interaction_range)
+        walls = self.env.get_wall_table()
+        with profiler.phase("agent_forces"):
+            LocalPSOAgent.crowd_repulsive_forces(crowd, active, pairs, rng=self.env.random.noise)
+        with profiler.phase("wall_forces"):
+            LocalPSOAgent.crowd_obstacle_forces(crowd, active, walls, rng=self.env.random.noise)
+
+        contact = np.zeros(0, dtype=int)
+        if self.stepper is not None:
+            # dt is only the smallest step, used for the agents in contact
+            dt, contact, n_sub = self.stepper.plan(crowd, active, pairs, walls)
 
+        # random coefficients of the two updates of every agent, by crowd index
+        noise = self.env.random.step_noise(crowd.size, 4)
+        # two updates per step, at most at the maximum speed: how far the agents
+        # may move away from the positions of the spatial hash during the step
+        margin = 2 * dt * float(np.max(crowd.max_speed[active])) if len(active) > 0 else 0.0
+
+        in_contact = set(contact.tolist())
         for i in range(N - 1, -1, -1):
             agent = self.env.agents[i]
-            agent.update(snapshot, self.env, dt)
+            if agent.index in in_contact:
+                continue
+            agent.update(snapshot, self.env, dt, f_agents=agent.f_agents, f_walls=agent.f_walls, noise=noise[agent.index, :2], lbest_margin=margin)
+
+            agent.prev_pos = agent.pos
+            agent.update(snapshot, self.env, dt, f_agents=agent.f_agents, f_walls=agent.f_walls, noise=noise[agent.index, 2:], lbest_margin=margin)
 
-            prev_pos = agent.pos.copy()
-            agent.update(snapshot, self.env, dt)
-                        
-            extra = 0.1 * agent.vel / np.linalg.norm(agent.vel) # this extra is added because otherwise agents tend to stop on the exit due to the social-force model
-            if self.env.check_something_reached(prev_pos, (agent.pos[0] + extra[0], agent.pos[1] + extra[1]), "exit") is not None:
+        if len(in_contact) > 0:
+            contact_agents = [agent for agent in reversed(snapshot) if agent.index in in_contact]
+            crowd.prev_pos[contact] = crowd.pos[contact]
+            def move(sub_dt):
+                # two updates per sub-step, as for the other agents
+                noise = self.env.random.step_noise(crowd.size, 4)
+                for agent in contact_agents:
+                    agent.update(snapshot, self.env, sub_dt, f_agents=agent.f_agents, f_walls=agent.f_walls, noise=noise[agent.index, :2], lbest_margin=margin)
+                    agent.update(snapshot, self.env, sub_dt, f_agents=agent.f_agents, f_walls=agent.f_walls, noise=noise[agent.index, 2:], lbest_margin=margin)
+            with profiler.phase("contact_substeps"):
+                self.stepper.substep(LocalPSOAgent, crowd, contact, pairs, walls, dt, n_sub, move, rng=self.env.random.noise)
+        
+        # Exit check for all the agents at once
+        idx = np.array([agent.index for agent in snapshot], dtype=int)
+        extra = 0.1 * crowd.vel[idx] / np.linalg.norm(crowd.vel[idx], axis=1, keepdims=True) # this extra is added because otherwise agents tend to stop on the exit due to the social-force model
+        with profiler.phase("exit_checks"):
+            exits_reached = self.env.check_many_reached(crowd.prev_pos[idx], crowd.pos[idx] + extra, "exit")
+
+        for i in range(N - 1, -1, -1):
+            agent = snapshot[i]
+            if exits_reached[i] >= 0:
                 self.agents_escaped.append(agent.id)
-                self.env.agents.remove(agent)
+                self.env.remove_agent(agent)
             # se è uscito dai muri lo rimetto nella posizione precedente
             elif agent.pos[0] < 0:
                 agent.pos[0] = 0.1
@@ -1,6 +1,6 @@
 import numpy as np
 from environments.agent import Agent
-from collections import deque
+from backends import get_backend
 from environments.utils import segments_intersect
 
 class LocalPSOAgent(Agent):
@@ -14,54 +14,80 @@ class LocalPSOAgent(Agent):
         self.c2 = None
         self.fitness_map = None
 
-    def update(self, agents_snapshot, env, dt):
+    @classmethod
+    def bare(cls, env_instance, uid, index):
+        agent = super().bare(env_instance, uid, index)
+        agent.pbest_position = None
+        agent.pbest_time = float('inf')
+        agent.neighborhood_radius = None
+        agent.w = None
+        agent.c1 = None
+        agent.c2 = None
+        agent.fitness_map = None
+        return agent
+
+    def update(self, agents_snapshot, env, dt, f_agents=None, f_walls=None, noise=None, lbest_margin=0.0):
+        '''
+        PSO velocity plus social-force dynamics. `noise` optionally gives the two
+        random coefficients (r1, r2) of the update, e.g. taken from a block of
+        numbers drawn for the whole crowd at once. `lbest_margin` is how far the
+        agents may have moved since the spatial hash of the environment was built.
+        '''
+
+        profiler = self.env.profiler
 
         # PSO
-        lbest_position = self._compute_lbest(agents_snapshot)
-        r1, r2 = np.random.rand(), np.random.rand()
+        with profiler.phase("pso_lbest"):
+            lbest_position = self._compute_lbest(agents_snapshot, lbest_margin)
+        if noise is None:
+            noise = env.random.noise.random(2)
+        r1, r2 = noise
         pso_velocity = self.w * self.vel \
                     + self.c1 * r1 * (self.pbest_position - self.pos) \
                     + self.c2 * r2 * (lbest_position - self.pos)
 
         # Pedestrian dynamics
-        f_agents = self.repulsive_force(
-            agents_snapshot
-        )
-
-        f_walls = self.obstacle_force(
-            env.get_walls()
-        )
+        if f_agents is None:
+            with profiler.phase("agent_forces"):
+                f_agents = self.repulsive_force(
+                    agents_snapshot
+                )
+
+        if f_walls is None:
+            with profiler.phase("wall_forces"):
+                f_walls = self.obstacle_force(
+                    env.get_wall_table()
+                )
 
         self.f_desired = pso_velocity
         # With driving force only if the exit is visible
         if self.target is None:
-            for exit in env.get_safety_exits(c=True):
-                target_center = ( (exit[0][0] + exit[1][0]) / 2, (exit[0][1] + exit[1][1]) / 2 )
-                if self.is_visible(target_center, env.get_walls()):
-                    p = self.closest_point_on_segment(self.pos, exit[0], exit[1])
-                    if self.target is None:
-                        self.target = p
-                    elif np.linalg.norm(self.pos - p) < np.linalg.norm(self.pos - self.target):
-                        self.target = p
+            with profiler.phase("target_selection"):
+                for exit in env.get_safety_exits(c=True):
+                    target_center = ( (exit[0][0] + exit[1][0]) / 2, (exit[0][1] + exit[1][1]) / 2 )
+                    if self.is_visible(target_center, env.get_walls()):
+                        p = self.closest_point_on_segment(self.pos, exit[0], exit[1])
+                        if self.target is None:
+                            self.target = p
+                        elif np.linalg.norm(self.pos - p) < np.linalg.norm(self.pos - self.target):
+                            self.target = p
 
             if self.target is not None:
-                self.f_desired = self.driving_force() 
+                with profiler.phase("driving_force"):
+                    self.f_desired = self.driving_force() 
                     
         else:  
-            self.f_desired = self.driving_force()
+            with profiler.phase("driving_force"):
+                self.f_desired = self.driving_force()
        
         self.f_walls = f_walls
         self.f_agents = f_agents
         
-        self.vel += dt * (self.f_desired + (self.f_agents + self.f_walls) / self.mass)
-
-        speed = np.linalg.norm(self.vel)
-        if speed > self.max_speed:
-            self.vel = (self.vel / speed) * self.max_speed
+        with profiler.phase("integration"):
+            self.env.crowd.integrate(self.index, dt)
 
-        self.pos += self.vel * dt
-
-        fitness = self.fitness_map.compute_fitness(self.pos)
+        with profiler.phase("pso_fitness"):
+            fitness = self.fitness_map.compute_fitness(self.pos)
         if fitness < self.pbest_time:
             self.pbest_time = fitness
             self.pbest_position = self.pos.copy()
@@ -81,14 +107,20 @@ class LocalPSOAgent(Agent):
         return vector
 
 
-    def _compute_lbest(self, agents_snapshot):
+    def _compute_lbest(self, agents_snapshot, margin=0.0):
         """
         Compute the local best position among neighboring agents.
         """
+        # Candidates come from the spatial hash of the environment, built at the
+        # beginning of the step on the same agents of the snapshot: the query is
+        # widened by how far they may have moved since then, and the distance is
+        # checked again on their current positions. They are taken in the order of
+        # the snapshot (by crowd index), which breaks the ties of the best.
         neighbors = []
-        for other in agents_snapshot:
-            if other.id == self.id:
+        for index in np.sort(self.env.agents_within(self.pos, self.neighborhood_radius + margin)):
+            if index == self.index:
                 continue
+            other = self.env.get_agent(index)
             dist = np.linalg.norm(self.pos - other.pos)
             if dist <= self.neighborhood_radius:
                 if self.is_visible(other.pos, self.env.get_walls()):
@@ -101,6 +133,9 @@ class LocalPSOAgent(Agent):
         return best_neighbor.pbest_position.copy()
     
     def is_visible(self, target_pos, walls):
+        if walls is self.env.get_walls():
+            # walls of the environment: use its spatial index
+            return self.env.check_something_reached(self.pos, target_pos, "wall") is None
         for wall_start, wall_end in walls:
             if segments_intersect(self.pos, target_pos, wall_start, wall_end):
                 return False
@@ -179,36 +214,15 @@ class GridFitness:
         return (i,j)
     
     def _compute_distance_map(self):
-        queue = deque()
-        visited = np.zeros((self.grid_width, self.grid_height), dtype=bool)
-        
+        # BFS from the cells of the exits, on the free cells of the grid
+        sources = []
         for exit_seg in self.env.get_safety_exits():
             (x1, y1), (x2, y2) = exit_seg
             exit_x = (x1 + x2) / 2
             exit_y = (y1 + y2) / 2
-            ei, ej = self.world_to_grid((exit_x, exit_y))
-            
-            queue.append((ei, ej, 0))
-            visited[ei, ej] = True
-            self.distance_map[ei, ej] = 0
-
-        # Choose the number of directions (4 or 8)
-        directions = [(-1,0),(1,0),(0,-1),(0,1)]
-        # directions = [
-        #     (-1,0),(1,0),(0,-1),(0,1),
-        #     (-1,-1),(-1,1),(1,-1),(1,1)
-        # ]
-        
-        # BFS
-        while queue:
-            i, j, dist = queue.popleft()
-            for di, dj in directions: 
-                ni, nj = i + di, j + dj
-                if 0 <= ni < self.grid_width and 0 <= nj < self.grid_height:
-                    if not visited[ni, nj] and self.grid[ni, nj] == 0:
-                        visited[ni, nj] = True
-                        self.distance_map[ni, nj] = dist + 1
-                        queue.append((ni, nj, dist + 1))
+            sources.append(self.world_to_grid((exit_x, exit_y)))
+
+        self.distance_map = get_backend().bfs_distance_map(self.grid, sources)
     
     def compute_fitness(self, pos):
         i, j = self.world_to_grid(pos)
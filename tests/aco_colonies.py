@@ -0,0 +1,94 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.aco_colonies
+# python -m tests.aco_colonies --graph PRM --nodes 2000 --colonies 8 --policy best --backend numba
+#
+# Runs the offline ACO of one scenario as a single colony and as an island model
+# of several colonies (see aco_algorithm/graphs/colonies.py), on one process and on
+# one process per colony: checks that the result does not depend on the number of
+# processes, and compares the run times. The cost of the colonies on one process
+# against the single colony is the overhead of the island model, whatever the
+# number of CPUs of the machine.
+
+import argparse
+import os
+import time
+import numpy as np
+import backends
+
+from parser.config import Config
+from environments.scenarios import get_scenario_by_name
+from environments.streams import RandomStreams
+from aco_algorithm.graphs.colonies import MERGE_POLICIES
+
+SEED = 1
+WORLD = "bottleneck"
+
+def make_graph(graph_type, nodes):
+    config = Config()
+    config.algorithm = "aco"
+    config.world_type = WORLD
+    config.world_name = ""
+    config.random_seed = SEED
+    config.num_agents = 1
+    config.visualization = False
+    config.graph_type = graph_type
+    if graph_type == "PRM":
+        from aco_algorithm.graphs.PRMGraph import PRMGraph
+        config.n = nodes
+        config.k_connectivity = 8
+        graph_class = PRMGraph
+    else:
+        from aco_algorithm.graphs.gridGraph import GridGraph
+        config.n = config.m = int(np.sqrt(nodes))
+        config.k_connectivity = 2
+        graph_class = GridGraph
+    env = get_scenario_by_name(WORLD, config=config)
+    return graph_class(env, config)
+
+def timed_aco(graph, ants, iterations, colonies, interval, policy, workers):
+    from aco_algorithm.graphs.colonies import run_colonies
+
+    graph.initialize_aco_parameters(ants, iterations, 0.3, 1.0, 2.0, colonies, interval, policy)
+    graph.env.random = RandomStreams(SEED)
+    start = time.perf_counter()
+    if colonies > 1:
+        graph.initialize_pheromones()
+        graph.eta = (1 / graph.costs) ** graph.beta
+        pheromone = run_colonies(graph, graph.env.random.aco, colonies, interval, policy, workers=workers)
+    else:
+        pheromone = graph.run_aco().copy()
+    return pheromone, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Island model of the offline ACO.")
+    parser.add_argument("--graph", choices=["grid", "PRM"], default="PRM")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--ants", type=int, default=105)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--colonies", type=int, default=4)
+    parser.add_argument("--interval", type=int, default=10, help="iterations between two merges")
+    parser.add_argument("--policy", choices=MERGE_POLICIES, default="average")
+    parser.add_argument("--backend", choices=["numpy", "numba"], default="numpy")
+    args = parser.parse_args()
+    backends.set_backend(args.backend)
+
+    graph = make_graph(args.graph, args.nodes)
+    print(f"{args.graph} graph of {len(graph.nodes)} nodes, {args.ants} ants, {args.iterations} iterations, "
+          f"{backends.get_backend().name} backend, {os.cpu_count()} CPUs")
+
+    _, single_time = timed_aco(graph, args.ants, args.iterations, 1, args.interval, args.policy, 1)
+    print(f"single colony: {single_time:.2f} s")
+
+    results = []
+    for workers in (1, args.colonies):
+        pheromone, run_time = timed_aco(graph, args.ants, args.iterations, args.colonies, args.interval, args.policy, workers)
+        results.append(pheromone)
+        print(f"{args.colonies} colonies ({args.policy}) on {workers} processes: {run_time:.2f} s")
+        if workers == 1:
+            print(f"  cost on one process: {run_time / single_time:.2f} x the single colony")
+
+    assert np.array_equal(results[0], results[1]), "The pheromone depends on the number of processes."
+    print("Same pheromone on any number of processes.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.backend_conformance
+#
+# Checks that the optional numba backend gives the same results of the NumPy
+# reference backend, for the same random seed, that the walks of many ants
+# together (ant_walks) are the walks of every ant alone (ant_walk), and that the
+# colonies walking together walk as every colony alone.
+
+import numpy as np
+import backends
+from environments.geometry import SegmentTable
+from environments.spatial import SpatialHash
+
+SEED = 42
+A, B, k, kappa = 2.0, 0.08, 1.2e5, 2.4e5
+
+def random_inputs(rng):
+    n = 400
+    pos = rng.uniform(0, 20, (n, 2))
+    pos[1] = pos[0]  # overlapping agents, pushed apart in a random direction
+    vel = rng.uniform(-2, 2, (n, 2))
+    radius = rng.uniform(0.2, 0.4, n)
+
+    grid = SpatialHash((20, 20), 2.0)
+    grid.build(pos)
+    pairs = grid.query_pairs(2.0)
+
+    walls = SegmentTable([(tuple(a), tuple(b)) for a, b in rng.uniform(0, 20, (30, 2, 2))])
+
+    cells = (rng.random((60, 40)) < 0.3).astype(int)
+    sources = [(0, 0), (59, 39), (30, 20)]
+    for i, j in sources:
+        cells[i, j] = 0
+
+    # random graph in CSR format
+    v = 80
+    neighbors = [np.unique(rng.choice(v, 5)) for _ in range(v)]
+    indptr = np.concatenate(([0], np.cumsum([len(nb) for nb in neighbors])))
+    indices = np.concatenate(neighbors)
+    weights = rng.uniform(0, 1, len(indices)) ** 2
+    is_exit = rng.random(v) < 0.05
+
+    return pos, vel, radius, pairs, walls, cells, sources, (indptr, indices, weights, is_exit)
+
+
+def run(backend, inputs):
+    pos, vel, radius, pairs, walls, cells, sources, graph = inputs
+    results = {}
+
+    rng = np.random.default_rng(SEED)
+    results["social_forces"] = backend.social_forces(pos, vel, radius, A, B, k, kappa, rng=rng)
+    results["social_forces_from_pairs"] = backend.social_forces_from_pairs(pos, vel, radius, pairs[0], pairs[1], A, B, k, kappa, rng=rng)
+    results["wall_forces"] = backend.wall_forces(pos, vel, radius, walls, A, B, k, kappa, rng=rng)
+
+    steps = vel * 0.5
+    results["first_intersection"] = backend.first_intersection(pos, pos + steps, walls.start, walls.end)
+    results["bfs_distance_map"] = backend.bfs_distance_map(cells, sources)
+
+    indptr, indices, weights, is_exit = graph
+    uniforms = rng.random((len(indptr) - 1, len(indptr) - 1))
+    walks = []
+    for start in range(len(indptr) - 1):
+        path, reached = backend.ant_walk(indptr, indices, weights, is_exit, start, uniforms[start])
+        walks.append((list(path), reached))
+    results["ant_walk"] = walks
+
+    # ants starting from every node, drawing their numbers in one block as long as
+    # the longest walk (as ant_walk) and in many short blocks, reusing the buffers
+    starts = np.arange(len(indptr) - 1)
+    buffers = backends.AntWalkBuffers()
+    for name, block in (("ant_walks", len(starts)), ("ant_walks_blocks", 4), ("ant_walks_reused", 4)):
+        paths, lengths, reached = backend.ant_walks(indptr, indices, weights, is_exit, starts, np.random.default_rng(SEED), buffers, block)
+        results[name] = [(list(path[:length]), bool(r)) for path, length, r in zip(paths, lengths, reached)]
+
+    # a second colony with other weights and its own generator
+    colony_weights = np.stack([weights, weights[::-1]])
+    colony_starts = np.stack([starts, starts[::-1]])
+    rngs = [np.random.default_rng(SEED), np.random.default_rng(SEED + 1)]
+    paths, lengths, reached = backend.ant_walks(indptr, indices, colony_weights, is_exit, colony_starts, rngs, buffers, 4)
+    results["ant_walks_colonies"] = [(list(path[:length]), bool(r)) for path, length, r in zip(paths, lengths, reached)]
+    results["ant_walks_alone"] = []
+    for colony in range(2):
+        paths, lengths, reached = backend.ant_walks(indptr, indices, colony_weights[colony], is_exit, colony_starts[colony],
+                                                    np.random.default_rng(SEED + colony), None, 4)
+        results["ant_walks_alone"] += [(list(path[:length]), bool(r)) for path, length, r in zip(paths, lengths, reached)]
+
+    return results
+
+
+def main():
+    inputs = random_inputs(np.random.default_rng(SEED))
+    reference = run(backends.NumpyBackend(), inputs)
+    # all the ants together walk as every ant alone, with a row of numbers for
+    # every ant that does not start from an exit
+    indptr, indices, weights, is_exit = inputs[-1]
+    walking = np.flatnonzero(~is_exit)
+    uniforms = np.random.default_rng(SEED).random((len(walking), len(indptr) - 1))
+    expected = [([start], True) for start in range(len(indptr) - 1)]
+    for row, start in enumerate(walking):
+        path, reached = backends.NumpyBackend().ant_walk(indptr, indices, weights, is_exit, start, uniforms[row])
+        expected[start] = (list(path), reached)
+    assert reference["ant_walks"] == expected, "ant_walks: different walks"
+    assert reference["ant_walks_reused"] == reference["ant_walks_blocks"], "ant_walks: different walks with reused buffers"
+    assert reference["ant_walks_colonies"] == reference["ant_walks_alone"], "ant_walks: different walks of the colonies together"
+    assert reference["ant_walks_colonies"][:len(indptr) - 1] == reference["ant_walks_blocks"], "ant_walks: different walks of the first colony"
+    print("ant_walks: ok")
+
+    if "numba" not in backends.available_backends():
+        print("numba is not installed: nothing to compare, skipped.")
+        return
+
+    compiled = run(backends.NumbaBackend(), inputs)
+
+    for name, expected in reference.items():
+        if name.startswith("ant_walk"):
+            assert compiled[name] == expected, name + ": different walks"
+        elif expected.dtype.kind == "f":
+            assert np.allclose(compiled[name], expected, rtol=1e-9, atol=1e-9), name + ": different values"
+        else:
+            assert np.array_equal(compiled[name], expected), name + ": different values"
+        print(name + ": ok")
+
+    print("The numba backend conforms to the numpy backend.")
+
+if __name__ == "__main__":
+    main()
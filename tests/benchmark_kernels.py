@@ -0,0 +1,252 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.benchmark_kernels                  (compare with the baseline)
+# python -m tests.benchmark_kernels --save           (store the current times as the baseline)
+# python -m tests.benchmark_kernels --kernels run_aco obstacle_force --tolerance 0.5
+#
+# Micro-benchmarks of the hot functions of the simulators. Every kernel is timed
+# on fixed inputs (fixed seed) and compared with the baseline stored in
+# tests/benchmark_baseline.json: the command fails (exit code 1) if a kernel got
+# slower than the baseline by more than the tolerance.
+#
+# Kernels are compared by their relative cost: the time of a call divided by the
+# time of a fixed calibration workload, timed just before and after it (median
+# over many repetitions). In this way the comparison is not affected by the speed
+# changes of a shared machine, and it depends little on the machine itself; the
+# baseline should be saved again anyway when the machine changes.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import timeit
+import numpy as np
+
+from environments.scenarios import get_scenario_by_name
+from environments.utils import segments_intersect
+from parser.config import Config
+
+BASELINE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+TOLERANCE = 0.25    # 25% slower than the baseline
+SEED = 1
+NUM_AGENTS = 50
+REPEAT = 21
+# duration (s) of one timing of a kernel or of the calibration workload
+TIMING = 0.01
+
+def make_config(algorithm):
+    config = Config()
+    config.algorithm = algorithm
+    config.random_seed = SEED
+    config.num_agents = NUM_AGENTS
+    config.dt = 0.01
+    config.k_connectivity = 2
+    config.num_ants = 30
+    config.num_iterations = 10
+    config.alpha = 1.0
+    config.beta = 2.0
+    config.evaporation_rate = 0.3
+    return config
+
+########################## KERNELS ##########################
+# Every function prepares the inputs of one kernel and returns the call to time
+
+def bench_segments_intersect():
+    rng = np.random.default_rng(SEED)
+    segments = itertools.cycle(rng.uniform(0, 10, (1000, 4, 2)))
+    return lambda: segments_intersect(*next(segments))
+
+def _agents_environment():
+    return get_scenario_by_name("slalom", agents=[NUM_AGENTS, "aco"], config=make_config("aco"))
+
+def bench_repulsion_from_point():
+    env = _agents_environment()
+    agent, other = env.agents[0], env.agents[1]
+    return lambda: agent._repulsion_from_point(other.pos, other.vel, other.radius)
+
+def bench_repulsive_force():
+    env = _agents_environment()
+    agents = list(env.agents)
+    return lambda: agents[0].repulsive_force(agents)
+
+def bench_obstacle_force():
+    env = _agents_environment()
+    agent, walls = env.agents[0], env.get_wall_table()
+    return lambda: agent.obstacle_force(walls)
+
+def bench_crowd_forces():
+    env = _agents_environment()
+    crowd, idx, walls = env.crowd, env.crowd.active_indices(), env.get_wall_table()
+    agent_class = type(env.agents[0])
+    def step():
+        env.update_spatial_hash()
+        pairs = env.agent_pairs_within(agent_class.interaction_range)
+        agent_class.crowd_repulsive_forces(crowd, idx, pairs, rng=env.random.noise)
+        agent_class.crowd_obstacle_forces(crowd, idx, walls, rng=env.random.noise)
+    return step
+
+def bench_check_something_reached():
+    env = get_scenario_by_name("slalom")
+    rng = np.random.default_rng(SEED)
+    motions = itertools.cycle(rng.uniform(0, 10, (1000, 2, 2)))
+    return lambda: env.check_something_reached(*next(motions), "wall")
+
+def bench_check_many_reached():
+    env = get_scenario_by_name("slalom")
+    rng = np.random.default_rng(SEED)
+    prev_pos = rng.uniform(0, 10, (NUM_AGENTS, 2))
+    pos = prev_pos + rng.uniform(-0.5, 0.5, (NUM_AGENTS, 2))
+    return lambda: env.check_many_reached(prev_pos, pos, "exit")
+
+def bench_compute_distance_map():
+    from pso_algorithm.psoAgent import GridFitness
+    fitness = GridFitness(get_scenario_by_name("slalom"))
+    return fitness._compute_distance_map
+
+def bench_grid_graph():
+    from aco_algorithm.graphs.gridGraph import GridGraph
+    config = make_config("aco")
+    config.n = config.m = 10
+    graph = GridGraph(get_scenario_by_name("slalom", config=config), config)
+    return graph.create_graph
+
+def bench_prm_graph():
+    from aco_algorithm.graphs.PRMGraph import PRMGraph
+    config = make_config("aco")
+    config.n = 100
+    config.k_connectivity = 8
+    graph = PRMGraph(get_scenario_by_name("slalom", config=config), config)
+    return graph.create_graph
+
+def bench_run_aco():
+    from aco_algorithm.graphs.gridGraph import GridGraph
+    config = make_config("aco")
+    config.n = config.m = 10
+    graph = GridGraph(get_scenario_by_name("slalom", config=config), config)
+    graph.initialize_aco_parameters(config.num_ants, config.num_iterations, config.alpha, config.beta, config.evaporation_rate)
+    return graph.run_aco
+
+KERNELS = {
+    "segments_intersect": bench_segments_intersect,
+    "repulsion_from_point": bench_repulsion_from_point,
+    "repulsive_force": bench_repulsive_force,
+    "obstacle_force": bench_obstacle_force,
+    "crowd_forces": bench_crowd_forces,
+    "check_something_reached": bench_check_something_reached,
+    "check_many_reached": bench_check_many_reached,
+    "compute_distance_map": bench_compute_distance_map,
+    "grid_graph_create": bench_grid_graph,
+    "prm_graph_create": bench_prm_graph,
+    "run_aco": bench_run_aco,
+}
+
+########################## END KERNELS ##########################
+
+def calibration():
+    # fixed mix of interpreter and small NumPy work, as in the kernels
+    x = np.arange(64.0)
+    s = 0.0
+    for i in range(100):
+        s += float(np.dot(x, x)) + i
+    return s
+
+def _calls_per_timing(timer):
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= TIMING:
+            return number
+        number = max(number * 2, int(number * TIMING / max(elapsed, 1e-9)))
+
+def measure(call, repeat=REPEAT):
+    '''
+    :return: median time per call (s) and median relative cost of `call`, i.e. its
+             time over the mean time of the calibration just before and after it
+    '''
+    kernel, reference = timeit.Timer(call), timeit.Timer(calibration)
+    n_kernel, n_reference = _calls_per_timing(kernel), _calls_per_timing(reference)
+    times, costs = [], []
+    for _ in range(repeat):
+        before = reference.timeit(n_reference) / n_reference
+        elapsed = kernel.timeit(n_kernel) / n_kernel
+        after = reference.timeit(n_reference) / n_reference
+        times.append(elapsed)
+        costs.append(elapsed / ((before + after) / 2))
+    return float(np.median(times)), float(np.median(costs))
+
+def machine():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+def run_kernels(names):
+    '''
+    :return: for every kernel, its time per call (s) and its relative cost
+    '''
+    results = dict()
+    for name in names:
+        time_per_call, cost = measure(KERNELS[name]())
+        results[name] = {"time": time_per_call, "relative_cost": cost}
+        print(f"{name:25s} {time_per_call * 1e6:12.2f} us  (relative cost {cost:.3f})")
+    return results
+
+def compare(results, baseline, tolerance):
+    '''
+    Compare the relative costs of the kernels with the baseline.
+
+    :return: the kernels slower than the baseline by more than `tolerance`
+    '''
+    slower = []
+    print(f"\n{'kernel':25s} {'baseline':>10s} {'current':>10s} {'ratio':>8s}")
+    for name, current in results.items():
+        if name not in baseline:
+            print(f"{name:25s} {'-':>10s} {current['relative_cost']:10.3f} {'-':>8s}  no baseline")
+            continue
+        ratio = current["relative_cost"] / baseline[name]["relative_cost"]
+        status = "SLOWER" if ratio > 1 + tolerance else ("faster" if ratio < 1 / (1 + tolerance) else "ok")
+        print(f"{name:25s} {baseline[name]['relative_cost']:10.3f} {current['relative_cost']:10.3f} {ratio:8.2f}  {status}")
+        if ratio > 1 + tolerance:
+            slower.append(name)
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the kernels of the simulators.")
+    parser.add_argument("--kernels", nargs="+", choices=list(KERNELS.keys()), default=list(KERNELS.keys()))
+    parser.add_argument("--baseline", default=BASELINE, help="json file of the baseline times")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown w.r.t. the baseline (fraction)")
+    parser.add_argument("--save", action="store_true", help="store the current times as the baseline")
+    args = parser.parse_args()
+
+    results = run_kernels(args.kernels)
+
+    if args.save:
+        stored = {"machine": machine(), "kernels": dict()}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored["kernels"] = json.load(f)["kernels"]
+        stored["kernels"].update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2)
+        print("Baseline saved to " + args.baseline)
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found in " + args.baseline + ": run with --save first.")
+        sys.exit(1)
+    with open(args.baseline) as f:
+        stored = json.load(f)
+    if stored.get("machine") != machine():
+        print("Warning: the baseline was measured on a different machine: " + str(stored.get("machine")))
+
+    slower = compare(results, stored["kernels"], args.tolerance)
+    if slower:
+        print("\nKernels slower than the baseline by more than " + str(int(args.tolerance * 100)) + "%: " + ", ".join(slower))
+        sys.exit(1)
+    print("\nNo kernel slower than the baseline.")
+
+if __name__ == "__main__":
+    main()
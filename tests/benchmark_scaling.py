@@ -0,0 +1,247 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.benchmark_scaling --output scaling.json
+# python -m tests.benchmark_scaling --algorithms aco pso --worlds two_doors --max-agents 800
+#
+# Scaling benchmark of the simulators: every algorithm runs on every scenario of
+# environments/scenarios.py and on the custom world of resources/config.yaml, with
+# crowds doubling from 25 agents, a fixed seed and a fixed number of steps. The
+# worlds are scaled up (walls, exits and graph included) to keep the density of
+# the agents roughly constant. Every run is done in a new process, so that the
+# peak memory of the run can be measured. The report (json) has the measures of
+# every run and, for every algorithm and world, the exponent b of the fit
+# time ~ N^b of the step time and of the setup time.
+
+import argparse
+import json
+import math
+import multiprocessing
+import platform
+import resource
+import time
+import numpy as np
+
+from environments.environment import Environment
+from environments.scenarios import get_scenario_by_name
+from parser.config import Config
+
+########################## BENCHMARK SETTINGS ##########################
+
+ALGORITHMS = ["boids", "aco", "pso"]
+WORLDS = ["bottleneck", "two_doors", "slalom", "empty", "custom"]
+MIN_AGENTS = 25
+MAX_AGENTS = 3200
+STEPS = 20
+SEED = 1
+# agents per 10x10 m of world: larger crowds are placed in scaled-up worlds
+AGENTS_PER_WORLD = 40
+# a series stops growing once one step takes longer than this (s)
+MAX_STEP_TIME = 10.0
+CUSTOM_CONFIG = "resources/config.yaml"
+
+########################## END BENCHMARK SETTINGS ##########################
+
+def crowd_sizes(min_agents=MIN_AGENTS, max_agents=MAX_AGENTS):
+    sizes = [min_agents]
+    while sizes[-1] * 2 <= max_agents:
+        sizes.append(sizes[-1] * 2)
+    return sizes
+
+def world_scale(num_agents):
+    '''Integer factor scaling the 10x10 worlds for `num_agents` agents'''
+    return max(1, int(math.ceil(math.sqrt(num_agents / AGENTS_PER_WORLD))))
+
+def make_config(algorithm, world, num_agents, scale):
+    config = Config()
+    config.algorithm = algorithm
+    config.world_type = world
+    config.world_name = ""
+    config.random_seed = SEED
+    config.num_agents = num_agents
+    config.dt = 0.01
+    config.visualization = False
+
+    if algorithm == "boids":
+        config.vision_radius = 80.0
+        config.min_separation = 25.0
+        config.speed_limit = 1.0
+        config.force_limit = 0.1
+        config.weights = {"seek": 3.1224, "avoid": 2.0973, "separate": 0.5, "align": 0.1, "cohere": 1.65599}
+    elif algorithm == "aco":
+        # same density of nodes in the scaled worlds
+        config.graph_type = "grid"
+        config.n = 10 * scale
+        config.m = 10 * scale
+        config.k_connectivity = 2
+        config.num_ants = 30
+        config.num_iterations = 30
+        config.alpha = 1.0
+        config.beta = 2.0
+        config.evaporation_rate = 0.3
+    elif algorithm == "pso":
+        config.neighborhood_radius = 10.0
+        config.W = 0.4
+        config.C1 = 1.0
+        config.C2 = 1.5
+    else:
+        raise ValueError("Algorithm " + str(algorithm) + " not recognized.")
+    return config
+
+def _on_border(wall, width, height):
+    (x1, y1), (x2, y2) = wall
+    return (x1 == x2 and x1 in (0, width)) or (y1 == y2 and y1 in (0, height))
+
+def make_world(world, scale, config):
+    '''
+    Environment `world` with its agents, scaled by `scale`. The walls on the border
+    are left out when scaling, since every environment adds its external walls.
+    '''
+    agents = [config.num_agents, config.algorithm]
+    if world == "custom":
+        custom = Config(CUSTOM_CONFIG)
+        custom.parse_custom_world(custom.get("world", {}))
+        template = Environment(name="custom", dimensions=tuple(custom.world_dimensions), walls=custom.walls, exits=custom.exits)
+    elif scale == 1:
+        return get_scenario_by_name(world, agents=agents, config=config)
+    else:
+        template = get_scenario_by_name(world)
+        if template is None:
+            raise ValueError("Scenario " + str(world) + " not recognized.")
+
+    width, height = template.get_dimensions()
+    walls = [[(x1 * scale, y1 * scale), (x2 * scale, y2 * scale)] for (x1, y1), (x2, y2) in template.walls if not _on_border(((x1, y1), (x2, y2)), width, height)]
+    exits = [[(x1 * scale, y1 * scale), (x2 * scale, y2 * scale)] for (x1, y1), (x2, y2) in template.exits]
+    return Environment(name=template.name, dimensions=(int(width * scale), int(height * scale)), walls=walls, exits=exits, agents=agents, config=config)
+
+def run_benchmark(task):
+    '''
+    One run of the benchmark, in a new worker process.
+
+    :return: the task with its measures, or with the error message
+    '''
+    from main import create_simulator
+
+    try:
+        scale = world_scale(task["num_agents"])
+        config = make_config(task["algorithm"], task["world"], task["num_agents"], scale)
+
+        start = time.perf_counter()
+        env = make_world(task["world"], scale, config)
+        spawn_time = time.perf_counter() - start
+
+        # the profiler splits the setup of the simulator, and it is disabled for the steps
+        env.profiler.enabled = True
+        start = time.perf_counter()
+        sim = create_simulator(env, config)
+        setup_time = time.perf_counter() - start
+        setup = {name: data["time"] for name, data in env.profiler.summary().items()}
+        env.profiler.enabled = False
+
+        agent_steps = 0
+        start = time.perf_counter()
+        for _ in range(task["steps"]):
+            agent_steps += len(env.agents)
+            sim.update(config.dt)
+        run_time = time.perf_counter() - start
+
+        return dict(
+            task,
+            world_size=list(env.get_dimensions()),
+            spawn_time=spawn_time,
+            setup_time=setup_time,
+            setup_phases=setup,
+            run_time=run_time,
+            step_time=run_time / task["steps"],
+            steps_per_second=task["steps"] / run_time,
+            agent_steps_per_second=agent_steps / run_time,
+            # high-water mark of the worker process, which runs only this benchmark
+            peak_memory_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            agents_remaining=len(env.agents),
+        )
+    except Exception as e:
+        return dict(task, error=repr(e))
+
+def scaling_exponent(sizes, times):
+    '''Exponent b of the least-squares fit times ~ a * sizes^b (log-log), None with less than 2 points'''
+    points = [(n, t) for n, t in zip(sizes, times) if t > 0]
+    if len(points) < 2:
+        return None
+    n, t = np.log(np.array(points)).T
+    return float(np.polyfit(n, t, 1)[0])
+
+def fit_series(runs):
+    fits = []
+    series = sorted({(run["algorithm"], run["world"]) for run in runs if "error" not in run})
+    for algorithm, world in series:
+        points = sorted((run for run in runs if run["algorithm"] == algorithm and run["world"] == world and "error" not in run), key=lambda run: run["num_agents"])
+        sizes = [run["num_agents"] for run in points]
+        fits.append({
+            "algorithm": algorithm,
+            "world": world,
+            "num_agents": sizes,
+            "step_time_exponent": scaling_exponent(sizes, [run["step_time"] for run in points]),
+            "setup_time_exponent": scaling_exponent(sizes, [run["setup_time"] for run in points]),
+            "spawn_time_exponent": scaling_exponent(sizes, [run["spawn_time"] for run in points]),
+        })
+    return fits
+
+def run_suite(algorithms, worlds, sizes, steps, max_step_time=MAX_STEP_TIME):
+    '''
+    Run the benchmarks one at a time (so that they do not compete for the CPU),
+    each one in a new process. The crowd of a series doubles until the largest
+    size, or until one step takes longer than `max_step_time`.
+    '''
+    runs = []
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for algorithm in algorithms:
+            for world in worlds:
+                for num_agents in sizes:
+                    task = {"algorithm": algorithm, "world": world, "num_agents": num_agents, "steps": steps}
+                    run = pool.apply(run_benchmark, (task,))
+                    runs.append(run)
+                    if "error" in run:
+                        print(f"{algorithm:6s} {world:10s} N={num_agents:5d} failed: {run['error']}")
+                        break
+                    print(f"{algorithm:6s} {world:10s} N={num_agents:5d} step {run['step_time'] * 1e3:9.2f} ms, "
+                          f"{run['agent_steps_per_second']:10.0f} agent-steps/s, setup {run['setup_time']:7.2f} s, "
+                          f"spawn {run['spawn_time']:7.2f} s, peak memory {run['peak_memory_mb']:7.1f} MB")
+                    if run["step_time"] > max_step_time:
+                        break
+    return runs
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the evacuation simulators.")
+    parser.add_argument("--algorithms", nargs="+", choices=ALGORITHMS, default=ALGORITHMS)
+    parser.add_argument("--worlds", nargs="+", choices=WORLDS, default=WORLDS)
+    parser.add_argument("--min-agents", type=int, default=MIN_AGENTS)
+    parser.add_argument("--max-agents", type=int, default=MAX_AGENTS)
+    parser.add_argument("--steps", type=int, default=STEPS)
+    parser.add_argument("--max-step-time", type=float, default=MAX_STEP_TIME, help="stop a series once a step takes longer (s)")
+    parser.add_argument("--output", default="scaling_benchmark.json", help="json report")
+    args = parser.parse_args()
+
+    sizes = crowd_sizes(args.min_agents, args.max_agents)
+    runs = run_suite(args.algorithms, args.worlds, sizes, args.steps, args.max_step_time)
+    report = {
+        "settings": {
+            "sizes": sizes,
+            "steps": args.steps,
+            "seed": SEED,
+            "agents_per_world": AGENTS_PER_WORLD,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "runs": runs,
+        "fits": fit_series(runs),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for fit in report["fits"]:
+        exponents = [float("nan") if fit[key] is None else fit[key] for key in ("step_time_exponent", "setup_time_exponent")]
+        print(f"{fit['algorithm']:6s} {fit['world']:10s} step time ~ N^{exponents[0]:.2f}, setup time ~ N^{exponents[1]:.2f}")
+    print("Report written to " + args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.ensemble_equivalence
+# python -m tests.ensemble_equivalence --algorithms aco --replicas 8 --steps 500
+#
+# Checks that every replica of an ensemble (see environments/ensemble.py) evolves
+# exactly as the single simulation with the same seed, and compares their run times.
+
+import argparse
+import copy
+import time
+import numpy as np
+
+from parser.config import Config
+
+SEED = 1
+NUM_AGENTS = 20
+WORLD = "two_doors"
+
+def make_config(algorithm):
+    config = Config()
+    config.algorithm = algorithm
+    config.world_type = WORLD
+    config.world_name = ""
+    config.random_seed = SEED
+    config.num_agents = NUM_AGENTS
+    config.dt = 0.01
+    config.visualization = False
+
+    if algorithm == "boids":
+        config.vision_radius = 80.0
+        config.min_separation = 25.0
+        config.speed_limit = 1.0
+        config.force_limit = 0.1
+        config.weights = {"seek": 3.1224, "avoid": 2.0973, "separate": 0.5, "align": 0.1, "cohere": 1.65599}
+    elif algorithm == "aco":
+        config.graph_type = "grid"
+        config.n = 10
+        config.m = 10
+        config.k_connectivity = 2
+        config.num_ants = 30
+        config.num_iterations = 30
+        config.alpha = 1.0
+        config.beta = 2.0
+        config.evaporation_rate = 0.3
+    elif algorithm == "pso":
+        config.neighborhood_radius = 10.0
+        config.W = 0.4
+        config.C1 = 1.0
+        config.C2 = 1.5
+    return config
+
+def escaped_ids(sim):
+    # the boids simulator keeps the escaped agents themselves, the others their ids
+    return [getattr(agent, "id", agent) for agent in sim.agents_escaped]
+
+def single_run(config, seed, max_steps):
+    from main import create_environment, create_simulator, simulation_time_limit
+
+    config = copy.copy(config)
+    config.random_seed = seed
+    env = create_environment(config)
+    sim = create_simulator(env, config)
+
+    steps = 0
+    start = time.perf_counter()
+    while env.simulation_time < simulation_time_limit(config) and steps < max_steps:
+        sim.update(config.dt)
+        steps += 1
+        if len(sim.agents_escaped) == config.num_agents:
+            break
+    return env, sim, time.perf_counter() - start
+
+def check(algorithm, replicas, max_steps):
+    from main import run_ensemble
+
+    config = make_config(algorithm)
+    ensemble, statistics = run_ensemble(config, replicas, max_steps=max_steps)
+
+    single_time = 0.0
+    for k, seed in enumerate(ensemble.seeds):
+        env, sim, run_time = single_run(config, seed, max_steps)
+        single_time += run_time
+        replica = ensemble.envs[k].crowd
+        assert escaped_ids(sim) == escaped_ids(ensemble.sims[k]), algorithm + ": different agents escaped in replica " + str(k)
+        assert env.simulation_time == ensemble.envs[k].simulation_time, algorithm + ": different time in replica " + str(k)
+        for name in ("pos", "vel", "active"):
+            assert np.array_equal(getattr(env.crowd, name)[:env.crowd.size], getattr(replica, name)[:replica.size]), algorithm + ": different " + name + " in replica " + str(k)
+
+    print(f"{algorithm}: {replicas} replicas identical to the single runs, "
+          f"run time {statistics['run_time']:.2f} s (single runs {single_time:.2f} s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Equivalence of the ensembles with the single simulations.")
+    parser.add_argument("--algorithms", nargs="+", choices=["boids", "aco", "pso"], default=["boids", "aco", "pso"])
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+
+    for algorithm in args.algorithms:
+        check(algorithm, args.replicas, args.steps)
+
+if __name__ == "__main__":
+    main()
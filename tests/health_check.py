@@ -0,0 +1,83 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.health_check
+# python -m tests.health_check --world slalom --steps 500
+#
+# Checks the health checks of the boids simulations (see environments/termination.py):
+# a regular run, with the agents pushed back by the walls, is never aborted, while a
+# run whose agents jump away or speed up beyond the speed cap of boids blows up.
+
+import argparse
+import numpy as np
+
+from parser.config import Config
+from environments.scenarios import get_scenario_by_name
+from environments.termination import HealthCheck, BLOW_UP
+
+SEED = 1
+NUM_AGENTS = 30
+
+def make_config(world):
+    config = Config()
+    config.algorithm = "boids"
+    config.world_type = world
+    config.world_name = ""
+    config.random_seed = SEED
+    config.num_agents = NUM_AGENTS
+    config.dt = 0.01
+    config.visualization = False
+    config.vision_radius = 80.0
+    config.min_separation = 25.0
+    config.speed_limit = 1.0
+    config.force_limit = 0.1
+    config.weights = {"seek": 3.1224, "avoid": 2.0973, "separate": 0.5, "align": 0.1, "cohere": 1.65599}
+    return config
+
+def run(world, steps, perturbation=None):
+    '''
+    Boids simulation of `steps` steps, calling perturbation(agent) on its first agent
+    at half of the run.
+
+    :return: the step of the blow-up (None if it never blew up) and its description
+    '''
+    from main import create_simulator
+
+    config = make_config(world)
+    env = get_scenario_by_name(world, agents=[NUM_AGENTS, "boids"], config=config)
+    sim = create_simulator(env, config)
+    health = HealthCheck()
+    for step in range(steps):
+        if len(env.agents) == 0:
+            break
+        sim.update(config.dt)
+        if perturbation is not None and step == steps // 2:
+            perturbation(env.agents[0])
+        if health.check(env) == BLOW_UP:
+            return step, health.problem
+    return None, None
+
+def jump(agent):
+    # a runaway step: the velocity stays clamped but the agent is thrown away
+    agent.pos = agent.pos + np.sign(np.array(agent.env.get_dimensions()) / 2 - agent.pos) * 2.0
+
+def spike(agent):
+    agent.vel = np.array([20.0, 0.0]) * agent.base_speed
+
+def main():
+    parser = argparse.ArgumentParser(description="Health checks of the boids simulations.")
+    parser.add_argument("--world", default="slalom")
+    parser.add_argument("--steps", type=int, default=300)
+    args = parser.parse_args()
+
+    step, problem = run(args.world, args.steps)
+    assert step is None, "Regular run aborted at step " + str(step) + ": " + str(problem) + "."
+    print("regular run: ok")
+
+    for name, perturbation in (("jump", jump), ("speed spike", spike)):
+        step, problem = run(args.world, args.steps, perturbation)
+        assert step == args.steps // 2, name + ": not detected."
+        print(name + ": blow-up detected (" + problem + ")")
+
+    print("The health checks detect the runaway boids.")
+
+if __name__ == "__main__":
+    main()
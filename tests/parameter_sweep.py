@@ -0,0 +1,213 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.parameter_sweep aco --output aco_results.csv
+# python -m tests.parameter_sweep pso --workers 4
+# python -m tests.parameter_sweep boids
+#
+# Parameter sweeps of the algorithms: every combination of the parameters of the
+# grid is an independent headless simulation, and the simulations are spread over
+# a pool of processes. Idle workers take the next simulation from a shared queue,
+# so that slow combinations do not leave the other workers idle.
+
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+import numpy as np
+
+from environments.scenarios import get_scenario_by_name
+from parser.config import Config
+
+########################## PARAMETER SETTINGS ##########################
+
+ACO_GRID = {
+    "environment_type": ["two_doors", "slalom"],
+    "num_agents": [30, 50, 90],
+    "seed": [1, 2, 5],
+    "graph_type": ["grid", "PRM"],
+    "num_nodes": [50, 100, 200],        # 0.5, 1, 2 nodes per square meter for 10x10 environments
+    "alpha": [0.5, 1.0, 2.0],
+    "beta": [1.5, 2.0, 2.5],
+    "evaporation_rate": [0.05, 0.1, 0.2, 0.5],
+    "num_ants": [0.05],                 # ants in excess w.r.t. the number of nodes (fraction)
+    "num_iterations": [3],              # iterations per node
+}
+
+PSO_GRID = {
+    "environment_type": ["two_doors", "slalom"],
+    "num_agents": [30, 50, 90],
+    "seed": [1, 2, 5],
+    "inertia_weight": [0.4, 0.6, 0.8],
+    "cognitive_weight": [1.0, 1.2, 1.5],
+    "social_weight": [1.5, 1.8, 2.0],
+}
+
+BOIDS_GRID = {
+    "environment_type": ["empty", "two_doors", "slalom"],
+    "num_agents": [30],
+    "seed": [1, 2],
+    "seek": [1.0, 3.1224, 10.0],
+    "avoid": [1.0, 2.0973, 10.0],
+    "separate": [0.5, 5.0],
+    "align": [0.1, 3.0],
+    "cohere": [0.1, 1.65599, 3.0],
+    "vision_radius": [40.0, 80.0],
+}
+
+GRIDS = {"aco": ACO_GRID, "pso": PSO_GRID, "boids": BOIDS_GRID}
+
+# Options of the simulation that can be swept too (see the "simulation" section of the config file)
+SIMULATION_OPTIONS = ("dt", "neighbor_search", "verlet_skin", "time_stepping", "max_time_step", "cfl", "backend",
+                      "termination_window", "termination_displacement")
+
+########################## END PARAMETER SETTINGS ##########################
+
+def expand_grid(algorithm, grid):
+    '''All the combinations of the values of `grid` (a dict of lists), as tasks'''
+    keys = list(grid.keys())
+    return [dict(zip(keys, values), algorithm=algorithm) for values in itertools.product(*(grid[k] for k in keys))]
+
+def estimated_cost(task):
+    cost = task["num_agents"]
+    if task["algorithm"] == "aco":
+        cost *= task["num_nodes"] * task["num_iterations"]
+    return cost
+
+def make_config(task):
+    config = Config()
+    config.algorithm = task["algorithm"]
+    config.world_type = task["environment_type"]
+    config.world_name = ""
+    config.random_seed = task["seed"]
+    config.num_agents = task["num_agents"]
+    config.dt = 0.01
+    config.visualization = False
+    # gridlocked runs end early instead of using up the whole time limit
+    config.termination_window = 5.0
+
+    if config.algorithm == "aco":
+        nodes = task["num_nodes"]
+        config.num_ants = int(nodes + nodes * task["num_ants"])
+        config.num_iterations = task["num_iterations"] * nodes
+        config.alpha = task["alpha"]
+        config.beta = task["beta"]
+        config.evaporation_rate = task["evaporation_rate"]
+        config.graph_type = task["graph_type"]
+        if config.graph_type == "PRM":
+            config.n = nodes
+            config.k_connectivity = 8
+        else:
+            grid_size = int(np.sqrt(nodes))
+            config.n = grid_size
+            config.m = grid_size
+            config.k_connectivity = 2
+    elif config.algorithm == "pso":
+        config.neighborhood_radius = task.get("neighborhood_radius", 10.0)
+        config.W = task["inertia_weight"]
+        config.C1 = task["cognitive_weight"]
+        config.C2 = task["social_weight"]
+    elif config.algorithm == "boids":
+        config.vision_radius = task["vision_radius"]
+        config.min_separation = task.get("min_separation", 25.0)
+        config.speed_limit = task.get("speed_limit", 1.0)
+        config.force_limit = task.get("force_limit", 0.1)
+        config.weights = {name: task[name] for name in ("seek", "avoid", "separate", "align", "cohere")}
+    else:
+        raise ValueError("Algorithm " + str(config.algorithm) + " not supported by the parameter sweep.")
+
+    for option in SIMULATION_OPTIONS:
+        if option in task:
+            setattr(config, option, task[option])
+    return config
+
+# Initial populations already spawned by this worker process: the tasks sharing
+# the scenario, the number of agents and the seed start from forks of the same one
+_populations = dict()
+
+def initial_environment(task, config):
+    key = (task["environment_type"], task["num_agents"], task["seed"], task["algorithm"])
+    if key not in _populations:
+        env = get_scenario_by_name(task["environment_type"], agents=[task["num_agents"], task["algorithm"]], config=config)
+        if env is None:
+            raise ValueError("Scenario " + str(task["environment_type"]) + " not recognized.")
+        _populations[key] = env
+    return _populations[key].fork()
+
+def run_task(task):
+    '''
+    Run the simulation of one task, in a worker process. The random streams of the
+    environment are seeded by the task, so every task gives the same result
+    regardless of the worker and of the order of execution.
+
+    :return: the task, its results (or None) and the error message (or None)
+    '''
+    from main import run_simulation
+
+    try:
+        config = make_config(task)
+        env = initial_environment(task, config)
+        simulation_time, agents_remaining, statistics = run_simulation(env, config)
+        results = {
+            "simulation_time": simulation_time,
+            "agents_escaped": task["num_agents"] - agents_remaining,
+            "steps": statistics["steps"],
+            "termination": statistics["termination"],
+            "run_time": statistics["setup_time"] + statistics["run_time"],
+        }
+        return task, results, None
+    except Exception as e:
+        return task, None, repr(e)
+
+def run_sweep(tasks, output, workers=None):
+    '''
+    Run all the `tasks` over a pool of `workers` processes (by default one per CPU),
+    writing one line of `output` (csv) per simulation as soon as it ends.
+
+    :return: the list of (task, results) of the successful simulations
+    '''
+    if len(tasks) == 0:
+        print("No simulations to run: the parameter grid is empty.")
+        return []
+    workers = workers or os.cpu_count() or 1
+    # longest simulations first, so that the shortest ones fill the gaps at the end
+    tasks = sorted(tasks, key=estimated_cost, reverse=True)
+    keys = [k for k in tasks[0].keys() if k != "algorithm"]
+    fields = keys + ["simulation_time", "agents_escaped", "steps", "termination", "run_time"]
+
+    print("Running " + str(len(tasks)) + " simulations on " + str(workers) + " processes.")
+    collected = []
+    failed = 0
+    start = time.time()
+    with open(output, "w", newline="") as f, multiprocessing.Pool(workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+
+        # chunksize=1: every worker takes a new simulation only when it is free
+        for done, (task, results, error) in enumerate(pool.imap_unordered(run_task, tasks, chunksize=1), 1):
+            if error is not None:
+                failed += 1
+                print("Simulation " + str(task) + " failed: " + error)
+            else:
+                writer.writerow({**task, **results})
+                f.flush()
+                collected.append((task, results))
+
+            elapsed = time.time() - start
+            eta = elapsed / done * (len(tasks) - done)
+            print(f"[{done}/{len(tasks)}] elapsed {elapsed:.0f} s, remaining ~{eta:.0f} s, failed {failed}")
+
+    return collected
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep of the evacuation algorithms.")
+    parser.add_argument("algorithm", choices=list(GRIDS.keys()))
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: one per CPU)")
+    parser.add_argument("--output", default=None, help="csv file of the results (default: <algorithm>_sweep.csv)")
+    args = parser.parse_args()
+
+    tasks = expand_grid(args.algorithm, GRIDS[args.algorithm])
+    run_sweep(tasks, args.output or args.algorithm + "_sweep.csv", args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.pso_neighborhood
+# python -m tests.pso_neighborhood --world slalom --agents 90 --steps 300 --radius 2.0
+#
+# Checks that the local best of the PSO agents, whose neighbors come from the
+# spatial hash of the environment, is the one of the whole snapshot of the step
+# filtered on the current positions, as the agents move during the step.
+
+import argparse
+import numpy as np
+
+from parser.config import Config
+from environments.scenarios import get_scenario_by_name
+from pso_algorithm.psoAgent import LocalPSOAgent
+
+SEED = 1
+
+def make_config(world, agents, radius, time_stepping):
+    config = Config()
+    config.algorithm = "pso"
+    config.world_type = world
+    config.world_name = ""
+    config.random_seed = SEED
+    config.num_agents = agents
+    config.dt = 0.01
+    config.visualization = False
+    config.neighborhood_radius = radius
+    config.W = 0.6
+    config.C1 = 1.2
+    config.C2 = 1.8
+    config.time_stepping = time_stepping
+    return config
+
+def snapshot_lbest(agent, agents_snapshot):
+    '''Local best scanning the whole snapshot of the step, on the current positions'''
+    neighbors = []
+    for other in agents_snapshot:
+        if other.id == agent.id:
+            continue
+        if np.linalg.norm(agent.pos - other.pos) <= agent.neighborhood_radius:
+            if agent.is_visible(other.pos, agent.env.get_walls()):
+                neighbors.append(other)
+    if not neighbors:
+        return agent.pos.copy()
+    best_neighbor = min(neighbors, key=lambda a: getattr(a, 'pbest_time', float('inf')))
+    return best_neighbor.pbest_position.copy()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local best of the PSO agents from the spatial hash.")
+    parser.add_argument("--world", default="two_doors")
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--radius", type=float, default=3.0)
+    args = parser.parse_args()
+
+    from main import create_simulator
+
+    compute_lbest = LocalPSOAgent._compute_lbest
+    checked = [0]
+    def checked_lbest(agent, agents_snapshot, margin=0.0):
+        lbest = compute_lbest(agent, agents_snapshot, margin)
+        expected = snapshot_lbest(agent, agents_snapshot)
+        assert np.array_equal(lbest, expected), "Agent " + str(agent.id) + ": local best " + str(lbest) + " instead of " + str(expected)
+        checked[0] += 1
+        return lbest
+    LocalPSOAgent._compute_lbest = checked_lbest
+
+    try:
+        for time_stepping in ("fixed", "adaptive"):
+            config = make_config(args.world, args.agents, args.radius, time_stepping)
+            env = get_scenario_by_name(args.world, agents=[args.agents, "pso"], config=config)
+            sim = create_simulator(env, config)
+            for _ in range(args.steps):
+                if len(env.agents) == 0:
+                    break
+                sim.update(config.dt)
+            print(f"{time_stepping} time step: {checked[0]} local bests checked, ok")
+    finally:
+        LocalPSOAgent._compute_lbest = compute_lbest
+
+    print("The local bests from the spatial hash are the ones of the whole snapshot.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# this file can be runned from the project-root folder with:
+# python -m tests.sweep_populations
+# python -m tests.sweep_populations --steps 20
+#
+# Checks that the tasks of a parameter sweep sharing an initial population (same
+# scenario, number of agents, seed and algorithm, see tests/parameter_sweep.py)
+# run with their own parameters, not with those of the task that spawned it.
+
+import argparse
+
+from tests.parameter_sweep import BOIDS_GRID, expand_grid, make_config, initial_environment, _populations
+
+BOIDS_PARAMETERS = ("seek", "avoid", "separate", "align", "cohere", "vision_radius")
+
+def boids_tasks():
+    '''Two boids tasks of the same population, with different weights and vision'''
+    grid = {name: values[:1] for name, values in BOIDS_GRID.items()}
+    first = expand_grid("boids", grid)[0]
+    second = dict(first)
+    for name in BOIDS_PARAMETERS:
+        second[name] = BOIDS_GRID[name][-1]
+    return [first, second]
+
+def check_agents(agents, config):
+    for agent in agents:
+        assert agent.weights == config.weights, "Agent " + str(agent.id) + ": weights " + str(agent.weights) + " instead of " + str(config.weights)
+        assert agent.vision_radius == config.vision_radius, "Agent " + str(agent.id) + ": vision radius " + str(agent.vision_radius) + " instead of " + str(config.vision_radius)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameters of the tasks sharing a population in a parameter sweep.")
+    parser.add_argument("--steps", type=int, default=5)
+    args = parser.parse_args()
+
+    from main import run_simulation
+
+    _populations.clear()
+    for task in boids_tasks():
+        config = make_config(task)
+        env = initial_environment(task, config)
+        run_simulation(env, config, max_steps=args.steps, callback=lambda sim, step: check_agents(sim.world.agents, config))
+        check_agents(env.agents, config)
+        print("boids task " + str({name: task[name] for name in BOIDS_PARAMETERS}) + ": ok")
+
+    assert len(_populations) == 1, "The tasks did not share their initial population."
+    print("The tasks sharing a population run with their own parameters.")
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from raylib import ffi
 from environments.environment import Environment
 from parser.config import Config
 import math
+import time
 import numpy as np
 
 class Visualizer:
@@ -52,6 +53,8 @@ class Visualizer:
         self.show_fitness_map = True
         self.btn_showFitnessMap_pos = None
         
+        self.replaying = False
+        
         assert isinstance(environment, Environment)
         self.define_environment(environment)
         
@@ -106,7 +109,7 @@ class Visualizer:
         if self.hasGraph and self.show_pheromone_track:
             self.draw_acoPheromone_heatmap()
             
-        if self.algorithm == "pso" and self.show_fitness_map:
+        if self.algorithm == "pso" and self.show_fitness_map and not self.replaying:
             self.draw_fitness_map()
             
         self.draw_agents()
@@ -140,6 +143,36 @@ class Visualizer:
         
         end_drawing()
         
+    def replay(self, reader, speed=1.0):
+        '''
+        Play back the trajectories of a TrajectoryReader (see environments.recorder)
+        at `speed` times the real time, at the frame rate of the window, until the
+        window is closed. The play/pause button stops the clock of the replay.
+        '''
+        environment = reader.environment()
+        self.define_environment(environment)
+        self.algorithm = environment.algorithm
+        self.replaying = True
+        self.on = True
+        
+        frame = 0
+        clock = reader.time(0)
+        last = time.perf_counter()
+        while self.window_is_open():
+            now = time.perf_counter()
+            if self.play:
+                clock += (now - last) * speed
+                current = frame
+                while frame + 1 < len(reader) and reader.time(frame + 1) <= clock:
+                    frame += 1
+                if frame != current:
+                    reader.load_frame(environment, frame)
+                if frame + 1 == len(reader):
+                    self.play = False
+            last = now
+            self.create_drawing()
+        self.close()
+        
     def define_environment(self, environment):
         self.environment = environment
         
@@ -394,6 +427,10 @@ class Visualizer:
         draw_text("Algorithm:", desc_x, desc_y, 20, self.text_color)
         draw_text(f"{self.algorithm.upper()}", desc_x + 120, desc_y, 20, YELLOW)
         
+        if self.replaying:
+            draw_text("> Replay of a recorded run", desc_x, desc_y + 40, 20, self.text_color)
+            return
+        
         if self.algorithm == "aco":
             draw_text(f"> Ants used: {self.config.num_ants}", desc_x, desc_y + 40, 20, self.text_color)
             draw_text(f"> Iterations: {self.config.num_iterations}", desc_x, desc_y + 70, 20, self.text_color)
@@ -422,6 +459,10 @@ class Visualizer:
         screen_y = int(starting_pos[1] + env_position[1] * self.scale_env)
         return (screen_x, screen_y)
     
+    def set_frame_rate(self, fps):
+        '''Limit the drawing to `fps` frames per second (end_drawing waits), 0 for no limit'''
+        set_target_fps(int(fps))
+        
     def window_is_open(self):
         return not window_should_close()
 
@@ -601,18 +642,17 @@ class Visualizer:
             return
         
         # let's cut out the lower pheromone levels to improve visualization
-        max_pheromone = max(self.aco_env.pheromone.values())
-        min_pheromone = min(self.aco_env.pheromone.values())
+        pheromone = self.aco_env.pheromone
+        max_pheromone = pheromone.max()
+        min_pheromone = pheromone.min()
         pheromone_range = max_pheromone - min_pheromone if max_pheromone != min_pheromone else 1.0
-                
-        for edge_key, pheromone_level in self.aco_env.pheromone.items():
-            
-            if pheromone_level <= 1.0:
-                continue
+        
+        # node pairs of the edges, from the edge index of the graph
+        strong = pheromone > 1.0
+        for (node1_id, node2_id), pheromone_level in zip(self.aco_env.edges[strong].tolist(), pheromone[strong].tolist()):
             
-            node_ids = list(edge_key)
-            node1 = self.nodes[node_ids[0]]
-            node2 = self.nodes[node_ids[1]]
+            node1 = self.nodes[node1_id]
+            node2 = self.nodes[node2_id]
             node1_screen = self.env_to_screen(node1.pos)
             node2_screen = self.env_to_screen(node2.pos)
             